@@ -1,5 +1,8 @@
 from meds._version import __version__  # noqa
 
+from .arrow_cache import build_arrow_cache
+from .dataset import MEDSDataset
+from .index import build_subject_index, subject_index_filepath
 from .schema import (
     CodeMetadata,
     DatasetMetadata,
@@ -23,6 +26,7 @@ from .schema import (
     parent_codes_dtype,
     parent_codes_field,
     prediction_time_field,
+    split_field,
     subject_id_dtype,
     subject_id_field,
     subject_split_schema,
@@ -32,6 +36,7 @@ from .schema import (
     train_split,
     tuning_split,
 )
+from .validate import MEDSValidationError, validate_dataset
 
 # List all objects that we want to export
 _exported_objects = {
@@ -51,6 +56,7 @@ _exported_objects = {
     "tuning_split": tuning_split,
     "held_out_split": held_out_split,
     "subject_split_schema": subject_split_schema,
+    "split_field": split_field,
     "code_metadata_schema": code_metadata_schema,
     "dataset_metadata_schema": dataset_metadata_schema,
     "CodeMetadata": CodeMetadata,
@@ -65,6 +71,12 @@ _exported_objects = {
     "time_field": time_field,
     "code_field": code_field,
     "subject_id_dtype": subject_id_dtype,
+    "MEDSValidationError": MEDSValidationError,
+    "validate_dataset": validate_dataset,
+    "MEDSDataset": MEDSDataset,
+    "build_arrow_cache": build_arrow_cache,
+    "build_subject_index": build_subject_index,
+    "subject_index_filepath": subject_index_filepath,
 }
 
 __all__ = list(_exported_objects.keys())
@@ -0,0 +1,167 @@
+"""Internal helpers shared by the MEDS processing modules."""
+
+import glob
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .schema import data_subdirectory
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def data_shards(root: str) -> List[str]:
+    """Returns the sorted paths of all data shards (`$MEDS_ROOT/data/**/*.parquet`) of a MEDS dataset."""
+    return sorted(glob.glob(os.path.join(root, data_subdirectory, "**", "*.parquet"), recursive=True))
+
+
+def copy_files(root: str, output_root: str, filepaths: Iterable[str]) -> None:
+    """Copies the files at the given paths relative to `root`, if they exist, to the same paths under `output_root`."""
+    for filepath in filepaths:
+        if os.path.exists(os.path.join(root, filepath)):
+            os.makedirs(os.path.dirname(os.path.join(output_root, filepath)), exist_ok=True)
+            shutil.copy2(os.path.join(root, filepath), os.path.join(output_root, filepath))
+
+
+def map_shards(fn: Callable[[T], R], items: Iterable[T], workers: int = 1) -> Iterator[R]:
+    """Lazily maps `fn` over `items`, in order, using a process pool if `workers > 1`.
+
+    `fn` must be a picklable, module-level function when `workers > 1`.
+    """
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(fn, items)
+
+
+def column_index(metadata: pq.FileMetaData, column: str) -> int:
+    """Returns the index of the leaf column `column` in the row groups of a parquet file."""
+    for i in range(metadata.num_columns):
+        if metadata.schema.column(i).path == column:
+            return i
+    raise KeyError(f"Column '{column}' not found in parquet file")
+
+
+def row_group_statistics(metadata: pq.FileMetaData, column: str) -> List[Optional[Tuple[Any, Any, int]]]:
+    """Returns the `(min, max, null_count)` footer statistics of `column` for every row group of a parquet file.
+
+    The entry for a row group is `None` if it has no statistics for the column; `min` and `max` are `None` if the
+    column chunk is entirely null.
+    """
+    idx = column_index(metadata, column)
+    out: List[Optional[Tuple[Any, Any, int]]] = []
+    for i in range(metadata.num_row_groups):
+        stats = metadata.row_group(i).column(idx).statistics
+        if stats is None or not stats.has_null_count:
+            out.append(None)
+        elif stats.has_min_max:
+            out.append((stats.min, stats.max, stats.null_count))
+        elif stats.null_count == metadata.row_group(i).num_rows:
+            out.append((None, None, stats.null_count))
+        else:
+            out.append(None)
+    return out
+
+
+# Null times are static events, which precede every timed event of a subject.
+NULL_TIME = np.iinfo(np.int64).min
+
+
+def times_as_int64(times: Union[pa.Array, pa.ChunkedArray]) -> np.ndarray:
+    """Returns microsecond timestamps as int64, with null (static) times mapped to `NULL_TIME`."""
+    return pc.fill_null(times.cast(pa.int64()), NULL_TIME).to_numpy()
+
+
+def run_bounds(values: np.ndarray) -> np.ndarray:
+    """Returns the start offsets of each run of equal values, followed by the array length."""
+    if len(values) == 0:
+        return np.zeros(1, dtype=np.int64)
+    starts = np.flatnonzero(values[1:] != values[:-1]) + 1
+    return np.concatenate([[0], starts, [len(values)]]).astype(np.int64)
+
+
+def grouped_searchsorted(
+    groups: np.ndarray, values: np.ndarray, query_groups: np.ndarray, query_values: np.ndarray, side: str = "left"
+) -> np.ndarray:
+    """Vectorized `np.searchsorted` within groups.
+
+    `groups` and `values` must be sorted lexicographically by `(group, value)`, as the `(subject, time)` rows of a
+    MEDS data shard are once subjects are numbered in order of appearance. For each query, returns the global
+    index at which `(query_group, query_value)` would be inserted to maintain that order; with `side="right"`,
+    after any equal entries.
+    """
+    n, m = len(groups), len(query_groups)
+    if m == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Queries are merged with the data by a single lexsort; ties are broken by placing queries before (left) or
+    # after (right) equal data entries. A query's position in the merged order, minus the number of queries
+    # before it, is then the number of data entries before it.
+    query_first = side == "left"
+    tie_breaker = np.concatenate([np.full(n, query_first), np.full(m, not query_first)])
+    order = np.lexsort(
+        (
+            tie_breaker,
+            np.concatenate([values, query_values]),
+            np.concatenate([groups, query_groups]),
+        )
+    )
+    positions = np.flatnonzero(order >= n)
+    out = np.empty(m, dtype=np.int64)
+    out[order[positions] - n] = positions - np.arange(m)
+    return out
+
+
+class ShardWriter:
+    """Writes a parquet shard from a stream of tables, buffering rows into row groups of `row_group_size` rows.
+
+    The shard is written to a temporary file that replaces `path` only once the writer is closed successfully.
+    """
+
+    def __init__(self, path: str, schema: pa.Schema, row_group_size: int = 1024 * 1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.num_rows = 0
+        self._tmp_path = f"{path}.tmp"
+        self._writer = pq.ParquetWriter(self._tmp_path, schema)
+        self._buffer: List[pa.Table] = []
+        self._num_buffered = 0
+
+    def write(self, table: pa.Table) -> None:
+        if table.num_rows == 0:
+            return
+        self._buffer.append(table.select(self.schema.names).cast(self.schema))
+        self._num_buffered += table.num_rows
+        self.num_rows += table.num_rows
+        if self._num_buffered >= self.row_group_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self._writer.write_table(pa.concat_tables(self._buffer), row_group_size=self.row_group_size)
+        self._buffer, self._num_buffered = [], 0
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._writer.close()
+            os.remove(self._tmp_path)
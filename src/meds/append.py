@@ -0,0 +1,215 @@
+"""Incremental appends of new events to an existing MEDS dataset.
+
+A subject must be in one and only one data shard, with its events contiguous and sorted by time, so new events
+cannot simply be written to a new shard. `append_events` instead routes each new event to the shard that already
+holds its subject (using the subject index if it exists) and rewrites only those shards. Within a rewritten
+shard, row groups that hold none of the updated subjects are copied over unchanged, with their original row group
+boundaries; only the runs of row groups holding updated subjects are decoded, merged with the new events and
+re-sorted.
+
+Events of subjects that are not yet in the dataset are written to a new shard.
+"""
+
+import datetime
+import json
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ._utils import map_shards, run_bounds, times_as_int64
+from .arrow_cache import arrow_cache_path
+from .index import index_shard, lookup_shards, row_group_field, shard_field, subject_index_filepath, subject_shards
+from .schema import data_subdirectory, dataset_metadata_filepath, subject_id_field, time_field
+
+
+def _merge(existing: pa.Table, new: pa.Table) -> pa.Table:
+    """Merges new events into a block of existing, sorted events, keeping existing subjects in their on-disk order
+    and putting new subjects after them, in subject ID order. Ties keep existing events first."""
+    existing_ids = existing.column(subject_id_field).to_numpy()
+    subject_order = np.concatenate(
+        [
+            existing_ids[run_bounds(existing_ids)[:-1]],
+            np.setdiff1d(new.column(subject_id_field).to_numpy(), existing_ids),
+        ]
+    )
+    sorter = np.argsort(subject_order, kind="stable")
+
+    table = pa.concat_tables([existing, new])
+    subject_ids = table.column(subject_id_field).to_numpy()
+    rank = sorter[np.searchsorted(subject_order, subject_ids, sorter=sorter)]
+    return table.take(pa.array(np.lexsort((times_as_int64(table.column(time_field)), rank))))
+
+
+def merge_shard(path: str, new_events: pa.Table, out_path: str, row_group_size: int = 1024 * 1024) -> None:
+    """Writes the merge of a data shard and new events of its subjects to `out_path`.
+
+    Row groups without any of the new events' subjects are copied over as they are. Each maximal run of
+    consecutive row groups that hold such subjects is merged with their new events, re-sorted and written in row
+    groups of `row_group_size` rows. If `path` does not exist, the new events are sorted into a new shard.
+
+    Raises:
+        ValueError: If any of the new events' subjects is not in the shard, e.g., because the subject index used to
+            route them is stale.
+    """
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    if not os.path.exists(path):
+        new_events = _merge(new_events.schema.empty_table(), new_events)
+        pq.write_table(new_events, out_path, row_group_size=row_group_size)
+        return
+
+    pf = pq.ParquetFile(path)
+    schema = pf.schema_arrow
+    new_events = new_events.select(schema.names).cast(schema)
+    updated = pa.array(np.unique(new_events.column(subject_id_field).to_numpy()))
+
+    affected = []
+    found = []
+    for rg in range(pf.num_row_groups):
+        subject_ids = pf.read_row_group(rg, columns=[subject_id_field]).column(0)
+        is_updated = pc.is_in(subject_ids, value_set=updated)
+        affected.append(pc.any(is_updated).as_py() is True)
+        found.append(pc.filter(subject_ids, is_updated).to_numpy())
+
+    missing = np.setdiff1d(updated.to_numpy(), np.concatenate(found) if found else [])
+    if len(missing):
+        raise ValueError(f"{path}: subjects {missing.tolist()} are not in the shard; the subject index may be stale")
+
+    # A subject's events span consecutive row groups, all of which are affected if the subject is updated.
+    bounds = run_bounds(np.array(affected))
+    n_rows = 0
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if not affected[start]:
+                for rg in range(start, end):
+                    table = pf.read_row_group(rg)
+                    writer.write_table(table, row_group_size=max(table.num_rows, 1))
+                    n_rows += table.num_rows
+                continue
+            block = pf.read_row_groups(list(range(start, end)))
+            in_block = pc.is_in(new_events.column(subject_id_field), value_set=block.column(subject_id_field))
+            merged = _merge(block, new_events.filter(in_block))
+            writer.write_table(merged, row_group_size=row_group_size)
+            n_rows += merged.num_rows
+
+    expected_rows = pf.metadata.num_rows + new_events.num_rows
+    if n_rows != expected_rows:
+        raise ValueError(f"{path}: merged shard has {n_rows} rows, expected {expected_rows}")
+
+
+def _merge_shard(args) -> None:
+    merge_shard(*args)
+
+
+def _new_shard_path(root: str) -> str:
+    i = 0
+    while os.path.exists(os.path.join(root, data_subdirectory, f"{i}.parquet")):
+        i += 1
+    return os.path.join(root, data_subdirectory, f"{i}.parquet")
+
+
+# The key of `metadata/dataset.json` recording when events were last appended. `created_at` is left as it is, as
+# it records when the dataset itself was created.
+updated_at_field = "updated_at"
+
+
+def _replace_json(path: str, content: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(content, f)
+    os.replace(tmp_path, path)
+
+
+def _update_subject_index(root: str, shards: Sequence[str]) -> None:
+    index_path = os.path.join(root, subject_index_filepath)
+    names = pa.array([os.path.relpath(path, root).replace(os.sep, "/") for path in shards], pa.string())
+    index = pq.read_table(index_path)
+    index = index.filter(pc.invert(pc.is_in(index.column(shard_field), value_set=names)))
+    index = pa.concat_tables([index] + [index_shard(path, root) for path in shards])
+    index = index.sort_by([(subject_id_field, "ascending"), (shard_field, "ascending"), (row_group_field, "ascending")])
+
+    tmp_path = f"{index_path}.tmp"
+    pq.write_table(index, tmp_path)
+    os.replace(tmp_path, index_path)
+
+
+def append_events(
+    root: str,
+    events: pa.Table,
+    new_shard: Optional[str] = None,
+    row_group_size: int = 1024 * 1024,
+    workers: int = 1,
+) -> List[str]:
+    """Appends new events to the dataset at `root` in place, rewriting only the data shards they belong to.
+
+    Each shard is first written to a temporary file, and all shards are only replaced once every one of them has
+    been written. The subject index, if any, is then updated for the rewritten shards, any Arrow cache of those
+    shards is removed, and the time of the append is recorded as `updated_at` in `metadata/dataset.json`; each
+    file is replaced atomically.
+
+    Args:
+        root: The root of the MEDS dataset.
+        events: The new events, with the columns of the dataset's data shards, in any order.
+        new_shard: The path of the shard, relative to `root`, to which events of subjects that are not yet in the
+            dataset are written. Defaults to the first free `data/{i}.parquet`. Such subjects are not assigned
+            a split.
+        row_group_size: The row group size of the rewritten parts of the shards.
+        workers: The number of shards rewritten in parallel.
+
+    Returns:
+        The paths of the shards that were rewritten or created.
+    """
+    if events.column(subject_id_field).null_count:
+        raise ValueError(f"'{subject_id_field}' contains nulls")
+
+    subject_ids, shard_indices, shards = subject_shards(root, workers)
+    event_shards = lookup_shards(subject_ids, shard_indices, events.column(subject_id_field).to_numpy())
+
+    if (event_shards == -1).any():
+        new_path = _new_shard_path(root) if new_shard is None else os.path.join(root, new_shard)
+        if os.path.exists(new_path):
+            raise ValueError(f"New shard {new_path} already exists")
+        if shards:
+            schema = pq.read_schema(shards[0])
+            events = events.select(schema.names).cast(schema)
+        event_shards = np.where(event_shards == -1, len(shards), event_shards)
+        shards = shards + [new_path]
+
+    order = np.argsort(event_shards, kind="stable")
+    bounds = run_bounds(event_shards[order])
+    jobs: List[Tuple[str, pa.Table, str, int]] = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if start < end:
+            path = shards[int(event_shards[order[start]])]
+            jobs.append((path, events.take(pa.array(order[start:end])), f"{path}.append.tmp", row_group_size))
+
+    try:
+        list(map_shards(_merge_shard, jobs, workers))
+    except BaseException:
+        for _, _, tmp_path, _ in jobs:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+    for path, _, tmp_path, _ in jobs:
+        os.replace(tmp_path, path)
+        cache_path = arrow_cache_path(root, os.path.relpath(path, root).replace(os.sep, "/"))
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    updated = [path for path, _, _, _ in jobs]
+    if os.path.exists(os.path.join(root, subject_index_filepath)):
+        _update_subject_index(root, updated)
+
+    metadata_path = os.path.join(root, dataset_metadata_filepath)
+    metadata = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+    metadata[updated_at_field] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    os.makedirs(os.path.dirname(metadata_path), exist_ok=True)
+    _replace_json(metadata_path, metadata)
+
+    return updated
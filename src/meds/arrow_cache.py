@@ -0,0 +1,62 @@
+"""An uncompressed Arrow IPC cache of the data shards of a MEDS dataset, for memory-mapped reads.
+
+Parquet data must be decompressed and decoded into fresh buffers on every read. The cache converts each data
+shard, once, into an uncompressed Arrow IPC file, with one record batch per parquet row group so that the
+locations recorded in the subject index apply to both. Cache files can then be memory-mapped, and any slice of
+them is a zero-copy view onto the operating system's page cache, shared by every process reading it.
+"""
+
+import os
+from typing import List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ._utils import data_shards, map_shards
+from .schema import data_schema, data_subdirectory
+
+arrow_cache_subdirectory = os.path.join("cache", "arrow")
+
+
+def arrow_cache_path(root: str, shard: str) -> str:
+    """Returns the path of the cache file for `shard`, given as a path relative to `root` using "/"."""
+    relative = os.path.relpath(os.path.join(root, *shard.split("/")), os.path.join(root, data_subdirectory))
+    return os.path.join(root, arrow_cache_subdirectory, os.path.splitext(relative)[0] + ".arrow")
+
+
+def _cache_schema(schema: pa.Schema) -> pa.Schema:
+    """Orders the columns of a shard as in `data_schema()`, followed by any custom properties."""
+    mandatory = data_schema()
+    return pa.schema(list(mandatory) + [field for field in schema if field.name not in mandatory.names])
+
+
+def convert_shard(path: str, out_path: str) -> None:
+    """Converts a single parquet data shard into an uncompressed Arrow IPC file, one row group at a time."""
+    pf = pq.ParquetFile(path)
+    schema = _cache_schema(pf.schema_arrow)
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.tmp"
+    with pa.ipc.new_file(tmp_path, schema) as writer:
+        for rg in range(pf.num_row_groups):
+            table = pf.read_row_group(rg).select(schema.names).cast(schema)
+            writer.write_batch(pa.record_batch([col.combine_chunks() for col in table.columns], schema=schema))
+    os.replace(tmp_path, out_path)
+
+
+def _convert_shard(args) -> None:
+    convert_shard(*args)
+
+
+def build_arrow_cache(root: str, workers: int = 1) -> List[str]:
+    """Converts every data shard of the dataset at `root` into the Arrow IPC cache.
+
+    Returns:
+        The paths of the cache files written.
+    """
+    jobs = []
+    for path in data_shards(root):
+        shard = os.path.relpath(path, root).replace(os.sep, "/")
+        jobs.append((path, arrow_cache_path(root, shard)))
+    list(map_shards(_convert_shard, jobs, workers))
+    return [out_path for _, out_path in jobs]
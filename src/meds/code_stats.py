@@ -0,0 +1,160 @@
+"""Per-code frequency and `numeric_value` statistics, stored as custom properties of the code metadata.
+
+Statistics are computed per data shard and then merged. Every statistic is a count, a sum, a minimum or a
+maximum, so partial statistics of disjoint sets of events merge exactly, in any order. Subject counts merge
+exactly too, since a subject's events are all in one shard.
+
+The mean and variance of a code's values follow from the moments: `mean = sum / n` and
+`variance = sum_sqd / n - mean ** 2`.
+"""
+
+import os
+from typing import Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ._utils import data_shards, map_shards
+from .schema import code_field, code_metadata_filepath, code_metadata_schema, numeric_value_field, subject_id_field
+
+n_occurrences_field = "code/n_occurrences"
+n_subjects_field = "code/n_subjects"
+values_n_occurrences_field = "values/n_occurrences"
+values_sum_field = "values/sum"
+values_sum_sqd_field = "values/sum_sqd"
+values_min_field = "values/min"
+values_max_field = "values/max"
+
+# The statistics, in the form of `custom_per_code_properties` of `code_metadata_schema`.
+code_stats_properties = [
+    # The number of events with this code, and of distinct subjects having any.
+    (n_occurrences_field, pa.int64()),
+    (n_subjects_field, pa.int64()),
+    # The number of those events with a non-null, non-NaN `numeric_value`, and the moments and range of those values.
+    (values_n_occurrences_field, pa.int64()),
+    (values_sum_field, pa.float64()),
+    (values_sum_sqd_field, pa.float64()),
+    (values_min_field, pa.float64()),
+    (values_max_field, pa.float64()),
+]
+
+code_stats_schema = pa.schema([(code_field, pa.string())] + code_stats_properties)
+
+_sum_fields = [
+    n_occurrences_field,
+    n_subjects_field,
+    values_n_occurrences_field,
+    values_sum_field,
+    values_sum_sqd_field,
+]
+
+
+def shard_code_stats(path: str) -> pa.Table:
+    """Computes the code statistics of a single data shard, reading only its `code`, `subject_id` and
+    `numeric_value` columns."""
+    table = pq.read_table(path, columns=[code_field, subject_id_field, numeric_value_field])
+    values = table.column(numeric_value_field).cast(pa.float64())
+    values = pc.if_else(pc.is_nan(values), pa.scalar(None, pa.float64()), values)
+    table = pa.table(
+        {
+            code_field: table.column(code_field).cast(pa.string()),
+            subject_id_field: table.column(subject_id_field),
+            "value": values,
+            "value_sqd": pc.multiply(values, values),
+        }
+    )
+    stats = table.group_by(code_field).aggregate(
+        [
+            (subject_id_field, "count", pc.CountOptions(mode="all")),
+            (subject_id_field, "count_distinct"),
+            ("value", "count"),
+            ("value", "sum"),
+            ("value_sqd", "sum"),
+            ("value", "min"),
+            ("value", "max"),
+        ]
+    )
+    columns = [stats.column(f"{subject_id_field}_count"), stats.column(f"{subject_id_field}_count_distinct")]
+    columns += [stats.column(c) for c in ["value_count", "value_sum", "value_sqd_sum", "value_min", "value_max"]]
+    return _finalize(pa.Table.from_arrays([stats.column(code_field)] + columns, schema=code_stats_schema))
+
+
+def _finalize(stats: pa.Table) -> pa.Table:
+    # Sums over no values are null, rather than zero, in Arrow.
+    for name in _sum_fields:
+        idx = stats.schema.get_field_index(name)
+        stats = stats.set_column(idx, name, pc.fill_null(stats.column(idx), 0).cast(stats.schema.field(idx).type))
+    stats = stats.filter(pc.is_valid(stats.column(code_field)))
+    return stats.sort_by(code_field)
+
+
+def merge_code_stats(partials: Iterable[pa.Table]) -> pa.Table:
+    """Merges partial code statistics (e.g., of different shards) into the statistics of all their events."""
+    table = pa.concat_tables([code_stats_schema.empty_table(), *partials])
+    aggregations = [(name, "sum") for name in _sum_fields] + [(values_min_field, "min"), (values_max_field, "max")]
+    merged = table.group_by(code_field).aggregate(aggregations)
+    columns = [merged.column(f"{name}_{agg}") for name, agg in aggregations]
+    return _finalize(pa.Table.from_arrays([merged.column(code_field)] + columns, schema=code_stats_schema))
+
+
+def compute_code_stats(root: str, workers: int = 1, merge_every: int = 64) -> pa.Table:
+    """Computes the code statistics of the dataset at `root`, with shards processed over `workers` processes.
+
+    Partial statistics are merged as they arrive, every `merge_every` shards, so that memory use does not grow
+    with the number of shards.
+    """
+    stats = code_stats_schema.empty_table()
+    pending = []
+    for partial in map_shards(shard_code_stats, data_shards(root), workers):
+        pending.append(partial)
+        if len(pending) >= merge_every:
+            stats = merge_code_stats([stats] + pending)
+            pending = []
+    return merge_code_stats([stats] + pending)
+
+
+def write_code_stats(root: str, stats: Optional[pa.Table] = None, workers: int = 1) -> pa.Table:
+    """Adds code statistics (by default, `compute_code_stats(root)`) to `metadata/codes.parquet` in place.
+
+    The statistics become custom properties of every code metadata row, replacing any previous statistics. Codes
+    that occur in the data but not in the code metadata get rows of their own, with null descriptions and
+    parents; codes that do not occur get zero counts and null value ranges.
+
+    Returns:
+        The updated code metadata.
+    """
+    if stats is None:
+        stats = compute_code_stats(root, workers)
+    stat_names = [name for name, _ in code_stats_properties]
+
+    path = os.path.join(root, code_metadata_filepath)
+    if os.path.exists(path):
+        codes = pq.read_table(path)
+        codes = codes.drop([name for name in stat_names if name in codes.column_names])
+    else:
+        codes = code_metadata_schema().empty_table()
+    base = code_metadata_schema()
+    custom = [f for f in codes.schema if f.name not in base.names]
+    schema = code_metadata_schema(custom + [pa.field(name, dtype) for name, dtype in code_stats_properties])
+
+    missing = pc.filter(
+        stats.column(code_field), pc.invert(pc.is_in(stats.column(code_field), codes.column(code_field)))
+    )
+    missing_rows = {f.name: pa.nulls(len(missing), f.type) for f in codes.schema}
+    missing_rows[code_field] = missing.cast(codes.schema.field(code_field).type)
+    codes = pa.concat_tables([codes, pa.table(missing_rows, schema=codes.schema)])
+
+    rows = pc.index_in(codes.column(code_field), value_set=stats.column(code_field))
+    for name in stat_names:
+        column = stats.column(name).take(rows)
+        if name in _sum_fields:
+            column = pc.fill_null(column, 0).cast(stats.schema.field(name).type)
+        codes = codes.append_column(name, column)
+    codes = codes.select(schema.names).cast(schema)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(codes, tmp_path)
+    os.replace(tmp_path, path)
+    return codes
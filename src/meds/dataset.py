@@ -0,0 +1,192 @@
+"""Random access to the subjects of a MEDS dataset on disk."""
+
+import datetime
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ._utils import data_shards, run_bounds
+from .arrow_cache import arrow_cache_path
+from .index import (
+    length_field,
+    lookup_shards,
+    row_group_field,
+    row_offset_field,
+    shard_field,
+    static_length_field,
+    subject_index_filepath,
+    subject_shards,
+)
+from .query import read_events
+from .schema import split_field, subject_id_field, subject_splits_filepath
+
+
+class MEDSDataset:
+    """A MEDS dataset rooted at `root`, supporting fast per-subject reads through the subject index.
+
+    The subject index (see `meds.index.build_subject_index`) must have been built before subjects can be read.
+    It is loaded lazily, on first use, into sorted numpy arrays so that each lookup is a binary search.
+
+    If `memory_map` is set, subjects are read from the Arrow IPC cache (see `meds.arrow_cache.build_arrow_cache`)
+    instead of the parquet shards. The cache is memory-mapped, so the returned tables are zero-copy views onto
+    the page cache, shared by every process reading the same dataset. Datasets can be pickled to worker
+    processes; open files are not pickled but reopened on first use.
+    """
+
+    def __init__(self, root: str, memory_map: bool = False):
+        self.root = root
+        self.memory_map = memory_map
+        self._index: Optional[Dict[str, np.ndarray]] = None
+        self._shards: List[str] = []
+        self._files: Dict[int, Union[pq.ParquetFile, pa.ipc.RecordBatchFileReader]] = {}
+        self._split_members: Optional[Dict[str, Dict[str, np.ndarray]]] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_files"] = {}
+        return state
+
+    def _load_index(self) -> Dict[str, np.ndarray]:
+        if self._index is None:
+            path = os.path.join(self.root, subject_index_filepath)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"{path} not found; build it with meds.index.build_subject_index")
+            table = pq.read_table(path)
+            shards = table.column(shard_field).combine_chunks().dictionary_encode()
+            self._shards = shards.dictionary.to_pylist()
+            self._index = {
+                subject_id_field: table.column(subject_id_field).to_numpy(),
+                shard_field: shards.indices.to_numpy(),
+                row_group_field: table.column(row_group_field).to_numpy(),
+                row_offset_field: table.column(row_offset_field).to_numpy(),
+                length_field: table.column(length_field).to_numpy(),
+                static_length_field: table.column(static_length_field).to_numpy(),
+            }
+        return self._index
+
+    @property
+    def subject_ids(self) -> np.ndarray:
+        """The sorted, unique subject IDs of the dataset."""
+        return np.unique(self._load_index()[subject_id_field])
+
+    def _open(self, shard: int) -> Union[pq.ParquetFile, pa.ipc.RecordBatchFileReader]:
+        if shard not in self._files:
+            if self.memory_map:
+                path = arrow_cache_path(self.root, self._shards[shard])
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"{path} not found; build it with meds.arrow_cache.build_arrow_cache")
+                self._files[shard] = pa.ipc.open_file(pa.memory_map(path))
+            else:
+                self._files[shard] = pq.ParquetFile(os.path.join(self.root, *self._shards[shard].split("/")))
+        return self._files[shard]
+
+    def _read_chunk(
+        self, shard: int, row_group: int, offset: int, length: int, columns: Optional[Sequence[str]]
+    ) -> pa.Table:
+        f = self._open(shard)
+        if self.memory_map:
+            table = pa.Table.from_batches([f.get_batch(row_group).slice(offset, length)])
+            return table if columns is None else table.select(columns)
+        return f.read_row_group(row_group, columns=columns).slice(offset, length)
+
+    def _locate(self, subject_id: int) -> slice:
+        subject_ids = self._load_index()[subject_id_field]
+        lo, hi = np.searchsorted(subject_ids, [subject_id, subject_id + 1])
+        if lo == hi:
+            raise KeyError(f"Subject {subject_id} not found in {self.root}")
+        return slice(lo, hi)
+
+    def get_subject(self, subject_id: int, columns: Optional[Sequence[str]] = None) -> pa.Table:
+        """Returns all events of a subject, in order, reading only the row groups that contain them.
+
+        In `memory_map` mode, the columns of the returned table are zero-copy slices of the Arrow IPC cache.
+
+        Raises:
+            KeyError: If the subject is not in the dataset.
+        """
+        index = self._load_index()
+        entries = self._locate(subject_id)
+        tables = [
+            self._read_chunk(shard, rg, offset, length, columns)
+            for shard, rg, offset, length in zip(
+                index[shard_field][entries],
+                index[row_group_field][entries],
+                index[row_offset_field][entries],
+                index[length_field][entries],
+            )
+        ]
+        return pa.concat_tables(tables)
+
+    def get_subject_static_and_dynamic(
+        self, subject_id: int, columns: Optional[Sequence[str]] = None
+    ) -> Tuple[pa.Table, pa.Table]:
+        """Returns a subject's static events (null `time`) and its time-ordered dynamic events, separately.
+
+        Both tables are zero-copy slices of the subject's events, split at the number of static events recorded
+        in the subject index, so the `time` column need not be read or filtered.
+
+        Raises:
+            KeyError: If the subject is not in the dataset.
+        """
+        table = self.get_subject(subject_id, columns)
+        n_static = int(self._load_index()[static_length_field][self._locate(subject_id)].sum())
+        return table.slice(0, n_static), table.slice(n_static)
+
+    def split_members(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """Returns the members of every split, grouped by the data shard that holds them.
+
+        The mapping is computed once, from the subject splits file and the subject index (or, without an index, a
+        scan of the `subject_id` columns), and cached. Split members that are not in the dataset are ignored.
+
+        Returns:
+            For each split, a mapping from the path of each shard holding any of its members to their sorted IDs.
+        """
+        if self._split_members is None:
+            splits = pq.read_table(
+                os.path.join(self.root, subject_splits_filepath), columns=[subject_id_field, split_field]
+            )
+            subject_ids, shard_indices, shards = subject_shards(self.root)
+
+            split_ids = splits.column(subject_id_field).to_numpy()
+            split_values = splits.column(split_field).combine_chunks().dictionary_encode()
+            split_codes = split_values.indices.to_numpy(zero_copy_only=False)
+            member_shards = lookup_shards(subject_ids, shard_indices, split_ids)
+
+            keep = member_shards >= 0
+            split_ids, split_codes, member_shards = split_ids[keep], split_codes[keep], member_shards[keep]
+            order = np.lexsort((split_ids, member_shards, split_codes))
+            split_ids, split_codes, member_shards = split_ids[order], split_codes[order], member_shards[order]
+
+            # Runs of (split, shard) pairs, in order, each holding the sorted IDs of the members in that shard.
+            bounds = np.union1d(run_bounds(split_codes), run_bounds(member_shards))
+            self._split_members = {split: {} for split in split_values.dictionary.to_pylist()}
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                split = split_values.dictionary[split_codes[start]].as_py()
+                self._split_members[split][shards[member_shards[start]]] = np.unique(split_ids[start:end])
+        return self._split_members
+
+    def iter_split(self, split: str, columns: Optional[Sequence[str]] = None) -> Iterator[pa.Table]:
+        """Yields the events of the members of a split, shard by shard.
+
+        Shards holding no member of the split are skipped entirely, and within the others, row groups are pruned
+        using their `subject_id` statistics before the remaining rows are filtered with a vectorized `is_in`.
+        """
+        for shard, members in sorted(self.split_members().get(split, {}).items()):
+            yield from read_events([shard], subject_ids=members, columns=columns)
+
+    def read_events(
+        self,
+        start: Optional[datetime.datetime] = None,
+        end: Optional[datetime.datetime] = None,
+        subject_ids: Optional[Iterable[int]] = None,
+        columns: Optional[Sequence[str]] = None,
+        include_static: bool = False,
+    ) -> Iterator[pa.Table]:
+        """Yields the events in `[start, end)` of the given subjects, skipping row groups using their statistics.
+
+        This does not require the subject index; see `meds.query.read_events` for details.
+        """
+        yield from read_events(data_shards(self.root), start, end, subject_ids, columns, include_static)
@@ -0,0 +1,273 @@
+"""Exports of a dataset to memory-mappable NumPy arrays, for scikit-learn, PyTorch and other ML frameworks.
+
+`export_arrays` writes two layouts of the dataset's events, as `.npy` files that can be opened with
+`np.load(path, mmap_mode="r")` without copying them into memory:
+
+* Ragged event arrays, in `ragged/`: the events of all subjects, in dataset order, flattened into `code_ids` (int32
+  indices into the code vocabulary, or -1 for codes not in it), `times` (int64 microseconds since the epoch, or
+  `NULL_TIME` for static events) and `values` (float32 `numeric_value`, or NaN if null). The events of the `i`-th
+  subject of `subject_ids` are those at `offsets[i]:offsets[i + 1]`.
+* A CSR matrix with one column per vocabulary code, in `csr/` (see `meds.sparse.SparseMatrix` and `load_csr`). Its
+  rows are either the subjects of `ragged/subject_ids.npy`, aggregating their full timelines, or, if a task's labels
+  are given, the labels of `labels.parquet`, aggregating their subject's events up to the prediction time.
+
+The code vocabulary is written alongside, to `code_vocab.parquet`. Shards are exported in parallel, each to its own
+part files, which are then copied one at a time into the final arrays, so memory use is bounded by the size of the
+shards being processed rather than by the size of the dataset.
+"""
+
+import os
+import shutil
+from typing import Dict, List, Literal, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ._utils import data_shards, map_shards, run_bounds, times_as_int64
+from .features import default_aggregations, shard_window_features
+from .labels import shard_label_files
+from .schema import code_field, label_schema, numeric_value_field, subject_id_field, time_field
+from .sparse import SparseMatrix
+from .vocab import code_id_dtype, code_vocab_schema, code_vocabulary, vocabulary_indices
+
+ragged_dirname = "ragged"
+csr_dirname = "csr"
+export_labels_filename = "labels.parquet"
+export_vocab_filename = "code_vocab.parquet"
+
+ragged_dtypes = {
+    "subject_ids": np.int64,
+    "offsets": np.int64,
+    "code_ids": np.int32,
+    "times": np.int64,
+    "values": np.float32,
+}
+csr_dtypes = {
+    "data": np.float64,
+    "indices": np.int64,
+    "indptr": np.int64,
+}
+
+_parts_dirname = ".parts"
+
+
+def shard_ragged_arrays(events: pa.Table, vocabulary: pa.Array) -> Dict[str, np.ndarray]:
+    """Returns the ragged event arrays (see the module docstring) of the events of a single data shard."""
+    subject_ids = events.column(subject_id_field).to_numpy()
+    bounds = run_bounds(subject_ids)
+    return {
+        "subject_ids": subject_ids[bounds[:-1]].astype(np.int64),
+        "offsets": bounds.astype(np.int64),
+        "code_ids": vocabulary_indices(events.column(code_field), vocabulary).astype(np.int32),
+        "times": times_as_int64(events.column(time_field)),
+        "values": events.column(numeric_value_field).cast(pa.float32()).to_numpy().astype(np.float32),
+    }
+
+
+def subject_code_matrix(
+    offsets: np.ndarray, code_ids: np.ndarray, values: np.ndarray, n_codes: int, aggregation: str = "count"
+) -> SparseMatrix:
+    """Aggregates ragged event arrays into a subject × code CSR matrix.
+
+    Args:
+        offsets: The event offsets of each subject, as in the ragged arrays.
+        code_ids: The vocabulary index of each event; events with a negative index are dropped.
+        values: The numeric value of each event, NaN if null.
+        n_codes: The number of columns of the matrix.
+        aggregation: `count` for the number of events of each code, or `mean` or `last` for the mean or last of
+            their non-null values.
+
+    Returns:
+        The matrix, with one row per subject, and entries only for the codes that have a nonzero count or any value.
+    """
+    n_subjects = len(offsets) - 1
+    groups: np.ndarray = np.repeat(np.arange(n_subjects), np.diff(offsets))
+    known = np.flatnonzero(code_ids >= 0)
+    # Sorting is stable, so the events of each (subject, code) pair stay in time order.
+    order = known[np.lexsort((code_ids[known], groups[known]))]
+    groups, code_ids, values = groups[order], code_ids[order], values[order].astype(np.float64)
+
+    pair_bounds = np.union1d(run_bounds(groups), run_bounds(code_ids))
+    starts, ends = pair_bounds[:-1], pair_bounds[1:]
+    if aggregation == "count":
+        keep = np.ones(len(starts), dtype=bool)
+        data = (ends - starts).astype(np.float64)
+    else:
+        has_value = ~np.isnan(values)
+        if aggregation == "mean":
+            cum_values = np.concatenate([[0.0], np.cumsum(np.where(has_value, values, 0.0))])
+            cum_counts = np.concatenate([[0], np.cumsum(has_value)])
+            n_values = cum_counts[ends] - cum_counts[starts]
+            keep = n_values > 0
+            data = (cum_values[ends] - cum_values[starts]) / np.maximum(n_values, 1)
+        else:
+            last_valued = np.maximum.accumulate(np.where(has_value, np.arange(len(values)), -1))
+            last = last_valued[ends - 1]
+            keep = last >= starts
+            data = values[np.maximum(last, 0)]
+    return SparseMatrix.from_coo(groups[starts][keep], code_ids[starts][keep], data[keep], (n_subjects, n_codes))
+
+
+def _save_arrays(directory: str, arrays: Dict[str, np.ndarray]) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+
+
+def export_shard(
+    path: str,
+    part_dir: str,
+    vocabulary: pa.Array,
+    aggregation: Optional[str],
+    label_paths: Optional[Sequence[str]] = None,
+    batch_size: int = 4096,
+) -> Optional[pa.Table]:
+    """Writes the ragged and, unless `aggregation` is `None`, CSR arrays of a single data shard to `part_dir`.
+
+    Returns:
+        If `label_paths` is given, the labels of the subjects in the shard, in the order of the CSR rows.
+    """
+    events = pq.read_table(
+        path, columns=[subject_id_field, time_field, code_field, numeric_value_field], read_dictionary=[code_field]
+    )
+    ragged = shard_ragged_arrays(events, vocabulary)
+    _save_arrays(os.path.join(part_dir, ragged_dirname), ragged)
+
+    labels = None
+    if aggregation is None:
+        return labels
+    if label_paths is None:
+        matrix = subject_code_matrix(
+            ragged["offsets"], ragged["code_ids"], ragged["values"], len(vocabulary), aggregation
+        )
+    else:
+        labels, rows, cols, data = shard_window_features(
+            path, label_paths, vocabulary, [None], [aggregation], batch_size
+        )
+        matrix = SparseMatrix.from_coo(rows, cols, data, (labels.num_rows, len(vocabulary)))
+    _save_arrays(
+        os.path.join(part_dir, csr_dirname), {"data": matrix.data, "indices": matrix.indices, "indptr": matrix.indptr}
+    )
+    return labels
+
+
+def _export_shard(args) -> Optional[pa.Table]:
+    return export_shard(*args)
+
+
+def _concatenate_parts(part_paths: List[str], out_path: str, dtype: np.dtype, offsets: bool = False) -> None:
+    """Concatenates `.npy` part files into the memory-mapped `out_path`, one part at a time.
+
+    If `offsets` is set, parts are offset arrays starting at 0, which are shifted to continue one another.
+    """
+    lengths = [np.load(p, mmap_mode="r").shape[0] for p in part_paths]
+    length = sum(n - 1 for n in lengths) + 1 if offsets else sum(lengths)
+    tmp_path = f"{out_path}.tmp"
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(length,))
+    if offsets:
+        out[0] = 0
+    start, base = 0, 0
+    for part_path, n in zip(part_paths, lengths):
+        part = np.load(part_path, mmap_mode="r")
+        if offsets:
+            out[start : start + n] = part + base
+            start, base = start + n - 1, base + int(part[-1])
+        else:
+            out[start : start + n] = part
+            start += n
+    out.flush()
+    del out
+    os.replace(tmp_path, out_path)
+
+
+def export_arrays(
+    root: str,
+    output_dir: str,
+    aggregation: Optional[str] = "count",
+    label_dir: Optional[str] = None,
+    colocated: bool = False,
+    workers: int = 1,
+    batch_size: int = 4096,
+) -> str:
+    """Exports the dataset at `root` to memory-mappable ragged and CSR arrays (see the module docstring).
+
+    Args:
+        root: The root of the MEDS dataset.
+        output_dir: The directory to write the arrays to.
+        aggregation: How the events of each code are aggregated in the CSR matrix: `count`, `mean` or `last`, or
+            `None` to only export the ragged arrays.
+        label_dir: If given, the directory of a task's label shards, whose labels become the rows of the CSR matrix.
+        colocated: Whether the labels were written by `meds.labels.colocate_labels`.
+        workers: The number of data shards exported in parallel.
+        batch_size: The number of labels aggregated at once within a shard.
+
+    Returns:
+        `output_dir`.
+
+    Raises:
+        ValueError: If the aggregation is unknown.
+    """
+    if aggregation is not None and aggregation not in default_aggregations:
+        raise ValueError(f"Unknown aggregation '{aggregation}'; expected one of {default_aggregations}")
+    vocabulary = code_vocabulary(root)
+    shards = data_shards(root)
+    label_paths: Sequence[Optional[List[str]]]
+    if label_dir is None:
+        label_paths = [None] * len(shards)
+    else:
+        label_paths = shard_label_files(root, shards, label_dir, colocated)
+
+    parts_dir = os.path.join(output_dir, _parts_dirname)
+    part_dirs = [os.path.join(parts_dir, str(i)) for i in range(len(shards))]
+    jobs = [
+        (shard, part_dir, vocabulary, aggregation, paths, batch_size)
+        for shard, part_dir, paths in zip(shards, part_dirs, label_paths)
+    ]
+    labels = list(map_shards(_export_shard, jobs, workers))
+
+    layouts: List[Tuple[str, Mapping[str, type]]] = [(ragged_dirname, ragged_dtypes)]
+    if aggregation is not None:
+        layouts.append((csr_dirname, csr_dtypes))
+    for dirname, dtypes in layouts:
+        os.makedirs(os.path.join(output_dir, dirname), exist_ok=True)
+        for name, dtype in dtypes.items():
+            _concatenate_parts(
+                [os.path.join(part_dir, dirname, f"{name}.npy") for part_dir in part_dirs],
+                os.path.join(output_dir, dirname, f"{name}.npy"),
+                np.dtype(dtype),
+                offsets=name in ("offsets", "indptr"),
+            )
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+    if aggregation is not None:
+        if label_dir is None:
+            n_rows = int(np.load(os.path.join(output_dir, ragged_dirname, "subject_ids.npy"), mmap_mode="r").shape[0])
+        else:
+            table = pa.concat_tables(labels) if labels else label_schema.empty_table()
+            pq.write_table(table, os.path.join(output_dir, export_labels_filename))
+            n_rows = table.num_rows
+        shape = np.array([n_rows, len(vocabulary)], dtype=np.int64)
+        np.save(os.path.join(output_dir, csr_dirname, "shape.npy"), shape)
+
+    # The vocabulary is written last, so that its presence marks a complete export.
+    vocab = pa.table([pa.array(range(len(vocabulary)), code_id_dtype), vocabulary], schema=code_vocab_schema)
+    pq.write_table(vocab, os.path.join(output_dir, export_vocab_filename))
+    return output_dir
+
+
+def load_ragged(output_dir: str, mmap_mode: Optional[Literal["r+", "r", "w+", "c"]] = "r") -> Dict[str, np.ndarray]:
+    """Loads the ragged event arrays written by `export_arrays`, memory-mapped by default."""
+    return {
+        name: np.load(os.path.join(output_dir, ragged_dirname, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in ragged_dtypes
+    }
+
+
+def load_csr(output_dir: str, mmap_mode: Optional[Literal["r+", "r", "w+", "c"]] = "r") -> SparseMatrix:
+    """Loads the CSR matrix written by `export_arrays`, memory-mapped by default."""
+    arrays = {
+        name: np.load(os.path.join(output_dir, csr_dirname, f"{name}.npy"), mmap_mode=mmap_mode) for name in csr_dtypes
+    }
+    shape = np.load(os.path.join(output_dir, csr_dirname, "shape.npy"))
+    return SparseMatrix(arrays["data"], arrays["indices"], arrays["indptr"], (int(shape[0]), int(shape[1])))
@@ -0,0 +1,217 @@
+"""Window aggregation features of subject timelines, for tabular models.
+
+For every label (see `label_schema`) and every code of its subject's history up to and including the prediction
+time, `window_features` computes aggregates of the code's events in windows `(prediction_time - window,
+prediction_time]`, or over the full history, including static events:
+
+* `count`: the number of events.
+* `mean`: the mean of their non-null `numeric_value`s.
+* `last`: the last of their non-null `numeric_value`s.
+
+Features are computed one data shard at a time. A shard's events are sorted by (subject, code, time), so the
+events of each (subject, code) pair are a contiguous, time-sorted run. Counts, sums and last values of any window
+are then differences of, or lookups into, running counts, cumulative sums and running last-value indices over
+the sorted events, at the window edges found by vectorized binary searches. Each label thus costs a constant
+number of operations per code of its subject, regardless of how many events the subject has.
+"""
+
+import datetime
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ._utils import data_shards, grouped_searchsorted, map_shards, run_bounds, times_as_int64
+from .labels import read_labels, shard_label_files
+from .schema import code_field, label_schema, numeric_value_field, prediction_time_field, subject_id_field, time_field
+from .sparse import SparseMatrix
+from .vocab import code_vocabulary, vocabulary_indices
+
+default_windows = [
+    datetime.timedelta(days=7),
+    datetime.timedelta(days=30),
+    datetime.timedelta(days=365),
+    None,
+]
+default_aggregations = ["count", "mean", "last"]
+
+_aggregations = {"count", "mean", "last"}
+
+
+def _window_name(window: Optional[datetime.timedelta]) -> str:
+    if window is None:
+        return "full"
+    if window % datetime.timedelta(days=1) == datetime.timedelta(0):
+        return f"{window.days}d"
+    return f"{int(window.total_seconds())}s"
+
+
+def feature_names(
+    vocabulary: pa.Array,
+    windows: Sequence[Optional[datetime.timedelta]] = default_windows,
+    aggregations: Sequence[str] = default_aggregations,
+) -> List[str]:
+    """Returns the names, `{code}/{window}/{aggregation}`, of the columns of the feature matrix."""
+    return [
+        f"{code}/{_window_name(window)}/{aggregation}"
+        for code in vocabulary.to_pylist()
+        for window in windows
+        for aggregation in aggregations
+    ]
+
+
+def shard_window_features(
+    path: str,
+    label_paths: Sequence[str],
+    vocabulary: pa.Array,
+    windows: Sequence[Optional[int]],
+    aggregations: Sequence[str],
+    batch_size: int = 4096,
+) -> Tuple[pa.Table, np.ndarray, np.ndarray, np.ndarray]:
+    """Computes the window features of the labels of the subjects in a single data shard.
+
+    Windows are given in microseconds, or `None` for the full history. Labels are processed `batch_size` at a
+    time, which bounds memory use by `batch_size` times the largest number of distinct codes of a subject.
+
+    Returns:
+        The labels, and the `(row, column, value)` triplets of their nonzero features, with rows indexing the
+        labels.
+    """
+    events = pq.read_table(
+        path, columns=[subject_id_field, time_field, code_field, numeric_value_field], read_dictionary=[code_field]
+    )
+    subject_ids = events.column(subject_id_field).to_numpy()
+    bounds = run_bounds(subject_ids)
+    run_subject_ids = subject_ids[bounds[:-1]]
+    groups: np.ndarray = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+
+    # Events are sorted by (subject, code, time); events of codes outside the vocabulary are dropped.
+    code_ids = vocabulary_indices(events.column(code_field), vocabulary)
+    times = times_as_int64(events.column(time_field))
+    known = np.flatnonzero(code_ids >= 0)
+    order = known[np.lexsort((times[known], code_ids[known], groups[known]))]
+    groups, code_ids, times = groups[order], code_ids[order], times[order]
+    values = events.column(numeric_value_field).cast(pa.float64()).to_numpy()[order]
+
+    pair_bounds = np.union1d(run_bounds(groups), run_bounds(code_ids))
+    pair_of_event = np.repeat(np.arange(len(pair_bounds) - 1), np.diff(pair_bounds))
+    pair_groups, pair_codes = groups[pair_bounds[:-1]], code_ids[pair_bounds[:-1]]
+
+    has_value = ~np.isnan(values)
+    cum_values = np.concatenate([[0.0], np.cumsum(np.where(has_value, values, 0.0))])
+    cum_counts = np.concatenate([[0], np.cumsum(has_value)])
+    # The index of the last event with a value at or before each event, or -1.
+    last_valued = np.maximum.accumulate(np.where(has_value, np.arange(len(values)), -1))
+
+    labels = read_labels(label_paths, run_subject_ids)
+    by_subject = np.argsort(run_subject_ids, kind="stable")
+    label_subject_ids = labels.column(subject_id_field).to_numpy()
+    label_groups = by_subject[np.searchsorted(run_subject_ids[by_subject], label_subject_ids)]
+    prediction_times = times_as_int64(labels.column(prediction_time_field))
+
+    n_aggregations = len(aggregations)
+    n_per_code = len(windows) * n_aggregations
+    rows, cols, data = [], [], []
+    for start in range(0, labels.num_rows, batch_size):
+        batch_groups = label_groups[start : start + batch_size]
+        batch_times = prediction_times[start : start + batch_size]
+
+        # Every (label, code pair of the label's subject) combination.
+        pair_starts = np.searchsorted(pair_groups, batch_groups, side="left")
+        n_pairs = np.searchsorted(pair_groups, batch_groups, side="right") - pair_starts
+        label_of = np.repeat(np.arange(len(batch_groups)), n_pairs)
+        pairs = pair_starts[label_of] + np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+        query_times = batch_times[label_of]
+
+        hi = grouped_searchsorted(pair_of_event, times, pairs, query_times, side="right")
+        full_lo = pair_bounds[pairs]
+        # Only codes with any event up to the prediction time have nonzero features.
+        observed = hi > full_lo
+        label_of, pairs, query_times, hi, full_lo = (a[observed] for a in (label_of, pairs, query_times, hi, full_lo))
+
+        for w, window in enumerate(windows):
+            if window is None:
+                lo = full_lo
+            else:
+                lo = grouped_searchsorted(pair_of_event, times, pairs, query_times - window, side="right")
+            for a, aggregation in enumerate(aggregations):
+                if aggregation == "count":
+                    value = (hi - lo).astype(np.float64)
+                    nonzero = value > 0
+                elif aggregation == "mean":
+                    n_values = cum_counts[hi] - cum_counts[lo]
+                    nonzero = n_values > 0
+                    value = (cum_values[hi] - cum_values[lo]) / np.maximum(n_values, 1)
+                else:
+                    last = last_valued[hi - 1]
+                    nonzero = (hi > lo) & (last >= lo)
+                    value = values[np.maximum(last, 0)]
+                rows.append(start + label_of[nonzero])
+                cols.append(pair_codes[pairs[nonzero]] * n_per_code + w * n_aggregations + a)
+                data.append(value[nonzero])
+
+    def concat(arrays: List[np.ndarray], dtype) -> np.ndarray:
+        return np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+
+    return labels, concat(rows, np.int64), concat(cols, np.int64), concat(data, np.float64)
+
+
+def _shard_window_features(args) -> Tuple[pa.Table, np.ndarray, np.ndarray, np.ndarray]:
+    return shard_window_features(*args)
+
+
+def window_features(
+    root: str,
+    label_dir: str,
+    windows: Sequence[Optional[datetime.timedelta]] = default_windows,
+    aggregations: Sequence[str] = default_aggregations,
+    colocated: bool = False,
+    workers: int = 1,
+    batch_size: int = 4096,
+) -> Tuple[SparseMatrix, pa.Table]:
+    """Computes window aggregation features for the labels of a task over the dataset at `root`.
+
+    Args:
+        root: The root of the MEDS dataset.
+        label_dir: The directory of the task's label shards.
+        windows: The lengths of the windows before the prediction time, or `None` for the full history.
+        aggregations: The aggregations of each code's events in each window: `count`, `mean` and `last`.
+        colocated: Whether the labels were written by `meds.labels.colocate_labels`, in which case each data
+            shard is only matched with its own label shard.
+        workers: The number of data shards processed in parallel.
+        batch_size: The number of labels processed at once within a shard.
+
+    Returns:
+        The float64 feature matrix, with one row per label and the columns named by `feature_names`, and the
+        labels, in the order of the rows. Labels of subjects not in the dataset are dropped.
+    """
+    unknown = set(aggregations) - _aggregations
+    if unknown:
+        raise ValueError(f"Unknown aggregations {sorted(unknown)}; expected a subset of {sorted(_aggregations)}")
+    vocabulary = code_vocabulary(root)
+    windows_us = [None if w is None else w // datetime.timedelta(microseconds=1) for w in windows]
+
+    shards = data_shards(root)
+    jobs = [
+        (shard, paths, vocabulary, windows_us, list(aggregations), batch_size)
+        for shard, paths in zip(shards, shard_label_files(root, shards, label_dir, colocated))
+    ]
+
+    labels, rows, cols, data = [], [], [], []
+    n_rows = 0
+    for shard_labels, shard_rows, shard_cols, shard_data in map_shards(_shard_window_features, jobs, workers):
+        labels.append(shard_labels)
+        rows.append(shard_rows + n_rows)
+        cols.append(shard_cols)
+        data.append(shard_data)
+        n_rows += shard_labels.num_rows
+
+    shape = (n_rows, len(vocabulary) * len(windows) * len(aggregations))
+    matrix = SparseMatrix.from_coo(
+        np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64),
+        np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64),
+        np.concatenate(data) if data else np.zeros(0, dtype=np.float64),
+        shape,
+    )
+    return matrix, pa.concat_tables(labels) if labels else label_schema.empty_table()
@@ -0,0 +1,137 @@
+"""A persistent subject index over the data shards of a MEDS dataset.
+
+The subject index maps every subject to the location of its events on disk, so that a single subject's
+timeline can be read without scanning every data shard. It is stored under the dataset's `metadata/`
+directory and contains one row per (subject, row group) pair, as a subject's events may span consecutive row
+groups of its shard.
+
+Each entry also records how many of the subject's events in that row group are static (have a null `time`).
+Static events sort first within a subject, so they are a prefix of the subject's events, and readers can split
+them from the time-ordered dynamic events without scanning the `time` column.
+"""
+
+import os
+from typing import List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ._utils import data_shards, map_shards, run_bounds
+from .schema import subject_id_dtype, subject_id_field, time_field
+
+subject_index_filepath = os.path.join("metadata", "subject_index.parquet")
+
+shard_field = "shard"
+row_group_field = "row_group"
+row_offset_field = "row_offset"
+length_field = "length"
+static_length_field = "static_length"
+
+subject_index_schema = pa.schema(
+    [
+        (subject_id_field, subject_id_dtype),
+        # The path of the data shard, relative to the dataset root and using "/" as the separator.
+        (shard_field, pa.string()),
+        # The row group of the shard, and the offset of the subject's first event within it.
+        (row_group_field, pa.int32()),
+        (row_offset_field, pa.int64()),
+        # The number of the subject's events in this row group.
+        (length_field, pa.int64()),
+        # The number of those events that are static (with a null `time`).
+        (static_length_field, pa.int64()),
+    ]
+)
+
+
+def index_shard(path: str, root: str) -> pa.Table:
+    """Builds the subject index entries of a single data shard, reading only its `subject_id` and `time` columns."""
+    shard = os.path.relpath(path, root).replace(os.sep, "/")
+    pf = pq.ParquetFile(path)
+
+    tables: List[pa.Table] = []
+    for rg in range(pf.num_row_groups):
+        table = pf.read_row_group(rg, columns=[subject_id_field, time_field])
+        if table.num_rows == 0:
+            continue
+        subject_ids = table.column(subject_id_field).to_numpy()
+        is_static = table.column(time_field).is_null().to_numpy(zero_copy_only=False)
+        bounds = run_bounds(subject_ids)
+        starts = bounds[:-1]
+        tables.append(
+            pa.table(
+                {
+                    subject_id_field: subject_ids[starts],
+                    shard_field: pa.array([shard] * len(starts), pa.string()),
+                    row_group_field: np.full(len(starts), rg, dtype=np.int32),
+                    row_offset_field: starts,
+                    length_field: np.diff(bounds),
+                    static_length_field: np.add.reduceat(is_static.astype(np.int64), starts),
+                },
+                schema=subject_index_schema,
+            )
+        )
+    return pa.concat_tables(tables) if tables else subject_index_schema.empty_table()
+
+
+def _index_shard(args) -> pa.Table:
+    return index_shard(*args)
+
+
+def build_subject_index(root: str, workers: int = 1) -> pa.Table:
+    """Builds the subject index of the dataset at `root` in one pass over its shards and writes it to disk.
+
+    Returns:
+        The index, sorted by subject ID and then by position on disk.
+    """
+    shards = data_shards(root)
+    tables = list(map_shards(_index_shard, [(path, root) for path in shards], workers))
+    index = pa.concat_tables(tables) if tables else subject_index_schema.empty_table()
+    index = index.sort_by([(subject_id_field, "ascending"), (shard_field, "ascending"), (row_group_field, "ascending")])
+
+    path = os.path.join(root, subject_index_filepath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(index, path)
+    return index
+
+
+def _shard_subject_ids(path: str) -> np.ndarray:
+    return np.unique(pq.read_table(path, columns=[subject_id_field]).column(0).to_numpy())
+
+
+def subject_shards(root: str, workers: int = 1) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """Returns the mapping from subjects to the data shards that hold them.
+
+    The subject index is used if it exists; otherwise the `subject_id` columns of all shards are scanned.
+
+    Returns:
+        A tuple `(subject_ids, shard_indices, shards)` of the sorted unique subject IDs, the index into `shards`
+        of the shard holding each subject, and the shard paths.
+    """
+    index_path = os.path.join(root, subject_index_filepath)
+    if os.path.exists(index_path):
+        index = pq.read_table(index_path, columns=[subject_id_field, shard_field])
+        shard_names = index.column(shard_field).combine_chunks().dictionary_encode()
+        shards = [os.path.join(root, *name.split("/")) for name in shard_names.dictionary.to_pylist()]
+        subject_ids, first = np.unique(index.column(subject_id_field).to_numpy(), return_index=True)
+        return subject_ids, shard_names.indices.to_numpy()[first].astype(np.int64), shards
+
+    shards = data_shards(root)
+    per_shard = list(map_shards(_shard_subject_ids, shards, workers))
+    if not per_shard:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), shards
+    subject_ids = np.concatenate(per_shard)
+    shard_indices = np.repeat(np.arange(len(shards)), [len(ids) for ids in per_shard])
+    order = np.argsort(subject_ids, kind="stable")
+    return subject_ids[order], shard_indices[order], shards
+
+
+def lookup_shards(subject_ids: np.ndarray, shard_indices: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Looks up the shard index of each subject in `query` in a mapping returned by `subject_shards`.
+
+    Subjects that are not in the mapping get a shard index of -1.
+    """
+    if len(subject_ids) == 0:
+        return np.full(len(query), -1, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(subject_ids, query), len(subject_ids) - 1)
+    return np.where(subject_ids[pos] == query, shard_indices[pos], -1)
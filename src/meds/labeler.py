@@ -0,0 +1,214 @@
+"""Vectorized materialization of task labels from code predicates and time windows.
+
+A task is defined by two code predicates, each a set of codes, optionally extended to all their descendants in the
+code ontology (see `meds.ontology`):
+
+* Trigger events, at which predictions are made: every distinct time of a trigger event of a subject, shifted by
+  `prediction_delay`, is a prediction time.
+* Outcome events: a prediction time's label is whether (`boolean_value`), and how many times (`integer_value`),
+  an outcome event occurs in the window `(prediction_time + window_start, prediction_time + window_end]`.
+
+For example, "death within 30 days after admission" has trigger codes `["ADMISSION"]`, outcome codes
+`[death_code]` and a `window_end` of 30 days.
+
+Predicates are resolved once into boolean masks over the code vocabulary, and each shard's codes are mapped to
+vocabulary indices through their dictionary, so matching events are found by a single gather. The events of a
+shard are sorted by subject and time, so all window counts of a shard are then two vectorized binary searches of
+the prediction windows' edges in the sorted outcome times.
+"""
+
+import datetime
+import os
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ._utils import NULL_TIME, data_shards, grouped_searchsorted, map_shards, run_bounds, times_as_int64
+from .labels import colocated_label_path
+from .ontology import OntologyIndex
+from .schema import (
+    code_field,
+    label_schema,
+    prediction_time_field,
+    subject_id_dtype,
+    subject_id_field,
+    time_dtype,
+    time_field,
+)
+from .vocab import code_vocabulary, vocabulary_indices
+
+
+def _microseconds(delta: datetime.timedelta) -> int:
+    return delta // datetime.timedelta(microseconds=1)
+
+
+def code_mask(vocabulary: pa.Array, codes: Iterable[str], ontology: Optional[OntologyIndex] = None) -> np.ndarray:
+    """Returns the mask over `vocabulary` of the given codes and, if an ontology is given, all their descendants.
+
+    The mask has a trailing False entry, so that it can be indexed by the -1 of codes not in the vocabulary.
+    """
+    value_set = [pa.array(list(codes), vocabulary.type)]
+    if ontology is not None:
+        for code in value_set[0].to_pylist():
+            try:
+                value_set.append(ontology.expand_descendants(code).cast(vocabulary.type))
+            except KeyError:
+                # Codes that are not in the ontology have no descendants.
+                pass
+    mask = pc.is_in(vocabulary, value_set=pa.concat_arrays(value_set)).to_numpy(zero_copy_only=False)
+    return np.append(mask, False)
+
+
+def label_events(
+    subject_ids: np.ndarray,
+    times: np.ndarray,
+    is_trigger: np.ndarray,
+    is_outcome: np.ndarray,
+    window_start: int,
+    window_end: int,
+    prediction_delay: int = 0,
+    require_full_window: bool = False,
+) -> pa.Table:
+    """Computes the labels of the events of a data shard, given which events are triggers and outcomes.
+
+    Args:
+        subject_ids: The `subject_id` of each event, in shard order.
+        times: The time of each event, in microseconds, with static events at `NULL_TIME` (see `times_as_int64`).
+        is_trigger: Whether each event is a trigger event.
+        is_outcome: Whether each event is an outcome event.
+        window_start: The start of the outcome window, exclusive, in microseconds after the prediction time.
+        window_end: The end of the outcome window, inclusive, in microseconds after the prediction time.
+        prediction_delay: The delay of prediction times after their trigger events, in microseconds.
+        require_full_window: If set, labels without any outcome are dropped if the subject's last event precedes
+            the end of the window, as the outcome may then have occurred unobserved.
+
+    Returns:
+        The labels, in `label_schema`, ordered by subject (in shard order) and prediction time.
+    """
+    bounds = run_bounds(subject_ids)
+    # Subjects are numbered in order of appearance, so that (subject number, time) is sorted lexicographically.
+    groups = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+    timed = times != NULL_TIME
+
+    trigger = is_trigger & timed
+    trigger_groups, trigger_times = groups[trigger], times[trigger] + prediction_delay
+    # Triggers are sorted by subject and time, so repeated prediction times are adjacent.
+    distinct = np.ones(len(trigger_groups), dtype=bool)
+    distinct[1:] = (trigger_groups[1:] != trigger_groups[:-1]) | (trigger_times[1:] != trigger_times[:-1])
+    trigger_groups, prediction_times = trigger_groups[distinct], trigger_times[distinct]
+
+    outcome = is_outcome & timed
+    outcome_groups, outcome_times = groups[outcome], times[outcome]
+    after_start = grouped_searchsorted(
+        outcome_groups, outcome_times, trigger_groups, prediction_times + window_start, "right"
+    )
+    after_end = grouped_searchsorted(
+        outcome_groups, outcome_times, trigger_groups, prediction_times + window_end, "right"
+    )
+    counts = after_end - after_start
+
+    keep = np.ones(len(counts), dtype=bool)
+    if require_full_window:
+        last_times = times[bounds[1:] - 1] if len(subject_ids) else np.zeros(0, dtype=np.int64)
+        keep = (counts > 0) | (last_times[trigger_groups] >= prediction_times + window_end)
+
+    n = int(keep.sum())
+    return pa.table(
+        {
+            subject_id_field: pa.array(subject_ids[bounds[:-1]][trigger_groups[keep]], subject_id_dtype),
+            prediction_time_field: pa.array(prediction_times[keep], pa.int64()).cast(time_dtype),
+            "boolean_value": pa.array(counts[keep] > 0),
+            "integer_value": pa.array(counts[keep], pa.int64()),
+            "float_value": pa.nulls(n, pa.float64()),
+            "categorical_value": pa.nulls(n, pa.string()),
+        },
+        schema=label_schema,
+    )
+
+
+def label_shard(
+    path: str,
+    out_path: str,
+    vocabulary: pa.Array,
+    trigger_mask: np.ndarray,
+    outcome_mask: np.ndarray,
+    window_start: int,
+    window_end: int,
+    prediction_delay: int = 0,
+    require_full_window: bool = False,
+) -> int:
+    """Writes the labels of a single data shard to `out_path`, reading only its `subject_id`, `time` and `code`
+    columns. Trigger and outcome masks are over `vocabulary`, as returned by `code_mask`.
+
+    Returns:
+        The number of labels written.
+    """
+    events = pq.read_table(path, columns=[subject_id_field, time_field, code_field], read_dictionary=[code_field])
+    code_ids = vocabulary_indices(events.column(code_field), vocabulary)
+    labels = label_events(
+        events.column(subject_id_field).to_numpy(),
+        times_as_int64(events.column(time_field)),
+        trigger_mask[code_ids],
+        outcome_mask[code_ids],
+        window_start,
+        window_end,
+        prediction_delay,
+        require_full_window,
+    )
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.tmp"
+    pq.write_table(labels, tmp_path)
+    os.replace(tmp_path, out_path)
+    return labels.num_rows
+
+
+def _label_shard(args) -> int:
+    return label_shard(*args)
+
+
+def materialize_labels(
+    root: str,
+    output_dir: str,
+    trigger_codes: Iterable[str],
+    outcome_codes: Iterable[str],
+    window_end: datetime.timedelta,
+    window_start: datetime.timedelta = datetime.timedelta(0),
+    prediction_delay: datetime.timedelta = datetime.timedelta(0),
+    include_descendants: bool = False,
+    require_full_window: bool = False,
+    workers: int = 1,
+) -> List[str]:
+    """Materializes the labels of a task over the dataset at `root`, one label shard per data shard.
+
+    Label shards are written to `colocated_label_path(root, shard, output_dir)`, so they are aligned with the data
+    shards, and can be joined with them by `meds.labels.join_labels(..., colocated=True)`. Shards are labeled over
+    `workers` processes. See the module docstring for the definition of tasks; if `include_descendants` is set,
+    code predicates include all descendants of their codes in the ontology of `metadata/codes.parquet`.
+
+    Returns:
+        The paths of the label shards written.
+    """
+    vocabulary = code_vocabulary(root)
+    ontology = OntologyIndex.from_code_metadata(root) if include_descendants else None
+    trigger_mask = code_mask(vocabulary, trigger_codes, ontology)
+    outcome_mask = code_mask(vocabulary, outcome_codes, ontology)
+
+    jobs = [
+        (
+            path,
+            colocated_label_path(root, path, output_dir),
+            vocabulary,
+            trigger_mask,
+            outcome_mask,
+            _microseconds(window_start),
+            _microseconds(window_end),
+            _microseconds(prediction_delay),
+            require_full_window,
+        )
+        for path in data_shards(root)
+    ]
+    list(map_shards(_label_shard, jobs, workers))
+    return [job[1] for job in jobs]
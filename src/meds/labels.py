@@ -0,0 +1,177 @@
+"""Point-in-time joins between task labels and MEDS data shards.
+
+Models predicting a label may use all data about a subject up to and including the prediction time (see
+`label_schema`). `join_labels` computes, for every label, the slice of its subject's events that satisfies
+this: rows `[event_start, event_end)` of the data shard holding the subject, where `event_start` is the subject's
+first event and `event_end` is one past its last event at or before the prediction time. Static events (null
+`time`) sort first and are always included.
+
+The join streams over the data shards. Each shard's `subject_id` and `time` columns are read once, and all of its
+labels are resolved together with a single vectorized binary search over the sorted times.
+
+Label shards need not be sharded like the data, in which case every data shard must search every label shard for
+its subjects. `colocate_labels` rewrites a task's labels so that `$TASK_ROOT/$TASK_NAME/$SHARD_NAME.parquet` holds
+exactly the labels of the subjects in the data shard `$MEDS_ROOT/data/$SHARD_NAME.parquet`, after which each data
+shard can be joined with its own label shard alone.
+"""
+
+import glob
+import os
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from ._utils import data_shards, grouped_searchsorted, map_shards, run_bounds, times_as_int64
+from .index import lookup_shards, subject_shards
+from .schema import data_subdirectory, label_schema, prediction_time_field, subject_id_field, time_field
+
+event_start_field = "event_start"
+event_end_field = "event_end"
+
+
+def label_files(label_dir: str) -> List[str]:
+    """Returns the sorted paths of all label shards (`$TASK_ROOT/$TASK_NAME/**/*.parquet`) of a task."""
+    return sorted(glob.glob(os.path.join(label_dir, "**", "*.parquet"), recursive=True))
+
+
+def read_labels(label_paths: Sequence[str], subject_ids: Optional[np.ndarray] = None) -> pa.Table:
+    """Reads label shards, keeping only the labels of `subject_ids` if given, using predicate pushdown."""
+    if not label_paths:
+        return label_schema.empty_table()
+    dataset = ds.dataset(list(label_paths), format="parquet")
+    if subject_ids is None:
+        return dataset.to_table()
+    return dataset.to_table(filter=ds.field(subject_id_field).isin(pa.array(subject_ids)))
+
+
+def join_shard_labels(shard: str, label_paths: Sequence[str]) -> pa.Table:
+    """Joins the labels of the subjects in one data shard to their event slices in that shard.
+
+    Returns:
+        The labels of the subjects in the shard, with added `event_start` and `event_end` row offsets.
+    """
+    events = pq.read_table(shard, columns=[subject_id_field, time_field])
+    subject_ids = events.column(subject_id_field).to_numpy()
+    times = times_as_int64(events.column(time_field))
+
+    bounds = run_bounds(subject_ids)
+    run_starts = bounds[:-1]
+    run_subject_ids = subject_ids[run_starts]
+    run_of_row = np.repeat(np.arange(len(run_starts)), np.diff(bounds))
+
+    labels = read_labels(label_paths, run_subject_ids)
+    label_subject_ids = labels.column(subject_id_field).to_numpy()
+
+    # Subjects appear in the shard in arbitrary order, so we locate each label's subject run via a sorted view.
+    by_subject = np.argsort(run_subject_ids, kind="stable")
+    label_runs = by_subject[np.searchsorted(run_subject_ids[by_subject], label_subject_ids)]
+
+    prediction_times = times_as_int64(labels.column(prediction_time_field))
+    event_end = grouped_searchsorted(run_of_row, times, label_runs, prediction_times, side="right")
+
+    labels = labels.append_column(event_start_field, pa.array(run_starts[label_runs], pa.int64()))
+    return labels.append_column(event_end_field, pa.array(event_end, pa.int64()))
+
+
+def _join_shard_labels(args) -> pa.Table:
+    return join_shard_labels(*args)
+
+
+def join_labels(root: str, label_dir: str, workers: int = 1, colocated: bool = False) -> Iterator[Tuple[str, pa.Table]]:
+    """Streams the point-in-time join of a task's labels with the data shards of the dataset at `root`.
+
+    If `colocated` is set, the labels must have been written by `colocate_labels`, and each data shard is joined
+    with its own label shard only. Labels whose subject is not in the dataset are dropped.
+
+    Yields:
+        `(shard, labels)` pairs, in shard order, where `labels` are the labels of the subjects in `shard` with
+        their `event_start` and `event_end` row offsets into it.
+    """
+    shards = data_shards(root)
+    jobs = list(zip(shards, shard_label_files(root, shards, label_dir, colocated)))
+    yield from zip(shards, map_shards(_join_shard_labels, jobs, workers))
+
+
+def colocated_label_path(root: str, shard: str, label_dir: str) -> str:
+    """Returns the path of the label shard `$TASK_ROOT/$TASK_NAME/$SHARD_NAME.parquet` aligned with a data shard."""
+    shard_name = os.path.splitext(os.path.relpath(shard, os.path.join(root, data_subdirectory)))[0]
+    return os.path.join(label_dir, shard_name + ".parquet")
+
+
+def shard_label_files(root: str, shards: Sequence[str], label_dir: str, colocated: bool = False) -> List[List[str]]:
+    """Returns, for each data shard, the label shards of a task to join with it.
+
+    If `colocated` is set, that is the shard's own label shard written by `colocate_labels`, if there is one;
+    otherwise, it is every label shard of the task.
+    """
+    if colocated:
+        paths = [colocated_label_path(root, shard, label_dir) for shard in shards]
+        return [[path] if os.path.exists(path) else [] for path in paths]
+    return [label_files(label_dir)] * len(shards)
+
+
+def _write_colocated_labels(args) -> None:
+    spill_path, slices, out_path = args
+    reader = pa.ipc.open_file(pa.memory_map(spill_path))
+    table = pa.Table.from_batches([reader.get_batch(b).slice(offset, length) for b, offset, length in slices])
+    table = table.sort_by([(subject_id_field, "ascending"), (prediction_time_field, "ascending")])
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    pq.write_table(table, out_path)
+
+
+def colocate_labels(root: str, label_dir: str, output_dir: str, workers: int = 1, batch_size: int = 65536) -> List[str]:
+    """Repartitions a task's labels so that each label shard aligns with exactly one data shard.
+
+    The subject-to-shard mapping is read once (from the subject index if it exists). Labels are then streamed
+    batch by batch, each batch grouped by data shard and spilled to a single temporary Arrow IPC file in
+    `output_dir`. Finally, each data shard's labels are gathered from the memory-mapped spill file, sorted by
+    subject and prediction time, and written to `colocated_label_path(root, shard, output_dir)`. Memory use is
+    bounded by the labels of one data shard. Data shards without labels get no label shard, and labels of
+    subjects that are not in the dataset are dropped. All label shards must share the same schema.
+
+    Returns:
+        The paths of the label shards written.
+    """
+    if os.path.abspath(output_dir) == os.path.abspath(label_dir):
+        raise ValueError("output_dir must differ from label_dir")
+
+    subject_ids, shard_indices, shards = subject_shards(root, workers)
+    os.makedirs(output_dir, exist_ok=True)
+    spill_path = os.path.join(output_dir, ".colocate_labels.arrow")
+
+    slices: Dict[int, List[Tuple[int, int, int]]] = defaultdict(list)
+    writer = None
+    n_batches = 0
+    try:
+        for path in label_files(label_dir):
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+                label_subject_ids = batch.column(subject_id_field).to_numpy(zero_copy_only=False)
+                label_shards = lookup_shards(subject_ids, shard_indices, label_subject_ids)
+                order = np.argsort(label_shards, kind="stable")
+                label_shards = label_shards[order]
+                if writer is None:
+                    writer = pa.ipc.new_file(spill_path, batch.schema)
+                writer.write_batch(batch.take(pa.array(order)))
+
+                bounds = run_bounds(label_shards)
+                for start, end in zip(bounds[:-1], bounds[1:]):
+                    if start < end and label_shards[start] >= 0:
+                        slices[int(label_shards[start])].append((n_batches, int(start), int(end - start)))
+                n_batches += 1
+        if writer is not None:
+            writer.close()
+            writer = None
+
+        jobs = [(spill_path, slices[s], colocated_label_path(root, shards[s], output_dir)) for s in sorted(slices)]
+        list(map_shards(_write_colocated_labels, jobs, workers))
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(spill_path):
+            os.remove(spill_path)
+
+    return [out_path for _, _, out_path in jobs]
@@ -0,0 +1,189 @@
+"""Per-code normalization and binning of `numeric_value`.
+
+Both transforms are parameterized per code: z-scores by the mean and standard deviation of each code's values,
+from the code statistics in `metadata/codes.parquet` (see `meds.code_stats`), and quantile bins by bin edges
+estimated from each code's quantile sketch (see `meds.sketches`). Parameters are laid out as arrays indexed by
+position in the global code vocabulary (see `meds.vocab`), so each shard is transformed by reading its `code`
+column as vocabulary indices and gathering every row's parameters at once, without looking any code up by name.
+"""
+
+import os
+from typing import Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ._utils import copy_files, data_shards, map_shards
+from .code_stats import values_n_occurrences_field, values_sum_field, values_sum_sqd_field
+from .index import subject_index_filepath
+from .schema import (
+    code_field,
+    code_metadata_filepath,
+    dataset_metadata_filepath,
+    numeric_value_dtype,
+    numeric_value_field,
+    subject_splits_filepath,
+)
+from .sketches import load_sketches, sketch_quantiles
+from .vocab import code_vocabulary, vocabulary_indices
+
+bin_dtype = pa.int32()
+
+
+def _align(vocabulary: pa.Array, codes: pa.Array) -> np.ndarray:
+    """Returns the row of `codes` holding each vocabulary code, or -1 if there is none."""
+    rows = pc.index_in(vocabulary, value_set=codes)
+    return pc.fill_null(rows, -1).to_numpy()
+
+
+def zscore_parameters(root: str) -> Tuple[pa.Array, np.ndarray, np.ndarray]:
+    """Returns the vocabulary of the dataset at `root` and the mean and standard deviation of each code's values,
+    from the code statistics in its code metadata. Codes without values have a NaN mean and standard deviation.
+    """
+    vocabulary = code_vocabulary(root)
+    columns = [code_field, values_n_occurrences_field, values_sum_field, values_sum_sqd_field]
+    codes = pq.read_table(os.path.join(root, code_metadata_filepath), columns=columns)
+    rows = _align(vocabulary, codes.column(code_field).combine_chunks())
+
+    def gather(name: str) -> np.ndarray:
+        values = codes.column(name).to_numpy().astype(np.float64)
+        return np.where(rows >= 0, values[np.maximum(rows, 0)] if len(values) else np.nan, np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = gather(values_n_occurrences_field)
+        n = np.where(n > 0, n, np.nan)
+        mean = gather(values_sum_field) / n
+        std = np.sqrt(np.maximum(gather(values_sum_sqd_field) / n - mean**2, 0))
+    return vocabulary, mean, std
+
+
+def quantile_bin_edges(root: str, n_bins: int) -> Tuple[pa.Array, np.ndarray]:
+    """Returns the vocabulary of the dataset at `root` and, for each code, the `n_bins - 1` inner edges of
+    `n_bins` equal-frequency bins of its values, from the persisted quantile sketches. Codes without a sketch have
+    NaN edges.
+    """
+    vocabulary = code_vocabulary(root)
+    quantiles = sketch_quantiles(load_sketches(root), [i / n_bins for i in range(1, n_bins)])
+    rows = _align(vocabulary, quantiles.column(code_field).combine_chunks())
+
+    edges = np.full((len(vocabulary), n_bins - 1), np.nan)
+    if quantiles.num_rows:
+        sketched = np.stack([c.to_numpy() for c in quantiles.columns[1:]], axis=1)
+        edges[rows >= 0] = sketched[rows[rows >= 0]]
+    return vocabulary, edges
+
+
+def transform_values(code_ids: np.ndarray, values: np.ndarray, method: str, parameters: Tuple[np.ndarray, ...]):
+    """Normalizes or bins values given their codes' vocabulary indices and the per-code parameter arrays.
+
+    Returns:
+        The transformed values, and a mask of those that are null: those whose value or code ID is null (given as
+        NaN and -1, respectively), or whose code has no parameters.
+    """
+    known = code_ids >= 0
+    code_ids = np.maximum(code_ids, 0)
+    if method == "zscore":
+        mean, std = (p[code_ids] for p in parameters)
+        # Codes whose values are all equal have a standard deviation of zero, and their values normalize to 0.
+        out = (values - mean) / np.where(std > 0, std, 1.0)
+        return out, ~known | np.isnan(out)
+    if method == "quantile_bins":
+        (edges,) = parameters
+        row_edges = edges[code_ids]
+        out = (row_edges <= values[:, None]).sum(axis=1)
+        return out, ~known | np.isnan(values) | np.isnan(row_edges).all(axis=1)
+    raise ValueError(f"Unknown method '{method}'; expected 'zscore' or 'quantile_bins'")
+
+
+def transform_shard(
+    path: str,
+    out_path: str,
+    vocabulary: pa.Array,
+    method: str,
+    parameters: Tuple[np.ndarray, ...],
+    output_field: str = numeric_value_field,
+) -> None:
+    """Writes a copy of a data shard with its `numeric_value`s normalized or binned into `output_field`, row group
+    by row group, preserving its row group layout."""
+    # Codes are read as dictionaries, but written back as plain strings.
+    pf = pq.ParquetFile(path, read_dictionary=[code_field])
+    schema = pq.read_schema(path)
+    if output_field == numeric_value_field:
+        dtype = numeric_value_dtype
+    else:
+        dtype = numeric_value_dtype if method == "zscore" else bin_dtype
+        if output_field in schema.names:
+            schema = schema.remove(schema.get_field_index(output_field))
+        schema = schema.append(pa.field(output_field, dtype))
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.tmp"
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for rg in range(pf.num_row_groups):
+            table = pf.read_row_group(rg)
+            code_ids = vocabulary_indices(table.column(code_field), vocabulary)
+            values = table.column(numeric_value_field).cast(pa.float64()).to_numpy()
+            out, is_null = transform_values(code_ids, values, method, parameters)
+            column = pa.array(out, mask=is_null).cast(dtype)
+            if output_field in table.column_names:
+                table = table.drop([output_field])
+            table = table.append_column(output_field, column)
+            writer.write_table(table.select(schema.names).cast(schema))
+    os.replace(tmp_path, out_path)
+
+
+def _transform_shard(args) -> None:
+    transform_shard(*args)
+
+
+def normalize_dataset(
+    root: str,
+    output_root: str,
+    method: str = "zscore",
+    n_bins: int = 10,
+    output_field: str = numeric_value_field,
+    workers: int = 1,
+) -> None:
+    """Writes a copy of the dataset at `root` to `output_root` with every `numeric_value` normalized or binned.
+
+    Args:
+        root: The root of the MEDS dataset.
+        output_root: The root of the output dataset, which must differ from `root`.
+        method: `"zscore"` to standardize values by their code's mean and standard deviation, which requires the
+            code statistics of `meds.code_stats.write_code_stats`, or `"quantile_bins"` to replace them by the
+            index of their code's equal-frequency bin, in `[0, n_bins)`, which requires the quantile sketches of
+            `meds.sketches.write_sketches`.
+        n_bins: The number of bins of the `"quantile_bins"` method.
+        output_field: The column the results are written to: `numeric_value`, replacing the raw values, or a
+            custom property (float32 z-scores, or int32 bin indices) alongside them.
+        workers: The number of shards transformed in parallel.
+
+    Values are null in the output if they are null in the input, or if their code has no parameters. Row group
+    layouts are preserved, so the subject index of `root` is copied over with the other metadata files.
+    """
+    if os.path.abspath(root) == os.path.abspath(output_root):
+        raise ValueError("output_root must differ from root")
+    if method == "zscore":
+        vocabulary, mean, std = zscore_parameters(root)
+        params: Tuple[np.ndarray, ...] = (mean, std)
+    elif method == "quantile_bins":
+        vocabulary, edges = quantile_bin_edges(root, n_bins)
+        params = (edges,)
+    else:
+        raise ValueError(f"Unknown method '{method}'; expected 'zscore' or 'quantile_bins'")
+
+    jobs = [
+        (path, os.path.join(output_root, os.path.relpath(path, root)), vocabulary, method, params, output_field)
+        for path in data_shards(root)
+    ]
+    list(map_shards(_transform_shard, jobs, workers))
+
+    metadata_files = [
+        code_metadata_filepath,
+        subject_splits_filepath,
+        dataset_metadata_filepath,
+        subject_index_filepath,
+    ]
+    copy_files(root, output_root, metadata_files)
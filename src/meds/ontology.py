@@ -0,0 +1,204 @@
+"""An in-memory index of the code ontology defined by the `parent_codes` of the code metadata.
+
+The `parent_codes` of every code define a directed acyclic graph over codes, in which the ancestors of a code are
+its generalizations. `OntologyIndex` numbers every code and parent code, stores the parent relation as a CSR
+adjacency, and precomputes its transitive closure, also in CSR form, both from descendants to ancestors and from
+ancestors to descendants. Ancestry queries are then array lookups: `is_descendant` tests a whole array of codes
+against an ancestor with one gather into a boolean mask of the ancestor's descendants.
+
+The depth of a node is the length of the longest chain of ancestors above it, so that the roots of the ontology
+have depth 0. Rolling a code up to a depth maps it to its ancestors at that depth, or to itself if it is not
+deeper; `ancestors_at_depth` precomputes this mapping for every node as a CSR lookup table.
+"""
+
+import os
+from typing import Dict, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .schema import code_dtype, code_field, code_metadata_filepath, parent_codes_field
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Builds a CSR adjacency, with sorted, unique columns per row, from (row, column) pairs."""
+    pairs = np.unique(rows.astype(np.int64) * n + cols)
+    rows, cols = pairs // n, pairs % n
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols
+
+
+def _expand(indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns, for each node, the positions of its neighbors in a CSR adjacency, as (node position, neighbor)."""
+    counts = indptr[nodes + 1] - indptr[nodes]
+    positions = np.repeat(np.arange(len(nodes)), counts)
+    # The offset of each neighbor within its node's row.
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return positions, indices[indptr[nodes][positions] + offsets]
+
+
+def node_ids(nodes: pa.Array, codes: Union[pa.Array, pa.ChunkedArray]) -> np.ndarray:
+    """Returns the position of each code in the sorted `nodes` of an ontology, or -1 for null codes and codes not
+    in it. Dictionary-encoded codes are looked up by their dictionary only."""
+    if isinstance(codes, pa.ChunkedArray):
+        chunks = [node_ids(nodes, chunk) for chunk in codes.chunks]
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64)
+    if pa.types.is_dictionary(codes.type):
+        ids = pc.index_in(codes.dictionary.cast(code_dtype), value_set=nodes).take(codes.indices)
+    else:
+        ids = pc.index_in(codes.cast(code_dtype), value_set=nodes)
+    return pc.fill_null(ids, -1).to_numpy(zero_copy_only=False).astype(np.int64)
+
+
+class OntologyIndex:
+    """The ontology of `codes`, whose parents are given by the corresponding lists of `parent_codes`.
+
+    Every code and parent code is a node. Codes listed more than once have the union of their parents. Cycles
+    are tolerated: every node of a cycle is then an ancestor of every other.
+
+    Attributes:
+        nodes: The sorted codes of all nodes; a node's ID is its position here.
+        parent_indptr, parent_indices: The CSR adjacency from each node to its direct parents.
+        ancestor_indptr, ancestor_indices: The CSR adjacency from each node to all its ancestors (itself excluded).
+        descendant_indptr, descendant_indices: The CSR adjacency from each node to all its descendants (itself
+            excluded).
+        depths: The depth of each node.
+    """
+
+    def __init__(self, codes: Union[pa.Array, pa.ChunkedArray], parent_codes: Union[pa.Array, pa.ChunkedArray]):
+        if isinstance(codes, pa.ChunkedArray):
+            codes = codes.combine_chunks()
+        if isinstance(parent_codes, pa.ChunkedArray):
+            parent_codes = parent_codes.combine_chunks()
+        codes = codes.cast(code_dtype)
+        parents = pc.list_flatten(parent_codes).cast(code_dtype)
+        children = codes.take(pc.list_parent_indices(parent_codes))
+
+        nodes = pc.unique(pa.concat_arrays([codes, parents]).drop_null())
+        self.nodes = nodes.take(pc.sort_indices(nodes))
+        n = len(self.nodes)
+
+        child_ids, parent_ids = self.node_ids(children), self.node_ids(parents)
+        edges = (child_ids >= 0) & (parent_ids >= 0) & (child_ids != parent_ids)
+        self.parent_indptr, self.parent_indices = _csr(child_ids[edges], parent_ids[edges], n)
+
+        # The closure grows by following one more parent edge from the ancestors found in the previous round,
+        # until no new (descendant, ancestor) pairs are found. The closure found so far is kept sorted, so that
+        # candidates are tested against it with a binary search and each round's new pairs are merged into it in
+        # linear time, rather than re-sorting the whole closure every round.
+        closure = np.unique(child_ids[edges].astype(np.int64) * n + parent_ids[edges])
+        frontier = closure
+        while len(frontier):
+            positions, grandparents = _expand(self.parent_indptr, self.parent_indices, frontier % n)
+            candidates = np.unique((frontier // n)[positions] * n + grandparents)
+            candidates = candidates[candidates // n != candidates % n]
+            idx = np.searchsorted(closure, candidates)
+            known = closure[np.minimum(idx, len(closure) - 1)] == candidates
+            frontier = candidates[~known]
+            closure = np.insert(closure, idx[~known], frontier)
+
+        self.ancestor_indptr, self.ancestor_indices = _csr(closure // n, closure % n, n)
+        self.descendant_indptr, self.descendant_indices = _csr(closure % n, closure // n, n)
+
+        # Depths are relaxed along parent edges until they are stable, or for at most `n` rounds in case of cycles.
+        self.depths = np.zeros(n, dtype=np.int64)
+        for _ in range(n):
+            depths = self.depths.copy()
+            np.maximum.at(depths, child_ids[edges], self.depths[parent_ids[edges]] + 1)
+            if np.array_equal(depths, self.depths):
+                break
+            self.depths = depths
+
+        self._masks: Dict[int, np.ndarray] = {}
+        self._rollups: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def from_code_metadata(cls, root: str) -> "OntologyIndex":
+        """Builds the ontology index of the dataset at `root` from its `metadata/codes.parquet`."""
+        codes = pq.read_table(os.path.join(root, code_metadata_filepath), columns=[code_field, parent_codes_field])
+        return cls(codes.column(code_field), codes.column(parent_codes_field))
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def node_ids(self, codes: Union[pa.Array, pa.ChunkedArray]) -> np.ndarray:
+        """Returns the node ID of each code, or -1 for null codes and codes not in the ontology.
+
+        Dictionary-encoded codes are looked up by their dictionary only.
+        """
+        return node_ids(self.nodes, codes)
+
+    def _node_id(self, code: str) -> int:
+        node_id = int(self.node_ids(pa.array([code], code_dtype))[0])
+        if node_id < 0:
+            raise KeyError(f"Code '{code}' is not in the ontology")
+        return node_id
+
+    def _descendant_mask(self, node_id: int) -> np.ndarray:
+        # Masks have a trailing False entry, so that unknown codes (-1) map to False.
+        if node_id not in self._masks:
+            mask = np.zeros(len(self.nodes) + 1, dtype=bool)
+            mask[self.descendant_indices[self.descendant_indptr[node_id] : self.descendant_indptr[node_id + 1]]] = True
+            mask[node_id] = True
+            self._masks[node_id] = mask
+        return self._masks[node_id]
+
+    def is_descendant(
+        self, codes: Union[pa.Array, pa.ChunkedArray, np.ndarray], ancestor: str, include_self: bool = True
+    ) -> np.ndarray:
+        """Returns whether each code is a descendant of `ancestor` (or `ancestor` itself, if `include_self`).
+
+        `codes` may be codes, possibly dictionary-encoded, or node IDs from `node_ids`. Null codes and codes that
+        are not in the ontology are not descendants of anything.
+
+        Raises:
+            KeyError: If `ancestor` is not in the ontology.
+        """
+        node_id = self._node_id(ancestor)
+        ids = codes if isinstance(codes, np.ndarray) else self.node_ids(codes)
+        out = self._descendant_mask(node_id)[ids]
+        if not include_self:
+            out &= ids != node_id
+        return out
+
+    def expand_descendants(self, ancestor: str, include_self: bool = True) -> pa.Array:
+        """Returns the sorted codes of all descendants of `ancestor`, including itself if `include_self`.
+
+        Raises:
+            KeyError: If `ancestor` is not in the ontology.
+        """
+        node_id = self._node_id(ancestor)
+        ids = self.descendant_indices[self.descendant_indptr[node_id] : self.descendant_indptr[node_id + 1]]
+        if include_self:
+            ids = np.union1d(ids, [node_id])
+        return self.nodes.take(pa.array(ids, pa.int64()))
+
+    def ancestors_at_depth(self, depth: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the CSR lookup table from each node to the nodes it rolls up to at `depth`: its ancestors at that
+        depth if it is deeper, and itself otherwise.
+
+        Every node deeper than `depth` has at least one ancestor at that depth, on its longest chain of ancestors.
+        """
+        if depth not in self._rollups:
+            n = len(self.nodes)
+            positions, ancestors = _expand(self.ancestor_indptr, self.ancestor_indices, np.arange(n))
+            keep = (self.depths[positions] > depth) & (self.depths[ancestors] == depth)
+            shallow = np.flatnonzero(self.depths <= depth)
+            rows = np.concatenate([positions[keep], shallow])
+            self._rollups[depth] = _csr(rows, np.concatenate([ancestors[keep], shallow]), n)
+        return self._rollups[depth]
+
+    def ancestors(self, code: str, include_self: bool = False) -> pa.Array:
+        """Returns the sorted codes of all ancestors of `code`, including itself if `include_self`.
+
+        Raises:
+            KeyError: If `code` is not in the ontology.
+        """
+        node_id = self._node_id(code)
+        ids = self.ancestor_indices[self.ancestor_indptr[node_id] : self.ancestor_indptr[node_id + 1]]
+        if include_self:
+            ids = np.union1d(ids, [node_id])
+        return self.nodes.take(pa.array(ids, pa.int64()))
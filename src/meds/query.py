@@ -0,0 +1,124 @@
+"""Predicate pushdown reads of MEDS data shards by time window and subject.
+
+Row groups are pruned using the `time` and `subject_id` statistics in the parquet footers, so shards and row
+groups that cannot contain matching events are skipped without reading, let alone decompressing, any of their
+pages. Only the surviving row groups are decoded and filtered exactly.
+"""
+
+import datetime
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ._utils import row_group_statistics
+from .schema import subject_id_dtype, subject_id_field, time_dtype, time_field
+
+
+def _matching_row_groups(
+    metadata: pq.FileMetaData,
+    start: Optional[datetime.datetime],
+    end: Optional[datetime.datetime],
+    subject_ids: Optional[np.ndarray],
+    include_static: bool,
+) -> List[int]:
+    time_stats = row_group_statistics(metadata, time_field)
+    subject_stats = row_group_statistics(metadata, subject_id_field)
+
+    out = []
+    for rg in range(metadata.num_row_groups):
+        if metadata.row_group(rg).num_rows == 0:
+            continue
+
+        rg_time_stats = time_stats[rg]
+        if (start is not None or end is not None) and rg_time_stats is not None:
+            time_min, time_max, time_nulls = rg_time_stats
+            in_window = time_min is not None
+            in_window = in_window and (start is None or time_max >= start) and (end is None or time_min < end)
+            if not (in_window or (include_static and time_nulls)):
+                continue
+
+        rg_subject_stats = subject_stats[rg]
+        if subject_ids is not None and rg_subject_stats is not None:
+            subject_min, subject_max, _ = rg_subject_stats
+            if subject_min is None:
+                continue
+            # The first requested subject at or above the row group's minimum must not exceed its maximum.
+            lo = np.searchsorted(subject_ids, subject_min)
+            if lo == len(subject_ids) or subject_ids[lo] > subject_max:
+                continue
+
+        out.append(rg)
+    return out
+
+
+def _filter(
+    table: pa.Table,
+    start: Optional[datetime.datetime],
+    end: Optional[datetime.datetime],
+    subject_ids: Optional[pa.Array],
+    include_static: bool,
+) -> pa.Table:
+    mask = None
+    if start is not None or end is not None:
+        time = table.column(time_field)
+        # Kleene logic lets `is_valid` force null times to False, rather than propagating nulls into the mask.
+        in_window = pc.is_valid(time)
+        if start is not None:
+            in_window = pc.and_kleene(in_window, pc.greater_equal(time, pa.scalar(start, time_dtype)))
+        if end is not None:
+            in_window = pc.and_kleene(in_window, pc.less(time, pa.scalar(end, time_dtype)))
+        mask = pc.or_(in_window, pc.is_null(time)) if include_static else in_window
+    if subject_ids is not None:
+        in_subjects = pc.is_in(table.column(subject_id_field), value_set=subject_ids)
+        mask = in_subjects if mask is None else pc.and_(mask, in_subjects)
+    return table if mask is None else table.filter(mask)
+
+
+def read_events(
+    paths: Sequence[str],
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    subject_ids: Optional[Iterable[int]] = None,
+    columns: Optional[Sequence[str]] = None,
+    include_static: bool = False,
+) -> Iterator[pa.Table]:
+    """Yields the events of the given data shards that fall in a time window and belong to a set of subjects.
+
+    Args:
+        paths: The data shards to read.
+        start: If set, only events with `time >= start` are returned.
+        end: If set, only events with `time < end` are returned.
+        subject_ids: If set, only events of these subjects are returned.
+        columns: The columns to return. Defaults to all columns.
+        include_static: If set, static events (with a null `time`) of the selected subjects are returned
+            regardless of the time window.
+
+    Yields:
+        The matching events of each row group that may contain any, in on-disk order. Row groups whose footer
+        statistics rule them out are never read.
+    """
+    subject_id_array = None
+    sorted_subject_ids = None
+    if subject_ids is not None:
+        if not isinstance(subject_ids, (np.ndarray, pa.Array)):
+            subject_ids = list(subject_ids)
+        sorted_subject_ids = np.unique(np.asarray(subject_ids, dtype=np.int64))
+        if len(sorted_subject_ids) == 0:
+            return
+        subject_id_array = pa.array(sorted_subject_ids, subject_id_dtype)
+
+    for path in paths:
+        pf = pq.ParquetFile(path)
+        row_groups = _matching_row_groups(pf.metadata, start, end, sorted_subject_ids, include_static)
+
+        read_columns = None
+        if columns is not None:
+            read_columns = list(dict.fromkeys([*columns, time_field, subject_id_field]))
+
+        for rg in row_groups:
+            table = _filter(pf.read_row_group(rg, columns=read_columns), start, end, subject_id_array, include_static)
+            if table.num_rows:
+                yield table if columns is None else table.select(columns)
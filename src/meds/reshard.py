@@ -0,0 +1,142 @@
+"""Resharding of MEDS data into shards of a target size.
+
+A subject must be in one and only one data shard, so shards cannot be split at arbitrary rows. `reshard` plans
+output shards over the subjects of the dataset, in on-disk order, so that each output shard holds a contiguous
+sequence of whole subjects. Every output shard is then a concatenation of row ranges of the input shards, which
+preserves subject contiguity and per-subject time order without sorting anything.
+
+Output shards are written in parallel, and each is streamed one input row group at a time, so memory use is
+bounded by the input row group size plus the output row group size.
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ._utils import ShardWriter, copy_files, data_shards, map_shards, run_bounds
+from .index import _index_shard, length_field, row_group_field, row_offset_field, shard_field
+from .schema import (
+    code_metadata_filepath,
+    data_subdirectory,
+    dataset_metadata_filepath,
+    subject_id_field,
+    subject_splits_filepath,
+)
+
+# A (shard, row group, row offset, length) range of rows of an input shard.
+_Chunk = Tuple[str, int, int, int]
+
+
+def _bytes_per_row(path: str) -> float:
+    metadata = pq.ParquetFile(path).metadata
+    n_bytes = sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+    return n_bytes / max(metadata.num_rows, 1)
+
+
+def plan_shards(
+    root: str, max_events: Optional[int] = None, max_bytes: Optional[int] = None, workers: int = 1
+) -> List[List[_Chunk]]:
+    """Plans output shards of whole subjects, in on-disk order, with at most about `max_events` events or
+    `max_bytes` uncompressed bytes each.
+
+    Subjects are packed greedily: a new output shard starts with the first subject that starts past the next
+    multiple of the target size, so a shard can only exceed the target by its last subject. A subject larger than
+    the target always gets a shard of its own.
+
+    Returns:
+        For each output shard, the row ranges of the input shards it is made of, in order.
+    """
+    if (max_events is None) == (max_bytes is None):
+        raise ValueError("Exactly one of max_events and max_bytes must be set")
+
+    shards = data_shards(root)
+    tables = list(map_shards(_index_shard, [(path, root) for path in shards], workers))
+    entries = pa.concat_tables(tables) if tables else None
+    if entries is None or entries.num_rows == 0:
+        return []
+
+    shard_names = entries.column(shard_field).to_pylist()
+    subject_ids = entries.column(subject_id_field).to_numpy()
+    lengths = entries.column(length_field).to_numpy()
+
+    if max_bytes is not None:
+        bytes_per_row = dict(zip(shards, map_shards(_bytes_per_row, shards, workers)))
+        shard_bytes = {os.path.relpath(path, root).replace(os.sep, "/"): b for path, b in bytes_per_row.items()}
+        weights = lengths * np.array([shard_bytes[name] for name in shard_names])
+        target = float(max_bytes)
+    elif max_events is not None:
+        weights = lengths.astype(np.float64)
+        target = float(max_events)
+
+    # Entries are in on-disk order, so the entries of each subject are consecutive.
+    bounds = run_bounds(subject_ids)
+    subject_weights = np.add.reduceat(weights, bounds[:-1])
+    subject_starts = np.concatenate([[0.0], np.cumsum(subject_weights)[:-1]])
+    bucket = np.floor(subject_starts / target)
+    # Subjects larger than the target are cut off from both of their neighbours.
+    oversized = subject_weights > target
+    new_shard = np.zeros(len(subject_weights), dtype=bool)
+    new_shard[1:] = (bucket[1:] != bucket[:-1]) | oversized[1:] | oversized[:-1]
+    subject_out_shard = np.cumsum(new_shard)
+    entry_out_shard = np.repeat(subject_out_shard, np.diff(bounds))
+
+    chunks = list(
+        zip(
+            [os.path.join(root, *name.split("/")) for name in shard_names],
+            entries.column(row_group_field).to_pylist(),
+            entries.column(row_offset_field).to_pylist(),
+            lengths.tolist(),
+        )
+    )
+    out_bounds = run_bounds(entry_out_shard)
+    return [chunks[start:end] for start, end in zip(out_bounds[:-1], out_bounds[1:])]
+
+
+def write_shard(chunks: List[_Chunk], out_path: str, row_group_size: int) -> None:
+    """Writes the concatenation of row ranges of input shards to a new shard, reading one row group at a time."""
+    # Consecutive chunks usually come from the same input file, and often from the same row group.
+    pf = pq.ParquetFile(chunks[0][0])
+    row_group = pf.read_row_group(chunks[0][1])
+    with ShardWriter(out_path, pf.schema_arrow, row_group_size) as writer:
+        for i, (path, rg, offset, length) in enumerate(chunks):
+            if i > 0 and path != chunks[i - 1][0]:
+                pf = pq.ParquetFile(path)
+            if i > 0 and (path, rg) != chunks[i - 1][:2]:
+                row_group = pf.read_row_group(rg)
+            writer.write(row_group.slice(offset, length))
+
+
+def _write_shard(args) -> None:
+    write_shard(*args)
+
+
+def reshard(
+    root: str,
+    output_root: str,
+    max_events: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    row_group_size: int = 1024 * 1024,
+    workers: int = 1,
+) -> List[str]:
+    """Rewrites the data shards of the dataset at `root` into `output_root/data/{i}.parquet` shards of a target
+    size, given as a number of events (`max_events`) or uncompressed bytes (`max_bytes`).
+
+    Subjects are never split across shards, and their events keep their order. The code metadata, subject split
+    and dataset metadata files are copied over; any subject index or cache of the input is not, as it would be
+    invalid for the new shards.
+
+    Returns:
+        The paths of the output shards.
+    """
+    if os.path.abspath(root) == os.path.abspath(output_root):
+        raise ValueError("output_root must differ from root")
+
+    plan = plan_shards(root, max_events=max_events, max_bytes=max_bytes, workers=workers)
+    out_paths = [os.path.join(output_root, data_subdirectory, f"{i}.parquet") for i in range(len(plan))]
+    list(map_shards(_write_shard, [(c, p, row_group_size) for c, p in zip(plan, out_paths)], workers))
+
+    copy_files(root, output_root, [code_metadata_filepath, subject_splits_filepath, dataset_metadata_filepath])
+    return out_paths
@@ -0,0 +1,129 @@
+"""Rollup of event codes to their ancestors at a chosen depth of the code ontology.
+
+Every event's code is mapped to the codes it rolls up to at the chosen depth (see
+`meds.ontology.OntologyIndex.ancestors_at_depth`): its ancestors at that depth, of which there may be several
+since codes can have several parents, or itself if it is not deeper. Codes that are not in the ontology roll up to
+themselves. The mapping is a CSR lookup table over ontology node IDs, and each row group's codes are mapped to
+node IDs through their dictionary, so rows are rolled up by array gathers alone.
+
+The rolled-up codes are either added to each event as a list column, or replace the event's code, with one copy
+of the event per rolled-up code, which yields valid MEDS shards of rolled-up events.
+"""
+
+import os
+from typing import Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ._utils import copy_files, data_shards, map_shards
+from .index import subject_index_filepath
+from .ontology import OntologyIndex, node_ids
+from .schema import code_dtype, code_field, code_metadata_filepath, dataset_metadata_filepath, subject_splits_filepath
+
+rollup_codes_field = "rollup_codes"
+
+
+# The nodes of an ontology and its `ancestors_at_depth` lookup table at the rollup depth: all that rolling up codes
+# needs, and far smaller than the whole `OntologyIndex` to send to worker processes.
+_Lookup = Tuple[pa.Array, np.ndarray, np.ndarray]
+
+
+def _lookup(ontology: OntologyIndex, depth: int) -> _Lookup:
+    return (ontology.nodes, *ontology.ancestors_at_depth(depth))
+
+
+def _rollup_codes(lookup: _Lookup, codes: Union[pa.Array, pa.ChunkedArray]) -> pa.ListArray:
+    nodes, indptr, indices = lookup
+    ids = node_ids(nodes, codes)
+    known = ids >= 0
+
+    lengths = np.where(known, indptr[np.maximum(ids, 0) + 1] - indptr[np.maximum(ids, 0)], 1)
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int32)
+    row_of = np.repeat(np.arange(len(ids)), lengths)
+    within = np.arange(offsets[-1]) - offsets[:-1][row_of]
+
+    # Rolled-up codes are node IDs, except for those of unknown codes, which index the unknown codes themselves,
+    # placed after the nodes. Only the unknown codes need to be decoded.
+    unknown_rank = np.cumsum(~known) - 1
+    values = np.where(
+        known[row_of], indices[indptr[np.maximum(ids, 0)][row_of] + within], len(nodes) + unknown_rank[row_of]
+    )
+    unknown = codes.take(pa.array(np.flatnonzero(~known), pa.int64())).cast(code_dtype)
+    if isinstance(unknown, pa.ChunkedArray):
+        unknown = unknown.combine_chunks() if unknown.num_chunks else pa.array([], code_dtype)
+    strings = pa.concat_arrays([nodes, unknown]).take(pa.array(values, pa.int64()))
+    return pa.ListArray.from_arrays(pa.array(offsets), strings)
+
+
+def rollup_codes(ontology: OntologyIndex, codes: Union[pa.Array, pa.ChunkedArray], depth: int) -> pa.ListArray:
+    """Returns, for each code, the list of codes it rolls up to at `depth`, in sorted order."""
+    return _rollup_codes(_lookup(ontology, depth), codes)
+
+
+def _rollup_table(lookup: _Lookup, table: pa.Table, explode: bool) -> pa.Table:
+    rolled_up = _rollup_codes(lookup, table.column(code_field))
+    if not explode:
+        return table.append_column(rollup_codes_field, rolled_up)
+    rows = np.repeat(np.arange(table.num_rows), np.diff(rolled_up.offsets.to_numpy()))
+    table = table.take(pa.array(rows, pa.int64()))
+    return table.set_column(table.schema.get_field_index(code_field), code_field, rolled_up.flatten())
+
+
+def rollup_table(ontology: OntologyIndex, table: pa.Table, depth: int, explode: bool = False) -> pa.Table:
+    """Rolls up the codes of a table of events to `depth`.
+
+    If `explode` is set, each event is repeated once per code it rolls up to, in place, with that code as its
+    `code`, so that the order of events is preserved. Otherwise, the codes are added as a `rollup_codes` list
+    column.
+    """
+    return _rollup_table(_lookup(ontology, depth), table, explode)
+
+
+def _write_rollup(path: str, out_path: str, lookup: _Lookup, explode: bool) -> None:
+    pf = pq.ParquetFile(path, read_dictionary=[code_field])
+    schema = pq.read_schema(path)
+    if not explode:
+        schema = schema.append(pa.field(rollup_codes_field, pa.list_(code_dtype)))
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.tmp"
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for rg in range(pf.num_row_groups):
+            table = _rollup_table(lookup, pf.read_row_group(rg), explode)
+            writer.write_table(table.select(schema.names).cast(schema))
+    os.replace(tmp_path, out_path)
+
+
+def rollup_shard(path: str, out_path: str, ontology: OntologyIndex, depth: int, explode: bool = False) -> None:
+    """Writes the rollup of a data shard to `depth`, row group by row group."""
+    _write_rollup(path, out_path, _lookup(ontology, depth), explode)
+
+
+def _rollup_shard(args) -> None:
+    _write_rollup(*args)
+
+
+def rollup_dataset(root: str, output_root: str, depth: int, explode: bool = False, workers: int = 1) -> None:
+    """Writes a copy of the dataset at `root` to `output_root` with its codes rolled up to `depth` of the ontology
+    in its `metadata/codes.parquet`, with shards processed over `workers` processes.
+
+    With `explode`, each event is replaced by one event per rolled-up code; otherwise, the rolled-up codes are
+    added as a `rollup_codes` list column, and row group layouts are preserved, so any subject index is copied
+    over with the other metadata files.
+    """
+    if os.path.abspath(root) == os.path.abspath(output_root):
+        raise ValueError("output_root must differ from root")
+
+    # The lookup table is built once here, and only it is sent to the workers.
+    lookup = _lookup(OntologyIndex.from_code_metadata(root), depth)
+    jobs = [
+        (path, os.path.join(output_root, os.path.relpath(path, root)), lookup, explode) for path in data_shards(root)
+    ]
+    list(map_shards(_rollup_shard, jobs, workers))
+
+    metadata_files = [code_metadata_filepath, subject_splits_filepath, dataset_metadata_filepath]
+    if not explode:
+        metadata_files.append(subject_index_filepath)
+    copy_files(root, output_root, metadata_files)
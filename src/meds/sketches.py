@@ -0,0 +1,162 @@
+"""Mergeable per-code quantile sketches of `numeric_value`.
+
+Each code's values are summarized by a t-digest: a small set of weighted centroids, sorted by value, that are
+small near the tails of the distribution and large near its median, so that extreme quantiles stay accurate. A
+sketch is compressed by assigning each centroid, by the quantile at its center, to a bucket of the arcsine scale
+function `k(q) = compression * (asin(2q - 1) / pi + 1 / 2)` and merging the centroids of each bucket; a sketch has
+at most `compression + 1` centroids, whatever the number of values it summarizes.
+
+All sketches of a dataset are stored in a single table with one row per (code, centroid), so that building,
+merging and querying the sketches of every code is a handful of vectorized operations rather than a loop over
+codes. Sketches are merged by concatenating and recompressing them, so per-shard sketches computed in parallel
+merge into the sketches of the whole dataset. They are persisted as a sidecar to the code metadata, in
+`metadata/code_quantile_sketches.parquet`, and can be queried for any quantiles without rescanning the data.
+"""
+
+import os
+from typing import Iterable, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ._utils import data_shards, grouped_searchsorted, map_shards, run_bounds
+from .schema import code_field, numeric_value_field
+
+code_sketches_filepath = os.path.join("metadata", "code_quantile_sketches.parquet")
+
+mean_field = "mean"
+weight_field = "weight"
+
+code_sketch_schema = pa.schema(
+    [
+        (code_field, pa.string()),
+        # The mean of the values in a centroid, and their number.
+        (mean_field, pa.float64()),
+        (weight_field, pa.int64()),
+    ]
+)
+
+
+def _sorted_centroids(sketches: pa.Table):
+    sketches = sketches.sort_by([(code_field, "ascending"), (mean_field, "ascending")])
+    codes = sketches.column(code_field).combine_chunks().dictionary_encode().indices.to_numpy()
+    bounds = run_bounds(codes)
+    group = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+
+    weights = sketches.column(weight_field).to_numpy().astype(np.float64)
+    totals = np.add.reduceat(weights, bounds[:-1]) if len(weights) else np.zeros(0)
+    cumulative = np.cumsum(weights)
+    # The total weight of the centroids before each one, within its code.
+    before = cumulative - weights - (cumulative - weights)[bounds[:-1]][group]
+    return sketches, bounds, group, weights, totals, before
+
+
+def compress_sketches(sketches: pa.Table, compression: int = 100) -> pa.Table:
+    """Compresses every code's sketch to at most `compression + 1` centroids."""
+    sketches, _, group, weights, totals, before = _sorted_centroids(sketches)
+    if sketches.num_rows == 0:
+        return sketches
+
+    q = (before + weights / 2) / totals[group]
+    bucket = np.floor(compression * (np.arcsin(2 * q - 1) / np.pi + 0.5)).astype(np.int64)
+    starts = np.union1d(run_bounds(group), run_bounds(bucket))[:-1]
+
+    merged_weights = np.add.reduceat(weights, starts)
+    means = sketches.column(mean_field).to_numpy()
+    return pa.table(
+        {
+            code_field: sketches.column(code_field).take(pa.array(starts)),
+            mean_field: np.add.reduceat(means * weights, starts) / merged_weights,
+            weight_field: merged_weights.astype(np.int64),
+        },
+        schema=code_sketch_schema,
+    )
+
+
+def shard_sketches(path: str, compression: int = 100) -> pa.Table:
+    """Sketches the non-null, non-NaN `numeric_value`s of each code of a single data shard."""
+    table = pq.read_table(path, columns=[code_field, numeric_value_field])
+    values = table.column(numeric_value_field).cast(pa.float64())
+    keep = pc.and_(pc.is_valid(values), pc.invert(pc.is_nan(values)))
+    table = pa.table({code_field: table.column(code_field).cast(pa.string()), mean_field: values}).filter(keep)
+
+    # Repeated values are exact centroids of their own, which makes sketches of discrete values lossless.
+    counts = table.group_by([code_field, mean_field]).aggregate([(mean_field, "count")])
+    sketches = pa.table(
+        [counts.column(code_field), counts.column(mean_field), counts.column(f"{mean_field}_count")],
+        schema=code_sketch_schema,
+    )
+    return compress_sketches(sketches, compression)
+
+
+def merge_sketches(partials: Iterable[pa.Table], compression: int = 100) -> pa.Table:
+    """Merges partial sketches (e.g., of different shards) into sketches of all their values."""
+    return compress_sketches(pa.concat_tables([code_sketch_schema.empty_table(), *partials]), compression)
+
+
+def _shard_sketches(args) -> pa.Table:
+    return shard_sketches(*args)
+
+
+def compute_sketches(root: str, compression: int = 100, workers: int = 1, merge_every: int = 64) -> pa.Table:
+    """Computes the quantile sketches of every code of the dataset at `root` in a single pass over its shards.
+
+    Shards are sketched over `workers` processes, and their sketches are merged as they arrive, every
+    `merge_every` shards.
+    """
+    sketches = code_sketch_schema.empty_table()
+    pending = []
+    for partial in map_shards(_shard_sketches, [(path, compression) for path in data_shards(root)], workers):
+        pending.append(partial)
+        if len(pending) >= merge_every:
+            sketches = merge_sketches([sketches] + pending, compression)
+            pending = []
+    return merge_sketches([sketches] + pending, compression)
+
+
+def write_sketches(root: str, sketches: pa.Table) -> str:
+    """Writes sketches to `metadata/code_quantile_sketches.parquet` under `root`, returning its path."""
+    path = os.path.join(root, code_sketches_filepath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(sketches, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_sketches(root: str) -> pa.Table:
+    """Loads the sketches persisted by `write_sketches`."""
+    return pq.read_table(os.path.join(root, code_sketches_filepath)).cast(code_sketch_schema)
+
+
+def sketch_quantiles(sketches: pa.Table, quantiles: Sequence[float]) -> pa.Table:
+    """Estimates the given quantiles of every code's values from their sketches.
+
+    Quantiles are interpolated linearly between the centers of adjacent centroids, and clamped to the means of
+    the first and last centroids.
+
+    Returns:
+        A table of the sketched codes, in sorted order, with one `values/quantile/{q}` column per quantile.
+    """
+    sketches, bounds, group, weights, totals, before = _sorted_centroids(sketches)
+    means = sketches.column(mean_field).to_numpy()
+    centers = before + weights / 2
+
+    n_codes, qs = len(totals), np.asarray(quantiles, dtype=np.float64)
+    query_groups = np.repeat(np.arange(n_codes), len(qs))
+    targets = (totals[:, None] * qs[None, :]).ravel()
+    hi = grouped_searchsorted(group, centers, query_groups, targets, side="right")
+
+    starts, ends = bounds[:-1][query_groups], bounds[1:][query_groups]
+    lo = np.clip(hi - 1, starts, ends - 1)
+    hi = np.clip(hi, starts, ends - 1)
+    span = centers[hi] - centers[lo]
+    fraction = np.divide(targets - centers[lo], span, out=np.zeros_like(targets), where=span > 0)
+    estimates = (means[lo] + np.clip(fraction, 0, 1) * (means[hi] - means[lo])).reshape(n_codes, len(qs))
+
+    out = {code_field: sketches.column(code_field).take(pa.array(bounds[:-1]))}
+    for i, q in enumerate(quantiles):
+        out[f"values/quantile/{q}"] = estimates[:, i]
+    return pa.table(out)
@@ -0,0 +1,232 @@
+"""Out-of-core sorting of raw events into spec-conformant MEDS data shards.
+
+MEDS data shards must hold each subject's events contiguously and sorted by time. `sort_events` produces such
+shards from arbitrarily ordered event files that need not fit in memory, with a classic external merge sort
+keyed on `(subject_id, time)`:
+
+1. Run generation: input files are streamed, in parallel, in pieces that fit a share of the memory budget. Each
+   piece is sorted and spilled to local disk as an Arrow IPC run file.
+2. Merge: all runs are memory-mapped and merged k ways, a chunk of each run at a time. At each step, every row up
+   to the smallest last key of any run's chunk is safe to emit, so those rows are gathered from all runs, sorted
+   together, and streamed into the output shards, starting a new shard at the first subject boundary after
+   `events_per_shard` events.
+
+Static events (null `time`) sort first within each subject, and ties keep their input order: runs are numbered
+in input order, and ties are broken by run number and then by position within the run. Rows equal to the
+frontier key are held back in every run numbered after the run that sets the frontier, as that run may still
+have more of them in its next chunk.
+"""
+
+import os
+import shutil
+import tempfile
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ._utils import ShardWriter, map_shards, times_as_int64
+from .schema import data_schema, data_subdirectory, subject_id_field, time_field
+
+# The minimum number of rows of each run loaded at once during the merge.
+_MIN_CHUNK_ROWS = 1024
+
+
+def _sort_keys(table: pa.Table) -> Tuple[np.ndarray, np.ndarray]:
+    return table.column(subject_id_field).to_numpy(), times_as_int64(table.column(time_field))
+
+
+def _sort(table: pa.Table) -> pa.Table:
+    subject_ids, times = _sort_keys(table)
+    return table.take(pa.array(np.lexsort((times, subject_ids))))
+
+
+def generate_runs(path: str, schema: pa.Schema, run_prefix: str, run_budget: int, batch_size: int = 65536) -> List[str]:
+    """Splits an input file into sorted runs of at most about `run_budget` bytes each, spilled as IPC files.
+
+    Returns:
+        The paths of the run files, `{run_prefix}_{i}.arrow`.
+    """
+    runs: List[str] = []
+    buffer: List[pa.Table] = []
+    n_bytes = 0
+
+    def spill():
+        run_path = f"{run_prefix}_{len(runs)}.arrow"
+        table = _sort(pa.concat_tables(buffer))
+        with pa.ipc.new_file(run_path, schema) as writer:
+            writer.write_table(table, max_chunksize=batch_size)
+        runs.append(run_path)
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=schema.names):
+        table = pa.Table.from_batches([batch]).select(schema.names).cast(schema)
+        if table.column(subject_id_field).null_count:
+            raise ValueError(f"{path}: '{subject_id_field}' contains nulls")
+        buffer.append(table)
+        n_bytes += table.nbytes
+        if n_bytes >= run_budget:
+            spill()
+            buffer, n_bytes = [], 0
+    if buffer:
+        spill()
+    return runs
+
+
+def _generate_runs(args) -> List[str]:
+    return generate_runs(*args)
+
+
+class _Run:
+    """A memory-mapped sorted run, consumed a chunk at a time."""
+
+    def __init__(self, path: str, chunk_size: int):
+        self.table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        self.chunk_size = chunk_size
+        self.pos = 0
+        self._refill()
+
+    def _refill(self) -> None:
+        self.chunk = self.table.slice(self.pos, self.chunk_size)
+        self.subject_ids, self.times = _sort_keys(self.chunk)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.chunk.num_rows == 0
+
+    @property
+    def last_key(self) -> Tuple[int, int]:
+        return self.subject_ids[-1], self.times[-1]
+
+    def take_until(self, key: Tuple[int, int], inclusive: bool = True) -> pa.Table:
+        """Consumes and returns the rows of the current chunk with sort keys less than (or, if `inclusive`, equal
+        to) `key`."""
+        subject_id, time = key
+        lo, hi = np.searchsorted(self.subject_ids, [subject_id, subject_id + 1])
+        n = lo + np.searchsorted(self.times[lo:hi], time, side="right" if inclusive else "left")
+
+        out = self.chunk.slice(0, n)
+        self.pos += n
+        if n == self.chunk.num_rows:
+            self._refill()
+        else:
+            self.chunk = self.chunk.slice(n)
+            self.subject_ids, self.times = self.subject_ids[n:], self.times[n:]
+        return out
+
+
+class _ShardedOutput:
+    """Streams sorted events into consecutive shards, starting a new shard at the first subject boundary at or
+    after `events_per_shard` events."""
+
+    def __init__(self, output_root: str, schema: pa.Schema, events_per_shard: int, row_group_size: int):
+        self.output_root = output_root
+        self.schema = schema
+        self.events_per_shard = events_per_shard
+        self.row_group_size = row_group_size
+        self.paths: List[str] = []
+        self._writer: Optional[ShardWriter] = None
+        self._last_subject: Optional[int] = None
+
+    def write(self, table: pa.Table) -> None:
+        while table.num_rows:
+            if self._writer is None:
+                path = os.path.join(self.output_root, data_subdirectory, f"{len(self.paths)}.parquet")
+                self._writer = ShardWriter(path, self.schema, self.row_group_size)
+                self.paths.append(path)
+
+            room = self.events_per_shard - self._writer.num_rows
+            subject_ids = table.column(subject_id_field).to_numpy()
+            if table.num_rows > room:
+                boundaries: np.ndarray = np.flatnonzero(subject_ids[1:] != subject_ids[:-1]) + 1
+                if self._writer.num_rows and subject_ids[0] != self._last_subject:
+                    boundaries = np.concatenate([[0], boundaries])
+                boundaries = boundaries[boundaries >= room]
+                if len(boundaries):
+                    split = int(boundaries[0])
+                    self._writer.write(table.slice(0, split))
+                    self._writer.close()
+                    self._writer = None
+                    self._last_subject = None
+                    table = table.slice(split)
+                    continue
+
+            self._writer.write(table)
+            self._last_subject = subject_ids[-1]
+            return
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def merge_runs(
+    run_paths: Sequence[str],
+    output_root: str,
+    schema: pa.Schema,
+    memory_budget: int,
+    events_per_shard: int,
+    row_group_size: int,
+) -> List[str]:
+    """K-way merges sorted runs into data shards under `output_root`, using about `memory_budget` bytes.
+
+    Returns:
+        The paths of the shards written.
+    """
+    tables = [pa.ipc.open_file(pa.memory_map(p)).read_all() for p in run_paths]
+    n_rows = sum(t.num_rows for t in tables)
+    bytes_per_row = max(sum(t.nbytes for t in tables) / max(n_rows, 1), 1.0)
+    chunk_size = max(int(memory_budget / (bytes_per_row * max(len(run_paths), 1))), _MIN_CHUNK_ROWS)
+    del tables
+
+    runs = [_Run(p, chunk_size) for p in run_paths]
+    runs = [r for r in runs if not r.exhausted]
+    output = _ShardedOutput(output_root, schema, events_per_shard, row_group_size)
+    while runs:
+        # Every row up to the smallest last key of any chunk precedes all rows not yet loaded, save for rows tied
+        # with it in later runs, which must follow the tied rows of the frontier run that are not yet loaded.
+        frontier, frontier_run = min((r.last_key, i) for i, r in enumerate(runs))
+        pieces = [r.take_until(frontier, inclusive=i <= frontier_run) for i, r in enumerate(runs)]
+        # The pieces are in run order and the sort is stable, so ties are emitted in run order.
+        output.write(_sort(pa.concat_tables([p for p in pieces if p.num_rows])))
+        runs = [r for r in runs if not r.exhausted]
+    output.close()
+    return output.paths
+
+
+def sort_events(
+    paths: Sequence[str],
+    output_root: str,
+    custom_properties=[],
+    memory_budget: int = 1 << 30,
+    events_per_shard: int = 10_000_000,
+    row_group_size: int = 1024 * 1024,
+    workers: int = 1,
+    tmp_dir: Optional[str] = None,
+) -> List[str]:
+    """Sorts the events in the parquet files `paths` into MEDS data shards `output_root/data/{i}.parquet`.
+
+    Args:
+        paths: Parquet files of events with the columns of `data_schema(custom_properties)`, in any order.
+        output_root: The MEDS root under which the sorted shards are written.
+        custom_properties: The custom properties of the output data schema.
+        memory_budget: The approximate number of bytes of event data held in memory at once, in total across
+            run generation workers and during the merge.
+        events_per_shard: The target shard size. Shards end at the first subject boundary past this size.
+        row_group_size: The row group size of the output shards.
+        workers: The number of processes generating runs in parallel.
+        tmp_dir: The directory under which runs are spilled. Defaults to the system temporary directory.
+
+    Returns:
+        The paths of the output shards, which are in `data_schema(custom_properties)` form.
+    """
+    schema = data_schema(custom_properties)
+    run_dir = tempfile.mkdtemp(prefix="meds_sort_", dir=tmp_dir)
+    try:
+        run_budget = max(memory_budget // max(workers, 1), 1)
+        jobs = [(path, schema, os.path.join(run_dir, str(i)), run_budget) for i, path in enumerate(paths)]
+        run_paths = [run for runs in map_shards(_generate_runs, jobs, workers) for run in runs]
+        return merge_runs(run_paths, output_root, schema, memory_budget, events_per_shard, row_group_size)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
@@ -0,0 +1,46 @@
+"""A minimal compressed sparse row (CSR) matrix, convertible to scipy without depending on it."""
+
+from typing import Tuple
+
+import numpy as np
+
+
+class SparseMatrix:
+    """A CSR matrix of shape `shape`: the nonzero entries of row `i` are `data[indptr[i]:indptr[i + 1]]`, in the
+    columns `indices[indptr[i]:indptr[i + 1]]`, which are sorted and unique within each row.
+
+    This is the layout of `scipy.sparse.csr_matrix`, to which `to_scipy` converts without copying.
+    """
+
+    def __init__(self, data: np.ndarray, indices: np.ndarray, indptr: np.ndarray, shape: Tuple[int, int]):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = shape
+
+    @classmethod
+    def from_coo(cls, rows: np.ndarray, cols: np.ndarray, data: np.ndarray, shape: Tuple[int, int]) -> "SparseMatrix":
+        """Builds a CSR matrix from `(row, column, value)` triplets, which must not repeat any `(row, column)`."""
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        return cls(data[order], cols[order].astype(np.int64), indptr, shape)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.data)
+
+    def to_scipy(self):
+        """Returns the matrix as a `scipy.sparse.csr_matrix`, sharing its arrays. Requires scipy."""
+        try:
+            import scipy.sparse
+        except ImportError as e:
+            raise ImportError("scipy is required to convert to scipy.sparse; install meds[sparse]") from e
+        return scipy.sparse.csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+    def toarray(self) -> np.ndarray:
+        """Returns the matrix as a dense array."""
+        out = np.zeros(self.shape, dtype=self.data.dtype)
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        out[rows, self.indices] = self.data
+        return out
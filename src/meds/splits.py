@@ -0,0 +1,102 @@
+"""Deterministic, hash-based generation of subject splits.
+
+Each subject is assigned to a split by a seeded hash of its ID alone, so assignments are reproducible across
+reruns, machines and worker counts, need no global state or shuffle, and do not change for existing subjects when
+new subjects are added. Subject IDs are streamed from the `subject_id` columns of the data shards, one shard at a
+time, so memory use is bounded by the largest shard's subject count.
+"""
+
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ._utils import data_shards, map_shards
+from .schema import (
+    held_out_split,
+    split_field,
+    subject_id_field,
+    subject_split_schema,
+    subject_splits_filepath,
+    train_split,
+    tuning_split,
+)
+
+default_split_fractions = {train_split: 0.8, tuning_split: 0.1, held_out_split: 0.1}
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    # The SplitMix64 finalizer, a fast bijective mixer of 64-bit integers; uint64 arithmetic wraps around.
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def hash_unit_interval(subject_ids: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Hashes subject IDs, with a seed, to floats uniformly distributed in `[0, 1)`."""
+    with np.errstate(over="ignore"):
+        x = subject_ids.astype(np.int64).view(np.uint64) ^ _splitmix64(np.array([seed], dtype=np.uint64))
+        h = _splitmix64(x)
+    # The top 53 bits are exactly representable as a float64 mantissa.
+    return (h >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def assign_splits(subject_ids: np.ndarray, fractions: Dict[str, float], seed: int = 0) -> pa.Array:
+    """Assigns each subject to a split, with probabilities proportional to `fractions`, by a seeded hash."""
+    weights = np.array(list(fractions.values()), dtype=np.float64)
+    if len(weights) == 0 or (weights < 0).any() or weights.sum() <= 0:
+        raise ValueError(f"Split fractions must be non-negative and not all zero; got {fractions}")
+    cumulative = np.cumsum(weights) / weights.sum()
+    codes = np.searchsorted(cumulative, hash_unit_interval(subject_ids, seed), side="right")
+    # Guard against rounding in the last cumulative fraction.
+    codes = np.minimum(codes, len(weights) - 1)
+    return pa.array(list(fractions.keys()), pa.string()).take(pa.array(codes))
+
+
+def shard_splits(path: str, fractions: Dict[str, float], seed: int = 0) -> pa.Table:
+    """Assigns the subjects of a single data shard to splits, reading only its `subject_id` column."""
+    subject_ids = np.unique(pq.read_table(path, columns=[subject_id_field]).column(0).to_numpy())
+    return pa.table(
+        {subject_id_field: subject_ids, split_field: assign_splits(subject_ids, fractions, seed)},
+        schema=subject_split_schema,
+    )
+
+
+def _shard_splits(args) -> pa.Table:
+    return shard_splits(*args)
+
+
+def generate_subject_splits(
+    root: str,
+    fractions: Optional[Dict[str, float]] = None,
+    seed: int = 0,
+    workers: int = 1,
+    output_path: Optional[str] = None,
+) -> str:
+    """Writes a subject split file for the dataset at `root`, assigning every subject a split by a seeded hash.
+
+    Args:
+        root: The root of the MEDS dataset.
+        fractions: The relative size of each split, keyed by split name; custom splits may be included. Defaults
+            to `default_split_fractions` (80% train, 10% tuning and 10% held out).
+        seed: The hash seed; each seed gives a different, but reproducible, assignment.
+        workers: The number of shards processed in parallel. The output does not depend on it.
+        output_path: Where to write the splits. Defaults to `metadata/subject_splits.parquet` under `root`.
+
+    Returns:
+        The path of the split file, in `subject_split_schema`, with the subjects of each shard in shard order.
+    """
+    fractions = default_split_fractions if fractions is None else fractions
+    output_path = os.path.join(root, subject_splits_filepath) if output_path is None else output_path
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    tmp_path = f"{output_path}.tmp"
+    jobs = [(path, fractions, seed) for path in data_shards(root)]
+    with pq.ParquetWriter(tmp_path, subject_split_schema) as writer:
+        for table in map_shards(_shard_splits, jobs, workers):
+            writer.write_table(table)
+    os.replace(tmp_path, output_path)
+    return output_path
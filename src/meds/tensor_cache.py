@@ -0,0 +1,100 @@
+"""A build-once cache of per-subject event tensors, for data loaders that read the same subjects every epoch.
+
+`SubjectTensorCache.build` converts a dataset once into the ragged arrays of `meds.export` (subject offsets, int32
+code IDs, int64 microsecond times and float32 `numeric_value`s), each a contiguous `.npy` file. The cache then
+serves the events of any subject as zero-copy views of those files, memory-mapped read-only: reads cost no parsing,
+and the operating system's page cache is shared by every process reading the cache.
+
+Caches are pickled by path only, and reopen their memory maps lazily on first access, so that a cache passed to
+many data loader worker processes (e.g., as an attribute of a `torch.utils.data.Dataset`) is neither copied nor
+duplicated in memory.
+"""
+
+import os
+from typing import Dict, Optional, Union
+
+import numpy as np
+
+from .export import export_arrays, export_vocab_filename, load_ragged
+
+
+class SubjectTensorCache:
+    """The cached event tensors of a dataset's subjects, indexed by their position in `subject_ids`."""
+
+    def __init__(self, cache_dir: str):
+        if not os.path.exists(os.path.join(cache_dir, export_vocab_filename)):
+            raise FileNotFoundError(f"No complete subject tensor cache at {cache_dir}; see SubjectTensorCache.build")
+        self.cache_dir = cache_dir
+        self._arrays: Optional[Dict[str, np.ndarray]] = None
+        self._subject_order: Optional[np.ndarray] = None
+
+    @classmethod
+    def build(cls, root: str, cache_dir: str, workers: int = 1, overwrite: bool = False) -> "SubjectTensorCache":
+        """Builds the cache of the dataset at `root` in `cache_dir`, unless it already holds a complete cache.
+
+        Args:
+            root: The root of the MEDS dataset.
+            cache_dir: The directory of the cache.
+            workers: The number of data shards converted in parallel.
+            overwrite: Whether to rebuild an existing cache, e.g. after the dataset changed.
+        """
+        marker = os.path.join(cache_dir, export_vocab_filename)
+        if overwrite and os.path.exists(marker):
+            # Until the rebuild completes, the cache is incomplete.
+            os.remove(marker)
+        if not os.path.exists(marker):
+            export_arrays(root, cache_dir, aggregation=None, workers=workers)
+        return cls(cache_dir)
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """The memory-mapped ragged arrays of the cache, opened on first access (see `meds.export.load_ragged`)."""
+        if self._arrays is None:
+            self._arrays = load_ragged(self.cache_dir)
+        return self._arrays
+
+    @property
+    def subject_ids(self) -> np.ndarray:
+        return self.arrays["subject_ids"]
+
+    def __len__(self) -> int:
+        return len(self.arrays["subject_ids"])
+
+    def __getitem__(self, subject_idx: int) -> Dict[str, Union[int, np.ndarray]]:
+        """Returns the `subject_id` and the `code_ids`, `times` and `values` of the events of a subject, as
+        read-only views into the cache."""
+        arrays = self.arrays
+        n = len(arrays["subject_ids"])
+        if not -n <= subject_idx < n:
+            raise IndexError(f"Subject index {subject_idx} is out of range for {n} subjects")
+        subject_idx %= n
+        start, end = int(arrays["offsets"][subject_idx]), int(arrays["offsets"][subject_idx + 1])
+        return {
+            "subject_id": int(arrays["subject_ids"][subject_idx]),
+            "code_ids": arrays["code_ids"][start:end],
+            "times": arrays["times"][start:end],
+            "values": arrays["values"][start:end],
+        }
+
+    def subject_indices(self, subject_ids: np.ndarray) -> np.ndarray:
+        """Returns the index of each of `subject_ids` in the cache, e.g. to select the subjects of a split.
+
+        Raises:
+            KeyError: If any subject is not in the cache.
+        """
+        if self._subject_order is None:
+            self._subject_order = np.argsort(self.subject_ids, kind="stable")
+        sorted_ids = self.subject_ids[self._subject_order]
+        subject_ids = np.asarray(subject_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_ids, subject_ids), max(len(sorted_ids) - 1, 0))
+        found = sorted_ids[positions] == subject_ids if len(sorted_ids) else np.zeros(len(subject_ids), dtype=bool)
+        if not found.all():
+            raise KeyError(f"Subjects {subject_ids[~found][:5].tolist()} are not in the cache")
+        return self._subject_order[positions]
+
+    def __getstate__(self) -> dict:
+        # Memory maps are reopened by each process rather than pickled, which would copy their contents.
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        state["_subject_order"] = None
+        return state
@@ -0,0 +1,414 @@
+"""Validation of MEDS datasets against the MEDS schemas.
+
+Data shards are streamed record batch by record batch, and only the columns needed for each check are decoded,
+so memory use stays bounded by the size of a single batch (plus one int64 per subject), regardless of the size
+of the shard. All checks are performed with pyarrow compute kernels.
+
+The checks performed on the data are the ones required by the data schema (see the README):
+
+1. The mandatory columns are present with the mandatory dtypes.
+2. `subject_id` is never null.
+3. The rows of each subject are contiguous within a shard.
+4. The rows of each subject are sorted by time. Static events (null `time`) must precede all timed events.
+5. No subject appears in more than one shard.
+
+`validate_dataset` additionally checks the code metadata, subject split and dataset metadata files.
+"""
+
+import datetime
+import functools
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import jsonschema
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ._utils import data_shards, map_shards, row_group_statistics
+from .schema import (
+    code_field,
+    code_metadata_filepath,
+    code_metadata_schema,
+    data_schema,
+    dataset_metadata_filepath,
+    dataset_metadata_schema,
+    subject_id_dtype,
+    subject_id_field,
+    subject_split_schema,
+    subject_splits_filepath,
+    time_field,
+)
+
+
+class MEDSValidationError(ValueError):
+    """Raised when a MEDS file does not conform to the MEDS schemas."""
+
+
+def _dtype_matches(actual: pa.DataType, expected: pa.DataType) -> bool:
+    # Parquet round trips rename the value field of list types (e.g., "item" -> "element"), which we ignore.
+    if pa.types.is_list(expected):
+        return pa.types.is_list(actual) and _dtype_matches(actual.value_type, expected.value_type)
+    return actual.equals(expected)
+
+
+def _check_fields(schema: pa.Schema, expected: pa.Schema, source: str) -> None:
+    """Checks that `schema` contains every field of `expected` with the same dtype. Extra fields are allowed."""
+    for expected_field in expected:
+        idx = schema.get_field_index(expected_field.name)
+        if idx == -1:
+            raise MEDSValidationError(f"{source}: missing mandatory field '{expected_field.name}'")
+        actual = schema.field(idx).type
+        if not _dtype_matches(actual, expected_field.type):
+            raise MEDSValidationError(
+                f"{source}: field '{expected_field.name}' has dtype {actual}, expected {expected_field.type}"
+            )
+
+
+def validate_data_schema(schema: pa.Schema, source: str = "schema") -> None:
+    """Checks that `schema` contains the mandatory data schema fields with the mandatory dtypes."""
+    _check_fields(schema, data_schema(), source)
+
+
+class _ShardChecker:
+    """Incremental contiguity and ordering checks over the `subject_id` and `time` columns of one shard.
+
+    Batches must be fed in file order. Only the last row of the previous batch and the ID of every subject
+    run seen so far are retained between batches.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.n_rows = 0
+        self._last_subject: Optional[int] = None
+        self._last_time: Optional[int] = None
+        self._run_starts: List[pa.Array] = []
+
+    def update(self, subject_ids: pa.Array, times: pa.Array) -> None:
+        n = len(subject_ids)
+        if n == 0:
+            return
+
+        if subject_ids.null_count:
+            raise MEDSValidationError(f"{self.source}: '{subject_id_field}' contains nulls")
+
+        # Null times sort first within a subject, so we compare them as the minimum representable time.
+        times = pc.fill_null(times.cast(pa.int64()), pa.scalar(-(2**63), pa.int64()))
+
+        if self._last_subject is None:
+            # The first row of the shard always starts a run; compare it against itself.
+            last_subject, last_time = subject_ids[0].as_py(), times[0].as_py()
+        else:
+            last_subject, last_time = self._last_subject, self._last_time
+
+        prev_subjects = pa.concat_arrays([pa.array([last_subject], subject_id_dtype), subject_ids.slice(0, n - 1)])
+        prev_times = pa.concat_arrays([pa.array([last_time], pa.int64()), times.slice(0, n - 1)])
+        is_new_run = pc.not_equal(subject_ids, prev_subjects)
+        if self._last_subject is None:
+            is_new_run = pa.concat_arrays([pa.array([True]), is_new_run.slice(1)])
+
+        out_of_order = pc.and_(pc.invert(is_new_run), pc.less(times, prev_times))
+        if pc.any(out_of_order).as_py():
+            row = self.n_rows + pc.index(out_of_order, True).as_py()
+            subject = subject_ids[row - self.n_rows].as_py()
+            raise MEDSValidationError(
+                f"{self.source}: events for subject {subject} are not sorted by '{time_field}' (row {row})"
+            )
+
+        self._run_starts.append(pc.filter(subject_ids, is_new_run))
+        self._last_subject = subject_ids[n - 1].as_py()
+        self._last_time = times[n - 1].as_py()
+        self.n_rows += n
+
+    def finish(self) -> pa.Array:
+        """Checks subject contiguity and returns the sorted unique subject IDs of the shard."""
+        run_starts = pa.concat_arrays(self._run_starts) if self._run_starts else pa.array([], subject_id_dtype)
+        subject_ids = run_starts.take(pc.sort_indices(run_starts))
+        duplicated = _adjacent_duplicates(subject_ids)
+        if len(duplicated):
+            raise MEDSValidationError(f"{self.source}: events for subject {duplicated[0].as_py()} are not contiguous")
+        return subject_ids
+
+
+def _adjacent_duplicates(sorted_values: pa.Array) -> pa.Array:
+    """Returns the values that occur more than once in an already sorted array."""
+    n = len(sorted_values)
+    if n < 2:
+        return sorted_values.slice(0, 0)
+    is_dup = pc.equal(sorted_values.slice(1), sorted_values.slice(0, n - 1))
+    return pc.filter(sorted_values.slice(1), is_dup)
+
+
+def validate_shard(path: str, batch_size: Optional[int] = None) -> pa.Array:
+    """Validates a single data shard, streaming it batch by batch.
+
+    Args:
+        path: The path to the parquet shard.
+        batch_size: The maximum number of rows decoded at once. Defaults to one row group at a time.
+
+    Returns:
+        The sorted, unique subject IDs in the shard, for use in cross-shard checks.
+
+    Raises:
+        MEDSValidationError: If the shard does not conform to the data schema.
+    """
+    pf = pq.ParquetFile(path)
+    validate_data_schema(pf.schema_arrow, path)
+
+    checker = _ShardChecker(path)
+    columns = [subject_id_field, time_field]
+    if batch_size is None:
+        batches = (pf.read_row_group(i, columns=columns) for i in range(pf.num_row_groups))
+    else:
+        batches = pf.iter_batches(batch_size=batch_size, columns=columns)
+
+    for batch in batches:
+        subject_ids = batch.column(subject_id_field)
+        times = batch.column(time_field)
+        if isinstance(subject_ids, pa.ChunkedArray):
+            subject_ids = subject_ids.combine_chunks()
+            times = times.combine_chunks()
+        checker.update(subject_ids, times)
+    return checker.finish()
+
+
+def check_disjoint_shards(subject_ids_by_shard: Dict[str, pa.Array]) -> None:
+    """Checks that no subject appears in more than one shard.
+
+    The per-shard sorted subject ID arrays are concatenated and sorted; any subject that appears in two
+    shards shows up as two adjacent equal values.
+    """
+    if not subject_ids_by_shard:
+        return
+
+    shards = list(subject_ids_by_shard)
+    subject_ids = pa.concat_arrays([subject_ids_by_shard[s].cast(subject_id_dtype) for s in shards])
+    order = pc.sort_indices(subject_ids)
+    sorted_ids = subject_ids.take(order)
+    duplicated = _adjacent_duplicates(sorted_ids)
+    if len(duplicated) == 0:
+        return
+
+    subject = duplicated[0]
+    offenders = [s for s in shards if pc.index(subject_ids_by_shard[s], subject).as_py() != -1]
+    raise MEDSValidationError(f"Subject {subject.as_py()} appears in multiple shards: {', '.join(offenders)}")
+
+
+def validate_shards(paths: Sequence[str], batch_size: Optional[int] = None, workers: int = 1) -> Dict[str, pa.Array]:
+    """Validates a set of data shards, in parallel if `workers > 1`, and checks that they are mutually disjoint.
+
+    Returns:
+        The sorted, unique subject IDs of each shard, keyed by shard path.
+    """
+    validate = functools.partial(validate_shard, batch_size=batch_size)
+    subject_ids_by_shard = dict(zip(paths, map_shards(validate, paths, workers)))
+    check_disjoint_shards(subject_ids_by_shard)
+    return subject_ids_by_shard
+
+
+# Static events have null times, which sort before every other time within a subject.
+_NULL_TIME = datetime.datetime.min
+
+
+def _row_group_proven(subject_stats: Tuple, time_stats: Tuple, num_rows: int) -> bool:
+    """Returns whether footer statistics alone prove a row group contiguous and in time order.
+
+    This is only the case when the row group holds a single subject whose rows all share the same time.
+    """
+    subject_min, subject_max, _ = subject_stats
+    time_min, time_max, time_nulls = time_stats
+    if subject_min != subject_max:
+        return False
+    return time_nulls == num_rows or (time_nulls == 0 and time_min == time_max)
+
+
+def footer_subject_range(path: str) -> Optional[Tuple[int, int]]:
+    """Validates a data shard from its parquet footer, decoding only the row groups the footer cannot prove.
+
+    The physical schema is checked against the data schema, and the row group `subject_id` and `time` statistics
+    are used to prove that row groups are in subject order and that any subject spanning a row group boundary is
+    in time order across it. Statistics cannot describe the order of rows *within* a row group, so every row
+    group that is not proven by `_row_group_proven` has its `subject_id` and `time` columns decoded and checked.
+
+    Returns:
+        The `(min, max)` subject IDs of the shard, or `None` if the statistics are missing or inconclusive across
+        row groups (e.g., subjects are not stored in sorted order), in which case the whole shard must be decoded
+        to be validated.
+
+    Raises:
+        MEDSValidationError: If the schema, the footer statistics or a decoded row group are not conformant.
+    """
+    pf = pq.ParquetFile(path)
+    validate_data_schema(pf.schema_arrow, path)
+
+    metadata = pf.metadata
+    subject_stats = row_group_statistics(metadata, subject_id_field)
+    time_stats = row_group_statistics(metadata, time_field)
+
+    to_decode: List[Tuple[int, int, int]] = []
+    subject_range: Optional[Tuple[int, int]] = None
+    prev_max: Optional[Tuple[int, datetime.datetime]] = None
+    for i in range(metadata.num_row_groups):
+        num_rows = metadata.row_group(i).num_rows
+        if num_rows == 0:
+            continue
+        rg_subject_stats = subject_stats[i]
+        rg_time_stats = time_stats[i]
+        if rg_subject_stats is None or rg_time_stats is None:
+            return None
+
+        subject_min, subject_max, subject_nulls = rg_subject_stats
+        if subject_nulls:
+            raise MEDSValidationError(f"{path}: '{subject_id_field}' contains nulls")
+
+        time_min, time_max, time_nulls = rg_time_stats
+        time_min = _NULL_TIME if time_nulls else time_min
+        time_max = _NULL_TIME if time_max is None else time_max
+
+        if prev_max is not None:
+            prev_subject_max, prev_time_max = prev_max
+            if prev_subject_max > subject_min:
+                return None
+            if prev_subject_max == subject_min and prev_time_max > time_min:
+                return None
+
+        if not _row_group_proven(rg_subject_stats, rg_time_stats, num_rows):
+            to_decode.append((i, subject_min, subject_max))
+
+        prev_max = (subject_max, time_max)
+        subject_range = (subject_min if subject_range is None else subject_range[0], subject_max)
+
+    # Row groups are in subject order relative to one another, so each inconclusive row group can be checked on
+    # its own, provided that its first and last subjects are the ones it shares with its neighbours.
+    for i, subject_min, subject_max in to_decode:
+        checker = _ShardChecker(f"{path} (row group {i})")
+        table = pf.read_row_group(i, columns=[subject_id_field, time_field])
+        subject_ids = table.column(subject_id_field).combine_chunks()
+        checker.update(subject_ids, table.column(time_field).combine_chunks())
+        checker.finish()
+        if subject_ids[0].as_py() != subject_min or subject_ids[-1].as_py() != subject_max:
+            return None
+
+    return subject_range
+
+
+def _overlapping(ranges: Dict[str, Tuple[int, int]]) -> List[str]:
+    """Returns the keys of all ranges that overlap at least one other range."""
+    out: List[str] = []
+    cluster: List[str] = []
+    cluster_max = None
+    for lo, hi, key in sorted((lo, hi, key) for key, (lo, hi) in ranges.items()):
+        if cluster_max is not None and lo <= cluster_max:
+            cluster.append(key)
+            cluster_max = max(cluster_max, hi)
+            continue
+        if len(cluster) > 1:
+            out.extend(cluster)
+        cluster, cluster_max = [key], hi
+    if len(cluster) > 1:
+        out.extend(cluster)
+    return out
+
+
+def validate_shards_from_statistics(
+    paths: Sequence[str], batch_size: Optional[int] = None, workers: int = 1
+) -> Dict[str, Optional[pa.Array]]:
+    """Validates a set of data shards from their parquet footers, decoding only where footers are inconclusive.
+
+    Shards are first checked with `footer_subject_range`, which decodes only the row groups that the footer cannot
+    prove. Shards whose statistics are inconclusive fall back to the full decoding path of `validate_shard`.
+    Shards whose subject ID ranges are disjoint from those of every other shard are thereby proven disjoint; the
+    subject IDs of shards with overlapping ranges are decoded and checked exactly.
+
+    Returns:
+        The sorted, unique subject IDs of each shard that had to be decoded in full, and `None` for every other
+        shard.
+    """
+    validate = functools.partial(validate_shard, batch_size=batch_size)
+
+    ranges: Dict[str, Tuple[int, int]] = {}
+    inconclusive: List[str] = []
+    for path, subject_range in zip(paths, map_shards(footer_subject_range, paths, workers)):
+        if subject_range is None:
+            inconclusive.append(path)
+        else:
+            ranges[path] = subject_range
+    subject_ids_by_shard = dict(zip(inconclusive, map_shards(validate, inconclusive, workers)))
+    for path, subject_ids in subject_ids_by_shard.items():
+        if len(subject_ids):
+            ranges[path] = (subject_ids[0].as_py(), subject_ids[-1].as_py())
+
+    overlapping = _overlapping(ranges)
+    undecoded = [path for path in overlapping if path not in subject_ids_by_shard]
+    subject_ids_by_shard.update(zip(undecoded, map_shards(validate, undecoded, workers)))
+    check_disjoint_shards({path: subject_ids_by_shard[path] for path in overlapping})
+
+    return {path: subject_ids_by_shard.get(path) for path in paths}
+
+
+def validate_code_metadata(path: str) -> None:
+    """Checks that a code metadata file conforms to `code_metadata_schema` and has no null codes."""
+    pf = pq.ParquetFile(path)
+    _check_fields(pf.schema_arrow, code_metadata_schema(), path)
+    for i in range(pf.num_row_groups):
+        if pf.read_row_group(i, columns=[code_field]).column(0).null_count:
+            raise MEDSValidationError(f"{path}: code metadata contains null codes")
+
+
+def validate_subject_splits(path: str) -> None:
+    """Checks that a subject splits file conforms to `subject_split_schema` and assigns each subject once."""
+    pf = pq.ParquetFile(path)
+    _check_fields(pf.schema_arrow, subject_split_schema, path)
+    subject_ids = pf.read(columns=[subject_id_field]).column(0).combine_chunks()
+    if subject_ids.null_count:
+        raise MEDSValidationError(f"{path}: '{subject_id_field}' contains nulls")
+    duplicated = _adjacent_duplicates(subject_ids.take(pc.sort_indices(subject_ids)))
+    if len(duplicated):
+        raise MEDSValidationError(f"{path}: subject {duplicated[0].as_py()} is assigned to multiple splits")
+
+
+def validate_dataset_metadata(path: str) -> None:
+    """Checks that a dataset metadata JSON file conforms to `dataset_metadata_schema`."""
+    with open(path) as f:
+        metadata = json.load(f)
+    try:
+        jsonschema.validate(instance=metadata, schema=dataset_metadata_schema)
+    except jsonschema.ValidationError as e:
+        raise MEDSValidationError(f"{path}: {e.message}") from e
+
+
+def validate_dataset(
+    root: str, workers: int = 1, batch_size: Optional[int] = None, use_statistics: bool = False
+) -> Dict[str, Optional[pa.Array]]:
+    """Validates a full MEDS dataset rooted at `root`.
+
+    All data shards are validated, fanned out over `workers` processes, and their subject ID sets are merged to
+    detect subjects split across shards. The code metadata, subject split and dataset metadata files are each
+    validated if present.
+
+    If `use_statistics` is set, subject order across row groups and disjointness across shards are proven from the
+    parquet footers wherever possible, and only the row groups the footers cannot prove are decoded; see
+    `validate_shards_from_statistics`.
+
+    Returns:
+        The sorted, unique subject IDs of each data shard, keyed by shard path. With `use_statistics`, the value
+        is `None` for shards whose subject IDs were not collected in full.
+    """
+    shards = data_shards(root)
+    if not shards:
+        raise MEDSValidationError(f"{root}: no data shards found")
+
+    metadata_validators = [
+        (code_metadata_filepath, validate_code_metadata),
+        (subject_splits_filepath, validate_subject_splits),
+        (dataset_metadata_filepath, validate_dataset_metadata),
+    ]
+    for filepath, validator in metadata_validators:
+        path = os.path.join(root, filepath)
+        if os.path.exists(path):
+            validator(path)
+
+    if use_statistics:
+        return validate_shards_from_statistics(shards, batch_size=batch_size, workers=workers)
+    return dict(validate_shards(shards, batch_size=batch_size, workers=workers))
@@ -0,0 +1,244 @@
+"""A global code vocabulary, and dictionary-encoded reads and writes of the `code` column.
+
+`code_dtype` is a plain string, so every event repeats its code. In memory, it is much cheaper to represent the
+`code` column as a `pa.dictionary(pa.int32(), pa.string())` whose dictionary is a single vocabulary shared by
+every shard of the dataset: group-bys, joins and counts then run on the int32 indices, and indices are
+comparable across shards.
+
+The global vocabulary is the sorted list of unique codes in `metadata/codes.parquet`, so it is stable across
+runs for the same code metadata.
+
+For consumers that want integer codes outright (e.g., as model inputs), `compile_dataset` writes a "compiled"
+variant of a dataset whose shards carry an extra int32 `code_id` column alongside `code`, and whose vocabulary is
+persisted in `metadata/code_vocab.parquet`, so that the mapping can be reused without rebuilding it. Recompiling
+keeps the persisted code IDs and appends new codes after them, so that code IDs stay stable as codes are added.
+"""
+
+import os
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from ._utils import copy_files, data_shards, map_shards
+from .arrow_cache import arrow_cache_path
+from .index import subject_index_filepath
+from .schema import (
+    code_dtype,
+    code_field,
+    code_metadata_filepath,
+    data_schema,
+    dataset_metadata_filepath,
+    subject_splits_filepath,
+)
+
+encoded_code_dtype = pa.dictionary(pa.int32(), code_dtype)
+
+code_id_field = "code_id"
+code_id_dtype = pa.int32()
+
+code_vocab_filepath = os.path.join("metadata", "code_vocab.parquet")
+
+code_vocab_schema = pa.schema(
+    [
+        (code_id_field, code_id_dtype),
+        (code_field, code_dtype),
+    ]
+)
+
+
+def code_vocabulary(root: str) -> pa.Array:
+    """Returns the global code vocabulary of the dataset at `root`: the sorted unique codes in its code metadata."""
+    codes = pq.read_table(os.path.join(root, code_metadata_filepath), columns=[code_field]).column(0)
+    codes = pc.unique(codes.combine_chunks().drop_null())
+    return codes.take(pc.sort_indices(codes)).cast(code_dtype)
+
+
+def _missing_codes_error(codes: pa.Array, indices: pa.Array) -> KeyError:
+    missing = pc.unique(pc.filter(codes, pc.and_(pc.is_null(indices), pc.is_valid(codes))))
+    return KeyError(f"{len(missing)} codes are not in the vocabulary, e.g. {missing[:5].to_pylist()}")
+
+
+def _encode_array(codes: pa.Array, vocabulary: pa.Array) -> pa.DictionaryArray:
+    if pa.types.is_dictionary(codes.type):
+        # Only the (small) dictionary of the array needs to be looked up in the vocabulary.
+        remap = pc.index_in(codes.dictionary.cast(code_dtype), value_set=vocabulary)
+        indices = remap.take(codes.indices)
+    else:
+        indices = pc.index_in(codes, value_set=vocabulary)
+    if indices.null_count != codes.null_count:
+        raise _missing_codes_error(codes.cast(code_dtype), indices)
+    return pa.DictionaryArray.from_arrays(indices.cast(pa.int32()), vocabulary)
+
+
+def encode_codes(
+    codes: Union[pa.Array, pa.ChunkedArray], vocabulary: pa.Array
+) -> Union[pa.DictionaryArray, pa.ChunkedArray]:
+    """Encodes a code column as dictionary indices into `vocabulary`, which becomes its (shared) dictionary.
+
+    Codes that are already dictionary-encoded (e.g., when read from parquet with `read_dictionary`) are
+    re-encoded by looking up only their dictionary, not every row.
+
+    Raises:
+        KeyError: If any non-null code is not in the vocabulary.
+    """
+    if isinstance(codes, pa.ChunkedArray):
+        return pa.chunked_array([_encode_array(c, vocabulary) for c in codes.chunks], encoded_code_dtype)
+    return _encode_array(codes, vocabulary)
+
+
+def encode_table(table: pa.Table, vocabulary: pa.Array) -> pa.Table:
+    """Replaces the `code` column of `table` with its encoding into `vocabulary`."""
+    idx = table.schema.get_field_index(code_field)
+    return table.set_column(idx, code_field, encode_codes(table.column(idx), vocabulary))
+
+
+def read_encoded_shard(path: str, vocabulary: pa.Array, columns: Optional[Sequence[str]] = None) -> pa.Table:
+    """Reads a data shard with its `code` column encoded into `vocabulary`, never materializing code strings."""
+    table = pq.read_table(path, columns=columns, read_dictionary=[code_field])
+    if code_field not in table.column_names:
+        return table
+    return encode_table(table, vocabulary)
+
+
+def write_encoded_shard(table: pa.Table, path: str, **kwargs) -> None:
+    """Writes a data shard whose `code` column may be dictionary-encoded.
+
+    On disk, the `code` column keeps the spec's `code_dtype`, so the shard remains a valid MEDS data shard. It is
+    stored with parquet dictionary encoding, which `read_encoded_shard` reads back without decoding the strings.
+    Extra keyword arguments are passed to `pyarrow.parquet.write_table`.
+    """
+    idx = table.schema.get_field_index(code_field)
+    if pa.types.is_dictionary(table.schema.field(idx).type):
+        table = table.set_column(idx, code_field, table.column(idx).cast(code_dtype))
+    pq.write_table(table, path, **kwargs)
+
+
+def vocabulary_indices(codes: Union[pa.Array, pa.ChunkedArray], vocabulary: pa.Array) -> np.ndarray:
+    """Returns the index in `vocabulary` of each code, or -1 for null codes and codes not in the vocabulary.
+
+    Unlike `encode`, unknown codes are not an error. Dictionary-encoded codes are looked up by their dictionary only.
+    """
+    chunks = codes.chunks if isinstance(codes, pa.ChunkedArray) else [codes]
+    out = []
+    for chunk in chunks:
+        if pa.types.is_dictionary(chunk.type):
+            indices = pc.index_in(chunk.dictionary.cast(code_dtype), value_set=vocabulary).take(chunk.indices)
+        else:
+            indices = pc.index_in(chunk.cast(code_dtype), value_set=vocabulary)
+        out.append(pc.fill_null(indices, -1).to_numpy(zero_copy_only=False).astype(np.int64))
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+
+
+def write_code_vocabulary(root: str, vocabulary: Optional[pa.Array] = None) -> pa.Array:
+    """Persists a code vocabulary (by default, `code_vocabulary(root)`) to `metadata/code_vocab.parquet`."""
+    if vocabulary is None:
+        vocabulary = code_vocabulary(root)
+    table = pa.table([pa.array(range(len(vocabulary)), code_id_dtype), vocabulary], schema=code_vocab_schema)
+    path = os.path.join(root, code_vocab_filepath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path)
+    return vocabulary
+
+
+def load_code_vocabulary(root: str) -> pa.Array:
+    """Loads the persisted code vocabulary of the dataset at `root`, indexed by code ID."""
+    table = pq.read_table(os.path.join(root, code_vocab_filepath))
+    table = table.sort_by(code_id_field)
+    code_ids = table.column(code_id_field).combine_chunks()
+    if not code_ids.equals(pa.array(range(len(code_ids)), code_id_dtype)):
+        raise ValueError(f"{code_vocab_filepath} must contain the code IDs 0 to {len(code_ids) - 1} exactly once")
+    return table.column(code_field).combine_chunks()
+
+
+def encode(codes: Union[pa.Array, pa.ChunkedArray], vocabulary: pa.Array) -> Union[pa.Array, pa.ChunkedArray]:
+    """Maps codes to their int32 code IDs in `vocabulary`. Null codes map to null IDs."""
+    encoded = encode_codes(codes, vocabulary)
+    if isinstance(encoded, pa.ChunkedArray):
+        return pa.chunked_array([c.indices for c in encoded.chunks], code_id_dtype)
+    return encoded.indices
+
+
+def decode(code_ids: Union[pa.Array, pa.ChunkedArray], vocabulary: pa.Array) -> Union[pa.Array, pa.ChunkedArray]:
+    """Maps int32 code IDs back to their codes in `vocabulary`."""
+    return vocabulary.take(code_ids)
+
+
+def compiled_data_schema(custom_properties=[]) -> pa.Schema:
+    """The data schema of a compiled dataset, which has a `code_id` column before any other custom property."""
+    return data_schema([(code_id_field, code_id_dtype)] + list(custom_properties))
+
+
+def compile_shard(path: str, out_path: str, vocabulary: pa.Array) -> None:
+    """Writes a compiled copy of a data shard, row group by row group, preserving its row group layout."""
+    pf = pq.ParquetFile(path, read_dictionary=[code_field])
+    mandatory = data_schema()
+    custom = [f for f in pf.schema_arrow if f.name not in mandatory.names and f.name != code_id_field]
+    schema = compiled_data_schema(custom)
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.tmp"
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for rg in range(pf.num_row_groups):
+            table = pf.read_row_group(rg)
+            code_ids = encode(table.column(code_field), vocabulary)
+            if code_id_field in table.column_names:
+                table = table.drop([code_id_field])
+            table = table.append_column(code_id_field, code_ids)
+            writer.write_table(table.select(schema.names).cast(schema))
+    os.replace(tmp_path, out_path)
+
+
+def _compile_shard(args) -> None:
+    compile_shard(*args)
+
+
+def compiled_vocabulary(root: str, output_root: Optional[str] = None) -> pa.Array:
+    """Returns the vocabulary with which the dataset at `root` is compiled to `output_root` (by default, in place).
+
+    If a vocabulary is already persisted in `output_root` (or, failing that, in `root`), its code IDs are kept and
+    the codes of `code_vocabulary(root)` that it lacks are appended after them, in sorted order. Otherwise, the
+    vocabulary is `code_vocabulary(root)`.
+    """
+    vocabulary = code_vocabulary(root)
+    for vocab_root in [root if output_root is None else output_root, root]:
+        if os.path.exists(os.path.join(vocab_root, code_vocab_filepath)):
+            persisted = load_code_vocabulary(vocab_root)
+            new_codes = pc.filter(vocabulary, pc.invert(pc.is_in(vocabulary, value_set=persisted)))
+            return pa.concat_arrays([persisted, new_codes])
+    return vocabulary
+
+
+def compile_dataset(root: str, output_root: Optional[str] = None, workers: int = 1) -> pa.Array:
+    """Writes a compiled variant of the dataset at `root` to `output_root` (by default, in place).
+
+    Every data shard gains an int32 `code_id` column, the vocabulary (see `compiled_vocabulary`) is written to
+    `metadata/code_vocab.parquet`, and the other metadata files, including any subject index, are copied over. Row
+    group layouts are preserved, so the subject index of the source dataset remains valid for the compiled one.
+    Any Arrow cache of the rewritten shards is removed, as it lacks the `code_id` column.
+
+    Returns:
+        The vocabulary, indexed by code ID.
+    """
+    output_root = root if output_root is None else output_root
+    vocabulary = compiled_vocabulary(root, output_root)
+
+    jobs = [(path, os.path.join(output_root, os.path.relpath(path, root)), vocabulary) for path in data_shards(root)]
+    list(map_shards(_compile_shard, jobs, workers))
+    for _, out_path, _ in jobs:
+        cache_path = arrow_cache_path(output_root, os.path.relpath(out_path, output_root).replace(os.sep, "/"))
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    if output_root != root:
+        metadata_files = [
+            code_metadata_filepath,
+            subject_splits_filepath,
+            dataset_metadata_filepath,
+            subject_index_filepath,
+        ]
+        copy_files(root, output_root, metadata_files)
+
+    return write_code_vocabulary(output_root, vocabulary)
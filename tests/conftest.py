@@ -0,0 +1,101 @@
+import datetime
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from meds import (
+    code_metadata_filepath,
+    code_metadata_schema,
+    data_schema,
+    dataset_metadata_filepath,
+    held_out_split,
+    label_schema,
+    subject_split_schema,
+    subject_splits_filepath,
+    train_split,
+    tuning_split,
+)
+
+
+def _t(year, month=1, day=1):
+    return datetime.datetime(year, month, day)
+
+
+# A small dataset of two shards, one nested, each written with several row groups.
+SHARDS = {
+    os.path.join("train", "0.parquet"): [
+        (1, None, "MEDS_BIRTH", None),
+        (1, _t(2019, 1, 1), "ICD10CM/E11.65", None),
+        (1, _t(2019, 1, 1), "LAB//GLUCOSE", 120.0),
+        (1, _t(2019, 6, 1), "LAB//GLUCOSE", 140.0),
+        (1, _t(2020, 3, 1), "ADMISSION", None),
+        (1, _t(2020, 3, 10), "MEDS_DEATH", None),
+        (2, None, "MEDS_BIRTH", None),
+        (2, _t(2018, 5, 1), "ICD10CM/E11.9", None),
+        (2, _t(2021, 2, 1), "LAB//GLUCOSE", 90.0),
+    ],
+    os.path.join("held_out", "0.parquet"): [
+        (3, _t(2017, 1, 1), "ADMISSION", None),
+        (3, _t(2017, 1, 2), "LAB//GLUCOSE", 100.0),
+        (3, _t(2022, 1, 1), "ADMISSION", None),
+        (4, None, "MEDS_BIRTH", None),
+        (4, _t(2020, 1, 1), "ICD10CM/E11", None),
+    ],
+}
+
+CODES = [
+    {"code": "MEDS_BIRTH", "description": "Birth", "parent_codes": []},
+    {"code": "MEDS_DEATH", "description": "Death", "parent_codes": []},
+    {"code": "ADMISSION", "description": "Admission", "parent_codes": []},
+    {"code": "LAB//GLUCOSE", "description": "Glucose", "parent_codes": []},
+    {"code": "ICD10CM/E11", "description": "Type 2 diabetes", "parent_codes": []},
+    {"code": "ICD10CM/E11.6", "description": "T2D with complications", "parent_codes": ["ICD10CM/E11"]},
+    {"code": "ICD10CM/E11.65", "description": "T2D with hyperglycemia", "parent_codes": ["ICD10CM/E11.6"]},
+    {"code": "ICD10CM/E11.9", "description": "T2D without complications", "parent_codes": ["ICD10CM/E11"]},
+]
+
+SPLITS = [(1, train_split), (2, train_split), (3, held_out_split), (4, tuning_split)]
+
+LABELS = [
+    (1, datetime.datetime(2019, 1, 1), True),
+    (1, datetime.datetime(2020, 3, 5), False),
+    (2, datetime.datetime(2000, 1, 1), False),
+    (3, datetime.datetime(2030, 1, 1), True),
+    (4, datetime.datetime(2020, 1, 1), True),
+    (5, datetime.datetime(2020, 1, 1), True),
+]
+
+
+def write_data_shard(path, rows, row_group_size=3):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pylist(
+        [{"subject_id": s, "time": t, "code": c, "numeric_value": v} for s, t, c, v in rows], schema=data_schema()
+    )
+    pq.write_table(table, path, row_group_size=row_group_size)
+
+
+def write_labels(label_dir, labels=LABELS, n_files=2):
+    os.makedirs(label_dir, exist_ok=True)
+    rows = [{"subject_id": s, "prediction_time": t, "boolean_value": v} for s, t, v in labels]
+    for i in range(n_files):
+        table = pa.Table.from_pylist(rows[i::n_files], schema=label_schema)
+        pq.write_table(table, os.path.join(label_dir, f"{i}.parquet"))
+
+
+@pytest.fixture
+def meds_root(tmp_path):
+    root = tmp_path / "meds"
+    for name, rows in SHARDS.items():
+        write_data_shard(str(root / "data" / name), rows)
+
+    os.makedirs(root / "metadata")
+    pq.write_table(pa.Table.from_pylist(CODES, schema=code_metadata_schema()), root / code_metadata_filepath)
+    splits = pa.Table.from_pylist([{"subject_id": s, "split": v} for s, v in SPLITS], schema=subject_split_schema)
+    pq.write_table(splits, root / subject_splits_filepath)
+    with open(root / dataset_metadata_filepath, "w") as f:
+        json.dump({"dataset_name": "test", "meds_version": "0.3.0"}, f)
+
+    return str(root)
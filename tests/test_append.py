@@ -0,0 +1,108 @@
+import datetime
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from conftest import SHARDS
+
+from meds import build_subject_index, data_schema, dataset_metadata_filepath, subject_index_filepath, validate_dataset
+from meds.append import append_events
+from meds.index import index_shard, subject_index_schema
+
+
+def _rows(path):
+    table = pq.read_table(path)
+    return list(zip(*(table.column(c).to_pylist() for c in ["subject_id", "time", "code", "numeric_value"])))
+
+
+NEW_EVENTS = [
+    (5, datetime.datetime(2023, 1, 1), "ADMISSION", None),
+    (1, datetime.datetime(2019, 6, 1), "ADMISSION", None),
+    (4, datetime.datetime(2019, 1, 1), "LAB//GLUCOSE", 80.0),
+    (5, None, "MEDS_BIRTH", None),
+    (1, datetime.datetime(2025, 1, 1), "LAB//GLUCOSE", 95.0),
+]
+
+
+@pytest.mark.parametrize("with_index", [False, True])
+def test_append_events(meds_root, with_index):
+    """
+    Test that new events are merged into the shards of their subjects, and new subjects get a new shard.
+    """
+    if with_index:
+        build_subject_index(meds_root)
+    events = pa.Table.from_pylist(
+        [{"subject_id": s, "time": t, "code": c, "numeric_value": v} for s, t, c, v in NEW_EVENTS],
+        schema=data_schema(),
+    )
+    train = os.path.join(meds_root, "data", "train", "0.parquet")
+    held_out = os.path.join(meds_root, "data", "held_out", "0.parquet")
+    untouched_row_group = pq.ParquetFile(train).read_row_group(2)
+
+    paths = append_events(meds_root, events, row_group_size=100, workers=2)
+    new_shard = os.path.join(meds_root, "data", "0.parquet")
+    assert sorted(paths) == sorted([train, held_out, new_shard])
+    validate_dataset(meds_root)
+
+    def key(row):
+        return (row[1] is not None, row[1] or datetime.datetime.min)
+
+    train_rows = SHARDS[os.path.join("train", "0.parquet")]
+    expected = sorted(train_rows[:6] + [NEW_EVENTS[1], NEW_EVENTS[4]], key=key) + train_rows[6:]
+    assert _rows(train) == expected
+    held_out_rows = SHARDS[os.path.join("held_out", "0.parquet")]
+    assert _rows(held_out) == held_out_rows[:4] + [NEW_EVENTS[2], held_out_rows[4]]
+    assert _rows(new_shard) == [NEW_EVENTS[3], NEW_EVENTS[0]]
+
+    # The row group of subject 2 is copied over unchanged.
+    pf = pq.ParquetFile(train)
+    assert pf.num_row_groups == 2
+    assert pf.read_row_group(1).equals(untouched_row_group)
+
+    with open(os.path.join(meds_root, dataset_metadata_filepath)) as f:
+        metadata = json.load(f)
+    updated_at = datetime.datetime.fromisoformat(metadata.pop("updated_at"))
+    assert updated_at.tzinfo is not None
+    assert metadata == {"dataset_name": "test", "meds_version": "0.3.0"}
+
+    if with_index:
+        index = pq.read_table(os.path.join(meds_root, subject_index_filepath))
+        expected_index = build_subject_index(meds_root)
+        assert index.equals(expected_index)
+        assert index_shard(new_shard, meds_root).num_rows == 1
+
+
+def test_append_events_errors(meds_root):
+    """
+    Test that events without a subject, or an existing new shard, are rejected.
+    """
+    events = pa.Table.from_pylist([{"subject_id": None, "code": "ADMISSION"}], schema=data_schema())
+    with pytest.raises(ValueError):
+        append_events(meds_root, events)
+
+    events = pa.Table.from_pylist([{"subject_id": 9, "code": "ADMISSION"}], schema=data_schema())
+    with pytest.raises(ValueError):
+        append_events(meds_root, events, new_shard=os.path.join("data", "train", "0.parquet"))
+
+
+def test_append_events_stale_index(meds_root):
+    """
+    Test that events routed by a stale subject index to a shard without their subject are rejected.
+    """
+    build_subject_index(meds_root)
+    index_path = os.path.join(meds_root, subject_index_filepath)
+    index = pq.read_table(index_path).to_pylist()
+    for entry in index:
+        if entry["subject_id"] == 2:
+            entry["shard"] = "data/held_out/0.parquet"
+    pq.write_table(pa.Table.from_pylist(index, schema=subject_index_schema), index_path)
+
+    held_out = os.path.join(meds_root, "data", "held_out", "0.parquet")
+    before = pq.read_table(held_out)
+    events = pa.Table.from_pylist([{"subject_id": 2, "code": "ADMISSION"}], schema=data_schema())
+    with pytest.raises(ValueError, match="stale"):
+        append_events(meds_root, events)
+    assert pq.read_table(held_out).equals(before)
+    assert not [f for f in os.listdir(os.path.dirname(held_out)) if f.endswith(".tmp")]
@@ -0,0 +1,65 @@
+import math
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from conftest import CODES, SHARDS
+
+from meds import code_metadata_filepath, code_metadata_schema, validate_dataset
+from meds.code_stats import code_stats_properties, compute_code_stats, merge_code_stats, write_code_stats
+
+
+def _rows():
+    return [r for rows in SHARDS.values() for r in rows]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_compute_code_stats(meds_root, workers):
+    """
+    Test that merged per-shard code statistics match statistics over all events.
+    """
+    stats = compute_code_stats(meds_root, workers=workers, merge_every=1)
+    assert stats.column("code").to_pylist() == sorted({r[2] for r in _rows()})
+
+    for row in stats.to_pylist():
+        events = [r for r in _rows() if r[2] == row["code"]]
+        values = [r[3] for r in events if r[3] is not None]
+        assert row["code/n_occurrences"] == len(events)
+        assert row["code/n_subjects"] == len({r[0] for r in events})
+        assert row["values/n_occurrences"] == len(values)
+        assert math.isclose(row["values/sum"], sum(values))
+        assert math.isclose(row["values/sum_sqd"], sum(v * v for v in values))
+        assert row["values/min"] == (min(values) if values else None)
+        assert row["values/max"] == (max(values) if values else None)
+
+    # Merging is associative, and merging with nothing is the identity.
+    assert merge_code_stats([stats]).equals(stats)
+    assert merge_code_stats([stats.slice(0, 2), stats.slice(2)]).equals(stats)
+
+
+def test_write_code_stats(meds_root):
+    """
+    Test that code statistics are written as custom properties of the code metadata.
+    """
+    extra = pa.Table.from_pylist(
+        [{"code": "NEVER_USED", "description": "Unused", "parent_codes": []}], schema=code_metadata_schema()
+    )
+    path = os.path.join(meds_root, code_metadata_filepath)
+    pq.write_table(pa.concat_tables([pq.read_table(path), extra]), path)
+
+    codes = write_code_stats(meds_root)
+    assert codes.schema.equals(code_metadata_schema([pa.field(n, t) for n, t in code_stats_properties]))
+    assert pq.read_table(path).equals(codes)
+    validate_dataset(meds_root)
+
+    by_code = {row["code"]: row for row in codes.to_pylist()}
+    assert len(by_code) == len(CODES) + 1
+    assert by_code["LAB//GLUCOSE"]["code/n_occurrences"] == 4
+    assert by_code["LAB//GLUCOSE"]["code/n_subjects"] == 3
+    assert by_code["LAB//GLUCOSE"]["description"] == "Glucose"
+    assert by_code["NEVER_USED"]["code/n_occurrences"] == 0
+    assert by_code["NEVER_USED"]["values/min"] is None
+
+    # Rewriting replaces the statistics rather than adding columns.
+    assert write_code_stats(meds_root).equals(codes)
@@ -0,0 +1,136 @@
+import os
+import pickle
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from conftest import SHARDS, SPLITS
+
+from meds import MEDSDataset, build_arrow_cache, build_subject_index, subject_index_filepath
+
+
+def _expected_subject(subject_id):
+    return [r for rows in SHARDS.values() for r in rows if r[0] == subject_id]
+
+
+def _rows(table):
+    return list(zip(*(table.column(c).to_pylist() for c in ["subject_id", "time", "code", "numeric_value"])))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_build_subject_index(meds_root, workers):
+    """
+    Test that the subject index locates every (subject, row group) chunk of the dataset.
+    """
+    index = build_subject_index(meds_root, workers=workers)
+    assert index.equals(pq.read_table(os.path.join(meds_root, subject_index_filepath)))
+
+    # Shards are written with row groups of 3 rows, so subject 1 spans two row groups of the train shard.
+    assert index.filter(pa.compute.equal(index["subject_id"], 1)).to_pylist() == [
+        {
+            "subject_id": 1,
+            "shard": "data/train/0.parquet",
+            "row_group": 0,
+            "row_offset": 0,
+            "length": 3,
+            "static_length": 1,
+        },
+        {
+            "subject_id": 1,
+            "shard": "data/train/0.parquet",
+            "row_group": 1,
+            "row_offset": 0,
+            "length": 3,
+            "static_length": 0,
+        },
+    ]
+    assert sum(index["length"].to_pylist()) == sum(map(len, SHARDS.values()))
+
+
+def test_get_subject(meds_root):
+    """
+    Test that subjects are read back exactly, including those spanning row groups.
+    """
+    dataset = MEDSDataset(meds_root)
+    with pytest.raises(FileNotFoundError):
+        dataset.get_subject(1)
+
+    build_subject_index(meds_root)
+    dataset = MEDSDataset(meds_root)
+    assert dataset.subject_ids.tolist() == [1, 2, 3, 4]
+    for subject_id in [1, 2, 3, 4]:
+        assert _rows(dataset.get_subject(subject_id)) == _expected_subject(subject_id)
+
+    assert dataset.get_subject(4, columns=["code"]).column_names == ["code"]
+    with pytest.raises(KeyError):
+        dataset.get_subject(5)
+
+
+def test_get_subject_memory_map(meds_root):
+    """
+    Test that subjects read from the memory-mapped Arrow cache match the parquet shards, without copies.
+    """
+    build_subject_index(meds_root)
+    dataset = MEDSDataset(meds_root, memory_map=True)
+    with pytest.raises(FileNotFoundError):
+        dataset.get_subject(1)
+
+    paths = build_arrow_cache(meds_root, workers=2)
+    assert len(paths) == 2 and all(p.endswith(".arrow") for p in paths)
+
+    dataset = MEDSDataset(meds_root, memory_map=True)
+    for subject_id in [1, 2, 3, 4]:
+        assert _rows(dataset.get_subject(subject_id)) == _expected_subject(subject_id)
+
+    before = pa.total_allocated_bytes()
+    codes = dataset.get_subject(2, columns=["code"]).column("code")
+    assert pa.total_allocated_bytes() == before
+    assert codes.to_pylist() == [r[2] for r in _expected_subject(2)]
+
+    restored = pickle.loads(pickle.dumps(dataset))
+    assert _rows(restored.get_subject(3)) == _expected_subject(3)
+
+
+def test_get_subject_static_and_dynamic(meds_root):
+    """
+    Test that a subject's static and dynamic events are split using the static lengths in the subject index.
+    """
+    build_subject_index(meds_root)
+    dataset = MEDSDataset(meds_root)
+    for subject_id in [1, 2, 3, 4]:
+        expected = _expected_subject(subject_id)
+        static, dynamic = dataset.get_subject_static_and_dynamic(subject_id)
+        assert _rows(static) == [r for r in expected if r[1] is None]
+        assert _rows(dynamic) == [r for r in expected if r[1] is not None]
+
+    static, dynamic = dataset.get_subject_static_and_dynamic(1, columns=["code"])
+    assert static.column_names == ["code"]
+    assert static.column("code").to_pylist() == ["MEDS_BIRTH"]
+    assert dynamic.num_rows == 5
+
+
+@pytest.mark.parametrize("with_index", [False, True])
+def test_iter_split(meds_root, with_index):
+    """
+    Test that iterating over a split yields exactly its members' events, skipping shards without members.
+    """
+    if with_index:
+        build_subject_index(meds_root)
+    dataset = MEDSDataset(meds_root)
+
+    members = dataset.split_members()
+    assert {split: sorted(os.path.basename(os.path.dirname(s)) for s in m) for split, m in members.items()} == {
+        "train": ["train"],
+        "held_out": ["held_out"],
+        "tuning": ["held_out"],
+    }
+    assert [ids.tolist() for ids in members["train"].values()] == [[1, 2]]
+
+    for split in ["train", "held_out", "tuning"]:
+        split_ids = [s for s, v in SPLITS if v == split]
+        expected = [r for s in split_ids for r in _expected_subject(s)]
+        assert [r for t in dataset.iter_split(split) for r in _rows(t)] == expected
+
+    assert list(dataset.iter_split("unknown")) == []
+    tables = list(dataset.iter_split("tuning", columns=["code"]))
+    assert [t.column_names for t in tables] == [["code"]]
@@ -0,0 +1,70 @@
+import datetime
+import os
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+from conftest import SHARDS, write_labels
+
+from meds._utils import NULL_TIME, data_shards
+from meds.export import export_arrays, load_csr, load_ragged
+from meds.features import window_features
+from meds.vocab import code_vocabulary
+
+
+def _dataset_rows(root):
+    return [r for shard in data_shards(root) for r in SHARDS[os.path.relpath(shard, os.path.join(root, "data"))]]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_export_arrays(meds_root, tmp_path, workers):
+    """
+    Test that the exported ragged arrays hold every event in dataset order, and the CSR matrix per-subject counts.
+    """
+    out = export_arrays(meds_root, str(tmp_path / "export"), workers=workers)
+    assert not os.path.exists(os.path.join(out, ".parts"))
+    vocabulary = code_vocabulary(meds_root).to_pylist()
+    rows = _dataset_rows(meds_root)
+
+    ragged = load_ragged(out)
+    assert isinstance(ragged["code_ids"], np.memmap)
+    assert ragged["code_ids"].dtype == np.int32 and ragged["values"].dtype == np.float32
+    subject_ids = ragged["subject_ids"].tolist()
+    assert subject_ids == [3, 4, 1, 2]
+    assert ragged["offsets"].tolist() == [0, 3, 5, 11, 14]
+    assert [vocabulary[c] for c in ragged["code_ids"]] == [r[2] for r in rows]
+    epoch = datetime.datetime(1970, 1, 1)
+    assert ragged["times"].tolist() == [
+        NULL_TIME if r[1] is None else (r[1] - epoch) // datetime.timedelta(microseconds=1) for r in rows
+    ]
+    assert np.array_equal(ragged["values"], np.array([np.nan if r[3] is None else r[3] for r in rows]), equal_nan=True)
+
+    matrix = load_csr(out)
+    assert matrix.shape == (4, len(vocabulary))
+    expected = np.zeros(matrix.shape)
+    for r in rows:
+        expected[subject_ids.index(r[0]), vocabulary.index(r[2])] += 1
+    assert np.array_equal(matrix.toarray(), expected)
+
+    assert pq.read_table(os.path.join(out, "code_vocab.parquet")).column("code").to_pylist() == vocabulary
+
+
+def test_export_arrays_values_and_labels(meds_root, tmp_path):
+    """
+    Test that CSR matrices can aggregate values, and can have one row per label, aggregating its history.
+    """
+    out = export_arrays(meds_root, str(tmp_path / "mean"), aggregation="mean")
+    glucose = code_vocabulary(meds_root).to_pylist().index("LAB//GLUCOSE")
+    matrix = load_csr(out)
+    assert matrix.nnz == 3
+    assert matrix.toarray()[:, glucose].tolist() == [100.0, 0.0, 130.0, 90.0]
+
+    label_dir = str(tmp_path / "labels")
+    write_labels(label_dir)
+    out = export_arrays(meds_root, str(tmp_path / "labeled"), aggregation="last", label_dir=label_dir, workers=2)
+    expected, labels = window_features(meds_root, label_dir, [None], ["last"])
+    assert pq.read_table(os.path.join(out, "labels.parquet")).equals(labels)
+    assert np.array_equal(load_csr(out).toarray(), expected.toarray())
+
+    with pytest.raises(ValueError):
+        export_arrays(meds_root, str(tmp_path / "bad"), aggregation="median")
@@ -0,0 +1,84 @@
+import datetime
+import math
+
+import numpy as np
+import pytest
+from conftest import LABELS, SHARDS, write_labels
+
+from meds.features import feature_names, window_features
+from meds.labels import colocate_labels
+from meds.sparse import SparseMatrix
+from meds.vocab import code_vocabulary
+
+WINDOWS = [datetime.timedelta(days=1), datetime.timedelta(days=365), None]
+
+
+def _expected_features(subject_id, prediction_time, vocabulary, windows, aggregations):
+    events = [r for rows in SHARDS.values() for r in rows if r[0] == subject_id]
+    out = {}
+    for code in vocabulary:
+        for window in windows:
+            if window is None:
+                in_window = [r for r in events if r[2] == code and (r[1] is None or r[1] <= prediction_time)]
+            else:
+                start = prediction_time - window
+                in_window = [r for r in events if r[2] == code and r[1] is not None and start < r[1] <= prediction_time]
+            values = [r[3] for r in in_window if r[3] is not None]
+            for aggregation in aggregations:
+                name = f"{code}/{'full' if window is None else f'{window.days}d'}/{aggregation}"
+                if aggregation == "count" and in_window:
+                    out[name] = len(in_window)
+                elif aggregation == "mean" and values:
+                    out[name] = sum(values) / len(values)
+                elif aggregation == "last" and values:
+                    out[name] = values[-1]
+    return out
+
+
+@pytest.mark.parametrize("workers,colocated", [(1, False), (2, False), (1, True)])
+def test_window_features(meds_root, tmp_path, workers, colocated):
+    """
+    Test that window aggregation features match a brute-force computation over each label's history.
+    """
+    label_dir = str(tmp_path / "labels")
+    write_labels(label_dir)
+    if colocated:
+        colocate_labels(meds_root, label_dir, str(tmp_path / "colocated"))
+        label_dir = str(tmp_path / "colocated")
+
+    aggregations = ["count", "mean", "last"]
+    matrix, labels = window_features(
+        meds_root, label_dir, WINDOWS, aggregations, colocated=colocated, workers=workers, batch_size=2
+    )
+    vocabulary = code_vocabulary(meds_root).to_pylist()
+    names = feature_names(code_vocabulary(meds_root), WINDOWS, aggregations)
+    assert matrix.shape == (5, len(names))
+    # The label of subject 5, who is not in the dataset, is dropped.
+    assert sorted(labels.column("subject_id").to_pylist()) == sorted(s for s, _, _ in LABELS if s != 5)
+
+    dense = matrix.toarray()
+    for row, label in enumerate(labels.to_pylist()):
+        expected = _expected_features(label["subject_id"], label["prediction_time"], vocabulary, WINDOWS, aggregations)
+        actual = {names[col]: dense[row, col] for col in np.flatnonzero(dense[row])}
+        assert actual.keys() == expected.keys()
+        for name, value in expected.items():
+            assert math.isclose(actual[name], value)
+
+    with pytest.raises(ValueError):
+        window_features(meds_root, label_dir, aggregations=["median"])
+
+
+def test_sparse_matrix():
+    """
+    Test that CSR matrices built from unordered triplets match their dense equivalent, in numpy and scipy.
+    """
+    matrix = SparseMatrix.from_coo(np.array([2, 0, 2, 0]), np.array([3, 1, 0, 0]), np.arange(1.0, 5.0), (4, 5))
+    expected = np.zeros((4, 5))
+    expected[[2, 0, 2, 0], [3, 1, 0, 0]] = np.arange(1.0, 5.0)
+    assert matrix.nnz == 4
+    assert matrix.indptr.tolist() == [0, 2, 2, 4, 4]
+    assert np.array_equal(matrix.toarray(), expected)
+
+    scipy_sparse = pytest.importorskip("scipy.sparse")
+    assert isinstance(matrix.to_scipy(), scipy_sparse.csr_matrix)
+    assert np.array_equal(matrix.to_scipy().toarray(), expected)
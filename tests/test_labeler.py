@@ -0,0 +1,72 @@
+import datetime
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from meds import label_schema
+from meds.labeler import materialize_labels
+from meds.labels import join_labels
+
+
+def _labels(paths):
+    table = pa.concat_tables([pq.read_table(p) for p in paths])
+    assert table.schema.equals(label_schema)
+    return [(r["subject_id"], r["prediction_time"], r["boolean_value"], r["integer_value"]) for r in table.to_pylist()]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_materialize_labels(meds_root, tmp_path, workers):
+    """
+    Test that labels count outcome events in the window after each distinct trigger time.
+    """
+    out = str(tmp_path / "mortality")
+    paths = materialize_labels(
+        meds_root, out, ["ADMISSION"], ["MEDS_DEATH"], datetime.timedelta(days=30), workers=workers
+    )
+    assert sorted(os.path.relpath(p, out) for p in paths) == [
+        os.path.join("held_out", "0.parquet"),
+        os.path.join("train", "0.parquet"),
+    ]
+    assert _labels(sorted(paths, reverse=True)) == [
+        (1, datetime.datetime(2020, 3, 1), True, 1),
+        (3, datetime.datetime(2017, 1, 1), False, 0),
+        (3, datetime.datetime(2022, 1, 1), False, 0),
+    ]
+
+    # Labels are aligned with the data shards.
+    joined = dict(join_labels(meds_root, out, colocated=True))
+    assert sum(t.num_rows for t in joined.values()) == 3
+
+    # Without a full window of follow-up, negative labels are dropped.
+    paths = materialize_labels(
+        meds_root, out, ["ADMISSION"], ["MEDS_DEATH"], datetime.timedelta(days=30), require_full_window=True
+    )
+    assert [label[:2] for label in _labels(sorted(paths, reverse=True))] == [
+        (1, datetime.datetime(2020, 3, 1)),
+        (3, datetime.datetime(2017, 1, 1)),
+    ]
+
+
+def test_materialize_labels_descendants(meds_root, tmp_path):
+    """
+    Test that code predicates can include descendant codes, and that outcome windows exclude their start.
+    """
+    window = datetime.timedelta(days=365)
+    paths = materialize_labels(meds_root, str(tmp_path / "a"), ["ICD10CM/E11"], ["LAB//GLUCOSE"], window)
+    assert _labels(sorted(paths, reverse=True)) == [(4, datetime.datetime(2020, 1, 1), False, 0)]
+
+    paths = materialize_labels(
+        meds_root, str(tmp_path / "b"), ["ICD10CM/E11"], ["LAB//GLUCOSE"], window, include_descendants=True
+    )
+    assert _labels(sorted(paths, reverse=True)) == [
+        (1, datetime.datetime(2019, 1, 1), True, 1),
+        (2, datetime.datetime(2018, 5, 1), False, 0),
+        (4, datetime.datetime(2020, 1, 1), False, 0),
+    ]
+
+    paths = materialize_labels(
+        meds_root, str(tmp_path / "c"), ["ICD10CM/E11.65"], ["LAB//GLUCOSE"], window, prediction_delay=-window
+    )
+    assert _labels(sorted(paths, reverse=True)) == [(1, datetime.datetime(2018, 1, 1), True, 1)]
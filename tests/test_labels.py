@@ -0,0 +1,68 @@
+import os
+
+import pyarrow.parquet as pq
+import pytest
+from conftest import LABELS, SHARDS, write_labels
+
+from meds import build_subject_index
+from meds.labels import colocate_labels, join_labels
+
+
+def _expected_slice(shard_rows, subject_id, prediction_time):
+    rows = [i for i, r in enumerate(shard_rows) if r[0] == subject_id]
+    usable = [i for i in rows if shard_rows[i][1] is None or shard_rows[i][1] <= prediction_time]
+    return rows[0], (usable[-1] + 1 if usable else rows[0])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_join_labels(meds_root, tmp_path, workers):
+    """
+    Test that each label is joined to its subject's events up to and including the prediction time.
+    """
+    label_dir = str(tmp_path / "tasks" / "nested" / "task")
+    write_labels(label_dir)
+
+    joined = list(join_labels(meds_root, label_dir, workers=workers))
+    assert [os.path.relpath(shard, meds_root) for shard, _ in joined] == [
+        os.path.join("data", "held_out", "0.parquet"),
+        os.path.join("data", "train", "0.parquet"),
+    ]
+
+    n_labels = 0
+    for shard, labels in joined:
+        shard_rows = SHARDS[os.path.relpath(shard, os.path.join(meds_root, "data"))]
+        for label in labels.to_pylist():
+            expected = _expected_slice(shard_rows, label["subject_id"], label["prediction_time"])
+            assert (label["event_start"], label["event_end"]) == expected
+            n_labels += 1
+
+    # Subject 5 is not in the dataset.
+    assert n_labels == len(LABELS) - 1
+
+
+@pytest.mark.parametrize("with_index", [False, True])
+def test_colocate_labels(meds_root, tmp_path, with_index):
+    """
+    Test that colocated labels align with data shards and join identically.
+    """
+    if with_index:
+        build_subject_index(meds_root)
+
+    label_dir = str(tmp_path / "task")
+    write_labels(label_dir, n_files=3)
+    out_dir = str(tmp_path / "colocated")
+
+    paths = colocate_labels(meds_root, label_dir, out_dir, workers=2, batch_size=2)
+    assert sorted(os.path.relpath(p, out_dir) for p in paths) == [
+        os.path.join("held_out", "0.parquet"),
+        os.path.join("train", "0.parquet"),
+    ]
+    assert sorted(os.listdir(out_dir)) == ["held_out", "train"]
+    assert pq.read_table(os.path.join(out_dir, "train", "0.parquet")).column("subject_id").to_pylist() == [1, 1, 2]
+
+    expected = [(shard, labels.sort_by("subject_id")) for shard, labels in join_labels(meds_root, label_dir)]
+    got = [(shard, labels.sort_by("subject_id")) for shard, labels in join_labels(meds_root, out_dir, colocated=True)]
+    assert [(s, t.to_pylist()) for s, t in got] == [(s, t.to_pylist()) for s, t in expected]
+
+    with pytest.raises(ValueError):
+        colocate_labels(meds_root, label_dir, label_dir)
@@ -0,0 +1,63 @@
+import math
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from conftest import SHARDS
+
+from meds import validate_dataset
+from meds.code_stats import write_code_stats
+from meds.normalize import normalize_dataset
+from meds.sketches import compute_sketches, write_sketches
+
+GLUCOSE = [r[3] for rows in SHARDS.values() for r in rows if r[2] == "LAB//GLUCOSE"]
+
+
+def _output(out, column):
+    table = pa.concat_tables([pq.read_table(os.path.join(out, "data", name)) for name in sorted(SHARDS)])
+    return table.column(column).to_pylist()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_normalize_zscore(meds_root, tmp_path, workers):
+    """
+    Test that values are standardized by their code's mean and standard deviation from the code statistics.
+    """
+    write_code_stats(meds_root)
+    out = str(tmp_path / "out")
+    normalize_dataset(meds_root, out, workers=workers)
+    validate_dataset(out)
+
+    mean, std = np.mean(GLUCOSE), np.std(GLUCOSE)
+    rows = [r for name in sorted(SHARDS) for r in SHARDS[name]]
+    for row, value in zip(rows, _output(out, "numeric_value")):
+        if row[2] == "LAB//GLUCOSE":
+            assert math.isclose(value, (row[3] - mean) / std, rel_tol=1e-6)
+        else:
+            assert value is None
+
+    with pytest.raises(ValueError):
+        normalize_dataset(meds_root, meds_root)
+    with pytest.raises(ValueError):
+        normalize_dataset(meds_root, str(tmp_path / "other"), method="log")
+
+
+def test_normalize_quantile_bins(meds_root, tmp_path):
+    """
+    Test that values are binned by their code's sketched quantiles into a custom property.
+    """
+    write_sketches(meds_root, compute_sketches(meds_root))
+    out = str(tmp_path / "out")
+    normalize_dataset(meds_root, out, method="quantile_bins", n_bins=2, output_field="value_bin")
+    validate_dataset(out)
+
+    shard = pq.read_table(os.path.join(out, "data", "train", "0.parquet"))
+    assert shard.schema.field("value_bin").type == pa.int32()
+    assert shard.schema.field("code").type == pa.string()
+    # The median of the glucose values is 110.
+    rows = [r for name in sorted(SHARDS) for r in SHARDS[name]]
+    expected = [None if r[3] is None else int(r[3] >= 110) for r in rows]
+    assert _output(out, "value_bin") == expected
+    assert _output(out, "numeric_value") == [r[3] for r in rows]
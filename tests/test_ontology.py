@@ -0,0 +1,69 @@
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from meds.ontology import OntologyIndex
+
+
+def test_ontology_from_code_metadata(meds_root):
+    """
+    Test that ancestry queries follow the parent codes of the code metadata transitively.
+    """
+    ontology = OntologyIndex.from_code_metadata(meds_root)
+    codes = pa.array(["ICD10CM/E11.65", "ICD10CM/E11.9", "ICD10CM/E11", "LAB//GLUCOSE", None, "UNKNOWN"])
+
+    assert ontology.is_descendant(codes, "ICD10CM/E11").tolist() == [True, True, True, False, False, False]
+    assert ontology.is_descendant(codes, "ICD10CM/E11", include_self=False).tolist() == [
+        True,
+        True,
+        False,
+        False,
+        False,
+        False,
+    ]
+    assert ontology.is_descendant(codes, "ICD10CM/E11.6").tolist() == [True, False, False, False, False, False]
+    assert ontology.is_descendant(codes.dictionary_encode(), "ICD10CM/E11.6").tolist()[0]
+    assert ontology.is_descendant(ontology.node_ids(codes), "ICD10CM/E11").sum() == 3
+
+    assert ontology.expand_descendants("ICD10CM/E11").to_pylist() == [
+        "ICD10CM/E11",
+        "ICD10CM/E11.6",
+        "ICD10CM/E11.65",
+        "ICD10CM/E11.9",
+    ]
+    assert ontology.expand_descendants("ICD10CM/E11.65", include_self=False).to_pylist() == []
+    assert ontology.ancestors("ICD10CM/E11.65").to_pylist() == ["ICD10CM/E11", "ICD10CM/E11.6"]
+
+    with pytest.raises(KeyError):
+        ontology.is_descendant(codes, "UNKNOWN")
+
+
+def test_ontology_closure():
+    """
+    Test the transitive closure of a DAG with shared ancestors, parents missing from the codes, and a cycle.
+    """
+    codes = pa.array(["a", "b", "c", "d", "d", "x", "y"])
+    parent_codes = pa.array([["b", "c"], ["root"], ["root"], ["a"], ["c"], ["y"], ["x"]], pa.list_(pa.string()))
+    ontology = OntologyIndex(codes, parent_codes)
+
+    assert ontology.nodes.to_pylist() == ["a", "b", "c", "d", "root", "x", "y"]
+    assert ontology.ancestors("d").to_pylist() == ["a", "b", "c", "root"]
+    assert ontology.expand_descendants("root", include_self=False).to_pylist() == ["a", "b", "c", "d"]
+    assert ontology.ancestors("x").to_pylist() == ["y"]
+    assert ontology.ancestors("y").to_pylist() == ["x"]
+
+    # The closure agrees with a brute-force search over the parent adjacency.
+    for node in range(len(ontology)):
+        expected = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            parents = ontology.parent_indices[ontology.parent_indptr[current] : ontology.parent_indptr[current + 1]]
+            for parent in parents:
+                if parent not in expected:
+                    expected.add(int(parent))
+                    stack.append(parent)
+        expected.discard(node)
+        ancestors = ontology.ancestor_indices[ontology.ancestor_indptr[node] : ontology.ancestor_indptr[node + 1]]
+        assert set(ancestors.tolist()) == expected
+        assert np.all(np.diff(ancestors) > 0)
@@ -0,0 +1,77 @@
+import datetime
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from conftest import SHARDS
+
+from meds import MEDSDataset
+from meds.query import read_events
+
+
+def _expected(start=None, end=None, subject_ids=None, include_static=False):
+    out = []
+    for rows in SHARDS.values():
+        for row in rows:
+            subject_id, time = row[0], row[1]
+            if subject_ids is not None and subject_id not in subject_ids:
+                continue
+            if start is not None or end is not None:
+                if time is None:
+                    if not include_static:
+                        continue
+                elif (start is not None and time < start) or (end is not None and time >= end):
+                    continue
+            out.append(row)
+    return sorted(out, key=lambda r: (r[0], r[1] or datetime.datetime.min))
+
+
+def _rows(tables):
+    if not tables:
+        return []
+    table = pa.concat_tables(tables)
+    rows = zip(*(table.column(c).to_pylist() for c in ["subject_id", "time", "code", "numeric_value"]))
+    return sorted(rows, key=lambda r: (r[0], r[1] or datetime.datetime.min))
+
+
+def test_read_events(meds_root):
+    """
+    Test that time windows and subject sets select exactly the matching events.
+    """
+    dataset = MEDSDataset(meds_root)
+    start, end = datetime.datetime(2019, 1, 1), datetime.datetime(2021, 1, 1)
+
+    assert _rows(list(dataset.read_events())) == _expected()
+    assert _rows(list(dataset.read_events(start, end))) == _expected(start, end)
+    assert _rows(list(dataset.read_events(start, end, include_static=True))) == _expected(start, end, None, True)
+    assert _rows(list(dataset.read_events(subject_ids={2, 4}))) == _expected(subject_ids={2, 4})
+    assert _rows(list(dataset.read_events(end=start, subject_ids=[3]))) == _expected(None, start, {3})
+    assert list(dataset.read_events(subject_ids=[])) == []
+
+    tables = list(dataset.read_events(start, end, columns=["code"]))
+    assert all(t.column_names == ["code"] for t in tables)
+
+
+def test_read_events_skips_row_groups(meds_root, monkeypatch):
+    """
+    Test that row groups ruled out by their statistics are never read.
+    """
+    read = []
+    original = pq.ParquetFile.read_row_group
+
+    def read_row_group(self, i, *args, **kwargs):
+        read.append(i)
+        return original(self, i, *args, **kwargs)
+
+    monkeypatch.setattr(pq.ParquetFile, "read_row_group", read_row_group)
+
+    path = os.path.join(meds_root, "data", "train", "0.parquet")
+    # Row groups hold rows [0, 3), [3, 6) and [6, 9); the first only has events up to 2019-01-01.
+    start, end = datetime.datetime(2020, 1, 1), datetime.datetime(2020, 12, 31)
+    tables = list(read_events([path], start, end))
+    assert read == [1, 2]
+    assert _rows(tables) == [r for r in SHARDS[os.path.join("train", "0.parquet")] if r[1] and start <= r[1] < end]
+
+    read.clear()
+    assert list(read_events([path], subject_ids=[3])) == []
+    assert read == []
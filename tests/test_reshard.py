@@ -0,0 +1,57 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from conftest import SHARDS
+
+from meds import code_metadata_filepath, validate_dataset
+from meds.reshard import reshard
+
+
+def _all_rows(paths):
+    table = pa.concat_tables([pq.read_table(p) for p in paths])
+    return list(zip(*(table.column(c).to_pylist() for c in ["subject_id", "time", "code", "numeric_value"])))
+
+
+@pytest.mark.parametrize("max_events", [1, 3, 4, 7, 100])
+def test_reshard_max_events(meds_root, tmp_path, max_events):
+    """
+    Test that resharding keeps whole subjects in order and respects the target size.
+    """
+    out = str(tmp_path / "out")
+    paths = reshard(meds_root, out, max_events=max_events, row_group_size=2, workers=2)
+
+    input_rows = [r for name in sorted(SHARDS) for r in SHARDS[name]]
+    assert _all_rows(paths) == input_rows
+    validate_dataset(out)
+    assert os.path.exists(os.path.join(out, code_metadata_filepath))
+
+    subject_sizes = {s: sum(1 for r in input_rows if r[0] == s) for s in {r[0] for r in input_rows}}
+    for path in paths:
+        subject_ids = pq.read_table(path).column("subject_id").to_pylist()
+        # A shard exceeds the target only by its last subject.
+        assert len(subject_ids) - subject_sizes[subject_ids[-1]] < max_events
+        # A subject larger than the target gets a shard of its own.
+        if any(subject_sizes[s] > max_events for s in subject_ids):
+            assert len(set(subject_ids)) == 1
+
+    if max_events >= len(input_rows):
+        assert len(paths) == 1
+    if max_events == 1:
+        assert len(paths) == len(subject_sizes)
+
+
+def test_reshard_max_bytes(meds_root, tmp_path):
+    """
+    Test that resharding by byte size splits the dataset at subject boundaries.
+    """
+    out = str(tmp_path / "out")
+    paths = reshard(meds_root, out, max_bytes=1)
+    assert len(paths) == 4
+    validate_dataset(out)
+
+    with pytest.raises(ValueError):
+        reshard(meds_root, str(tmp_path / "other"))
+    with pytest.raises(ValueError):
+        reshard(meds_root, meds_root, max_events=10)
@@ -0,0 +1,62 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from conftest import SHARDS
+
+from meds import build_subject_index, subject_index_filepath, validate_dataset
+from meds.ontology import OntologyIndex
+from meds.rollup import rollup_codes, rollup_dataset
+
+ROLLUP = {
+    "ICD10CM/E11.65": ["ICD10CM/E11"],
+    "ICD10CM/E11.9": ["ICD10CM/E11"],
+}
+
+
+def _rows(root):
+    return [r for name in sorted(SHARDS) for r in pq.read_table(os.path.join(root, "data", name)).to_pylist()]
+
+
+def test_rollup_codes():
+    """
+    Test that codes roll up to all their ancestors at a depth, or to themselves if they are not deeper.
+    """
+    codes = pa.array(["a", "b", "c", "d", "root", "x"])
+    parent_codes = pa.array([["b", "c"], ["root"], ["root"], ["a"], [], []], pa.list_(pa.string()))
+    ontology = OntologyIndex(codes, parent_codes)
+    assert ontology.depths.tolist() == [2, 1, 1, 3, 0, 0]
+
+    query = pa.array(["d", "a", "root", "unknown", "x", "d"]).dictionary_encode()
+    assert rollup_codes(ontology, query, 0).to_pylist() == [["root"], ["root"], ["root"], ["unknown"], ["x"], ["root"]]
+    assert rollup_codes(ontology, query, 1).to_pylist() == [
+        ["b", "c"],
+        ["b", "c"],
+        ["root"],
+        ["unknown"],
+        ["x"],
+        ["b", "c"],
+    ]
+    assert rollup_codes(ontology, query, 3).to_pylist() == [["d"], ["a"], ["root"], ["unknown"], ["x"], ["d"]]
+
+
+@pytest.mark.parametrize("explode", [False, True])
+def test_rollup_dataset(meds_root, tmp_path, explode):
+    """
+    Test that datasets are rolled up, as a list column or as rolled-up events, in valid MEDS shards.
+    """
+    build_subject_index(meds_root)
+    out = str(tmp_path / "out")
+    rollup_dataset(meds_root, out, depth=0, explode=explode, workers=2)
+    validate_dataset(out)
+    assert os.path.exists(os.path.join(out, subject_index_filepath)) != explode
+
+    rows = _rows(meds_root)
+    if explode:
+        assert _rows(out) == [{**r, "code": ROLLUP.get(r["code"], [r["code"]])[0]} for r in rows]
+    else:
+        assert _rows(out) == [{**r, "rollup_codes": ROLLUP.get(r["code"], [r["code"]])} for r in rows]
+
+    with pytest.raises(ValueError):
+        rollup_dataset(meds_root, meds_root, depth=0)
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pyarrow.compute as pc
+import pytest
+from conftest import write_data_shard
+
+from meds.sketches import (
+    code_sketch_schema,
+    compute_sketches,
+    load_sketches,
+    merge_sketches,
+    sketch_quantiles,
+    write_sketches,
+)
+
+
+def test_sketch_quantiles_exact(meds_root):
+    """
+    Test that sketches of few distinct values give exact, interpolated quantiles.
+    """
+    sketches = compute_sketches(meds_root)
+    assert sketches.schema.equals(code_sketch_schema)
+    assert sketches.column("code").unique().to_pylist() == ["LAB//GLUCOSE"]
+
+    quantiles = sketch_quantiles(sketches, [0.0, 0.5, 1.0]).to_pylist()
+    assert quantiles == [
+        {
+            "code": "LAB//GLUCOSE",
+            "values/quantile/0.0": 90.0,
+            "values/quantile/0.5": 110.0,
+            "values/quantile/1.0": 140.0,
+        }
+    ]
+
+    path = write_sketches(meds_root, sketches)
+    assert os.path.exists(path)
+    assert load_sketches(meds_root).equals(sketches)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_sketch_quantiles_accuracy(tmp_path, workers):
+    """
+    Test that merged sketches of many values stay small and estimate quantiles accurately.
+    """
+    rng = np.random.default_rng(0)
+    values = {"A": rng.normal(0, 1, 30_000), "B": rng.exponential(1, 30_000)}
+    root = tmp_path / "meds"
+    for shard in range(3):
+        rows = [
+            (shard * 10 + i % 10, None, code, float(v))
+            for code, vs in values.items()
+            for i, v in enumerate(vs[shard::3])
+        ]
+        rows.sort(key=lambda r: r[0])
+        write_data_shard(str(root / "data" / f"{shard}.parquet"), rows, row_group_size=10_000)
+
+    sketches = compute_sketches(str(root), compression=100, workers=workers, merge_every=2)
+    for code in values:
+        assert pc.sum(pc.equal(sketches.column("code"), code)).as_py() <= 101
+
+    qs = [0.001, 0.01, 0.25, 0.5, 0.75, 0.99, 0.999]
+    estimates = sketch_quantiles(sketches, qs)
+    assert estimates.column("code").to_pylist() == ["A", "B"]
+    for i, code in enumerate(["A", "B"]):
+        for q in qs:
+            # Compare in rank space, where the t-digest error is smallest near the tails.
+            rank = (values[code] <= estimates.column(f"values/quantile/{q}")[i].as_py()).mean()
+            assert abs(rank - q) < 0.01 * min(q, 1 - q) * 4 + 0.001
+
+    # Merging is insensitive to how values were partitioned.
+    merged = merge_sketches([sketches.slice(0, 50), sketches.slice(50)])
+    assert merged.num_rows <= sketches.num_rows
+    assert np.allclose(
+        sketch_quantiles(merged, [0.5]).column(1).to_numpy(), estimates.column("values/quantile/0.5").to_numpy()
+    )
+
+    assert sketch_quantiles(code_sketch_schema.empty_table(), [0.5]).num_rows == 0
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from meds import data_schema
+from meds import sort as meds_sort
+from meds.sort import sort_events
+from meds.validate import validate_shards
+
+
+def _random_events(n, seed):
+    rng = np.random.default_rng(seed)
+    times = rng.integers(0, 10**6, n).astype("datetime64[s]").astype("datetime64[us]")
+    times = pa.array(times, pa.timestamp("us"), mask=rng.random(n) < 0.1)
+    return pa.table(
+        {
+            "subject_id": rng.integers(0, 200, n),
+            "time": times,
+            "code": pa.array(rng.choice(["A", "B", "C"], n)),
+            "numeric_value": pa.array(rng.random(n), pa.float32()),
+            "seq": np.arange(n) + seed * n,
+        }
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_sort_events(tmp_path, monkeypatch, workers):
+    """
+    Test that unsorted events are externally sorted into valid, size-bounded shards.
+    """
+    monkeypatch.setattr(meds_sort, "_MIN_CHUNK_ROWS", 16)
+    inputs = []
+    for i in range(3):
+        path = str(tmp_path / f"raw_{i}.parquet")
+        pq.write_table(_random_events(2000, i), path, row_group_size=300)
+        inputs.append(path)
+
+    out = str(tmp_path / "meds")
+    paths = sort_events(
+        inputs,
+        out,
+        custom_properties=[("seq", pa.int64())],
+        memory_budget=20_000,
+        events_per_shard=1000,
+        row_group_size=250,
+        workers=workers,
+        tmp_dir=str(tmp_path),
+    )
+    assert [os.path.relpath(p, out) for p in paths] == [os.path.join("data", f"{i}.parquet") for i in range(len(paths))]
+    assert not [f for f in os.listdir(tmp_path) if f.startswith("meds_sort_")]
+
+    validate_shards(paths)
+    for path in paths:
+        assert pq.read_schema(path).equals(data_schema([("seq", pa.int64())]))
+
+    got = pa.concat_tables([pq.read_table(p) for p in paths])
+    raw = pa.concat_tables([pq.read_table(p) for p in inputs])
+    times = raw["time"].cast(pa.int64()).fill_null(np.iinfo(np.int64).min).to_numpy()
+    expected = raw.take(np.lexsort((times, raw["subject_id"].to_numpy())))
+    # Ties keep their input order, so the sort is fully deterministic.
+    assert got["seq"].to_pylist() == expected["seq"].to_pylist()
+
+    # Shards end at the first subject boundary past the target size.
+    for path in paths[:-1]:
+        subject_ids = pq.read_table(path)["subject_id"].to_numpy()
+        last_subject_start = np.flatnonzero(subject_ids != subject_ids[-1])[-1] + 1
+        assert last_subject_start < 1000 <= len(subject_ids)
+
+
+def test_sort_events_ties_across_chunks(tmp_path, monkeypatch):
+    """
+    Test that tied events keep their input order when they span merge chunk boundaries.
+    """
+    monkeypatch.setattr(meds_sort, "_MIN_CHUNK_ROWS", 2)
+    time = pa.array([0] * 5, pa.timestamp("us"))
+    inputs = []
+    for i, seq in enumerate([[0, 1, 2, 3], [4]]):
+        path = str(tmp_path / f"raw_{i}.parquet")
+        n = len(seq)
+        table = pa.table(
+            {
+                "subject_id": pa.array([1] * n, pa.int64()),
+                "time": time.slice(0, n),
+                "code": pa.array(["A"] * n),
+                "numeric_value": pa.array([None] * n, pa.float32()),
+                "seq": pa.array(seq, pa.int64()),
+            }
+        )
+        pq.write_table(table, path)
+        inputs.append(path)
+
+    out = str(tmp_path / "meds")
+    paths = sort_events(inputs, out, custom_properties=[("seq", pa.int64())], memory_budget=1, tmp_dir=str(tmp_path))
+    assert pa.concat_tables([pq.read_table(p) for p in paths])["seq"].to_pylist() == [0, 1, 2, 3, 4]
@@ -0,0 +1,48 @@
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+from meds import held_out_split, subject_split_schema, train_split, tuning_split, validate_dataset
+from meds.splits import assign_splits, generate_subject_splits, hash_unit_interval
+
+
+def test_hash_unit_interval():
+    """
+    Test that hashed subject IDs are deterministic, seeded and roughly uniform in [0, 1).
+    """
+    subject_ids = np.arange(-50_000, 50_000)
+    u = hash_unit_interval(subject_ids, seed=1)
+    assert ((u >= 0) & (u < 1)).all()
+    assert np.array_equal(u, hash_unit_interval(subject_ids, seed=1))
+    assert not np.array_equal(u, hash_unit_interval(subject_ids, seed=2))
+    assert np.histogram(u, bins=10, range=(0, 1))[0].min() > 9_000
+
+
+def test_assign_splits():
+    """
+    Test that split sizes follow the given fractions, including custom splits.
+    """
+    subject_ids = np.arange(100_000)
+    fractions = {train_split: 0.7, tuning_split: 0.1, held_out_split: 0.1, "special": 0.1}
+    splits = assign_splits(subject_ids, fractions, seed=3).to_numpy(zero_copy_only=False)
+    for split, fraction in fractions.items():
+        assert abs((splits == split).mean() - fraction) < 0.01
+
+    assert (assign_splits(subject_ids, {train_split: 1, "unused": 0}).to_numpy(zero_copy_only=False) == "train").all()
+    with pytest.raises(ValueError):
+        assign_splits(subject_ids, {train_split: -1.0, tuning_split: 2.0})
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_generate_subject_splits(meds_root, tmp_path, workers):
+    """
+    Test that split files cover every subject once and do not depend on the worker count.
+    """
+    path = generate_subject_splits(meds_root, seed=7, workers=workers)
+    table = pq.read_table(path)
+    assert table.schema.equals(subject_split_schema)
+    assert sorted(table.column("subject_id").to_pylist()) == [1, 2, 3, 4]
+    validate_dataset(meds_root)
+
+    other = generate_subject_splits(meds_root, seed=7, workers=3 - workers, output_path=str(tmp_path / "s.parquet"))
+    assert pq.read_table(other).equals(table)
@@ -0,0 +1,49 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from meds.export import load_ragged
+from meds.tensor_cache import SubjectTensorCache
+
+
+def test_subject_tensor_cache(meds_root, tmp_path):
+    """
+    Test that the cache serves each subject's events as read-only views, and survives pickling without its arrays.
+    """
+    cache_dir = str(tmp_path / "cache")
+    with pytest.raises(FileNotFoundError):
+        SubjectTensorCache(cache_dir)
+
+    cache = SubjectTensorCache.build(meds_root, cache_dir, workers=2)
+    ragged = load_ragged(cache_dir)
+    assert len(cache) == 4
+    assert cache.subject_ids.tolist() == [3, 4, 1, 2]
+
+    subject = cache[2]
+    assert subject["subject_id"] == 1
+    assert subject["code_ids"].dtype == np.int32 and subject["times"].dtype == np.int64
+    assert subject["values"].dtype == np.float32
+    assert len(subject["code_ids"]) == 6
+    assert np.shares_memory(subject["code_ids"], cache.arrays["code_ids"])
+    assert not subject["values"].flags.writeable
+    assert np.array_equal(subject["times"], ragged["times"][5:11])
+    assert cache[-1]["subject_id"] == 2
+    with pytest.raises(IndexError):
+        cache[4]
+
+    assert cache.subject_indices([2, 3]).tolist() == [3, 0]
+    with pytest.raises(KeyError):
+        cache.subject_indices([5])
+
+    state = pickle.dumps(cache)
+    assert len(state) < 1024
+    restored = pickle.loads(state)
+    assert restored._arrays is None
+    assert np.array_equal(restored[2]["values"], subject["values"], equal_nan=True)
+
+    # An existing cache is reused rather than rebuilt, unless asked to.
+    mtime = (tmp_path / "cache" / "ragged" / "code_ids.npy").stat().st_mtime_ns
+    SubjectTensorCache.build(meds_root, cache_dir)
+    assert (tmp_path / "cache" / "ragged" / "code_ids.npy").stat().st_mtime_ns == mtime
+    assert len(SubjectTensorCache.build(meds_root, cache_dir, overwrite=True)) == 4
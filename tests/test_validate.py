@@ -0,0 +1,186 @@
+import datetime
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from meds import (
+    MEDSValidationError,
+    code_metadata_filepath,
+    data_schema,
+    dataset_metadata_filepath,
+    subject_splits_filepath,
+    validate_dataset,
+)
+from meds.validate import footer_subject_range, validate_shard, validate_shards, validate_shards_from_statistics
+
+
+def _write_shard(path, rows, schema=None, row_group_size=None):
+    schema = schema or data_schema()
+    table = pa.Table.from_pylist(
+        [{"subject_id": s, "time": t, "code": c, "numeric_value": v} for s, t, c, v in rows], schema=schema
+    )
+    pq.write_table(table, path, row_group_size=row_group_size)
+    return str(path)
+
+
+def _t(day):
+    return datetime.datetime(2020, 1, day)
+
+
+def test_validate_shard(tmp_path):
+    """
+    Test that a conformant shard validates across row group and batch boundaries.
+    """
+    rows = [
+        (3, None, "MEDS_BIRTH", None),
+        (3, _t(1), "A", 1.0),
+        (3, _t(2), "B", None),
+        (1, None, "SEX//F", None),
+        (1, _t(1), "A", 2.0),
+        (1, _t(1), "C", None),
+        (2, _t(5), "A", None),
+    ]
+    path = _write_shard(tmp_path / "0.parquet", rows, row_group_size=2)
+
+    for batch_size in (None, 1, 3, 100):
+        assert validate_shard(path, batch_size=batch_size).to_pylist() == [1, 2, 3]
+
+
+def test_validate_shard_errors(tmp_path):
+    """
+    Test that schema, contiguity and ordering violations are detected.
+    """
+    bad_dtype = data_schema().set(3, pa.field("numeric_value", pa.float64()))
+    path = _write_shard(tmp_path / "dtype.parquet", [(1, _t(1), "A", 1.0)], schema=bad_dtype)
+    with pytest.raises(MEDSValidationError, match="numeric_value"):
+        validate_shard(path)
+
+    rows = [(1, _t(1), "A", None), (2, _t(1), "A", None), (1, _t(2), "A", None)]
+    path = _write_shard(tmp_path / "contiguity.parquet", rows, row_group_size=2)
+    with pytest.raises(MEDSValidationError, match="not contiguous"):
+        validate_shard(path)
+
+    rows = [(1, _t(2), "A", None), (1, _t(1), "A", None)]
+    path = _write_shard(tmp_path / "order.parquet", rows, row_group_size=1)
+    with pytest.raises(MEDSValidationError, match="not sorted"):
+        validate_shard(path)
+
+    rows = [(1, _t(1), "A", None), (1, None, "MEDS_BIRTH", None)]
+    path = _write_shard(tmp_path / "static.parquet", rows)
+    with pytest.raises(MEDSValidationError, match="not sorted"):
+        validate_shard(path)
+
+
+def test_validate_shards_disjoint(tmp_path):
+    """
+    Test that a subject present in two shards is detected.
+    """
+    a = _write_shard(tmp_path / "a.parquet", [(1, _t(1), "A", None), (2, _t(1), "A", None)])
+    b = _write_shard(tmp_path / "b.parquet", [(3, _t(1), "A", None)])
+    c = _write_shard(tmp_path / "c.parquet", [(2, _t(2), "A", None)])
+
+    assert {k: v.to_pylist() for k, v in validate_shards([a, b]).items()} == {a: [1, 2], b: [3]}
+    with pytest.raises(MEDSValidationError, match="Subject 2 appears in multiple shards"):
+        validate_shards([a, b, c])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_validate_dataset(meds_root, workers):
+    """
+    Test that a conformant dataset validates, serially and with a process pool.
+    """
+    subject_ids = validate_dataset(meds_root, workers=workers)
+    assert sorted(os.path.relpath(p, meds_root) for p in subject_ids) == [
+        os.path.join("data", "held_out", "0.parquet"),
+        os.path.join("data", "train", "0.parquet"),
+    ]
+    assert sorted(v for ids in subject_ids.values() for v in ids.to_pylist()) == [1, 2, 3, 4]
+
+
+def test_validate_dataset_errors(meds_root):
+    """
+    Test that split subjects and malformed metadata files are detected.
+    """
+    _write_shard(os.path.join(meds_root, "data", "extra.parquet"), [(4, _t(1), "A", None)])
+    with pytest.raises(MEDSValidationError, match="Subject 4 appears in multiple shards"):
+        validate_dataset(meds_root, workers=2)
+    os.remove(os.path.join(meds_root, "data", "extra.parquet"))
+
+    with open(os.path.join(meds_root, dataset_metadata_filepath), "w") as f:
+        json.dump({"dataset_name": 1}, f)
+    with pytest.raises(MEDSValidationError, match="dataset.json"):
+        validate_dataset(meds_root)
+    os.remove(os.path.join(meds_root, dataset_metadata_filepath))
+
+    splits = pa.table({"subject_id": [1, 1], "split": ["train", "tuning"]})
+    pq.write_table(splits, os.path.join(meds_root, subject_splits_filepath))
+    with pytest.raises(MEDSValidationError, match="multiple splits"):
+        validate_dataset(meds_root)
+    os.remove(os.path.join(meds_root, subject_splits_filepath))
+
+    pq.write_table(pa.table({"code": ["A"], "description": [1]}), os.path.join(meds_root, code_metadata_filepath))
+    with pytest.raises(MEDSValidationError, match="description"):
+        validate_dataset(meds_root)
+
+
+def test_validate_shards_from_statistics(tmp_path):
+    """
+    Test that footer statistics prove sorted, disjoint shards and that inconclusive shards are decoded.
+    """
+    sorted_rows = [(1, None, "A", None), (1, _t(1), "A", None), (1, _t(2), "A", None), (2, _t(1), "A", None)]
+    a = _write_shard(tmp_path / "a.parquet", sorted_rows, row_group_size=2)
+    assert footer_subject_range(a) == (1, 2)
+
+    # Subjects are contiguous, but not sorted across row groups, so the footer is inconclusive.
+    b = _write_shard(tmp_path / "b.parquet", [(5, _t(1), "A", None), (3, _t(1), "A", None)], row_group_size=1)
+    assert footer_subject_range(b) is None
+
+    # Overlaps the range of `b` but shares no subjects with it.
+    c = _write_shard(tmp_path / "c.parquet", [(4, _t(1), "A", None)])
+
+    out = validate_shards_from_statistics([a, b, c])
+    assert out[a] is None
+    assert out[b].to_pylist() == [3, 5]
+    assert out[c].to_pylist() == [4]
+
+    d = _write_shard(tmp_path / "d.parquet", [(2, _t(3), "A", None)])
+    with pytest.raises(MEDSValidationError, match="Subject 2 appears in multiple shards"):
+        validate_shards_from_statistics([a, d])
+
+    # Subject 1 goes back in time across a row group boundary, so the shard is decoded and rejected.
+    rows = [(1, _t(2), "A", None), (1, _t(3), "A", None), (1, _t(1), "A", None)]
+    e = _write_shard(tmp_path / "e.parquet", rows, row_group_size=2)
+    assert footer_subject_range(e) is None
+    with pytest.raises(MEDSValidationError, match="not sorted"):
+        validate_shards_from_statistics([e])
+
+    # Row groups spanning several subjects are decoded, so non-contiguous subjects within one are still rejected.
+    rows = [(1, _t(1), "A", None), (1, _t(2), "A", None), (2, _t(1), "A", None), (1, _t(3), "A", None)]
+    f = _write_shard(tmp_path / "f.parquet", rows, row_group_size=4)
+    with pytest.raises(MEDSValidationError, match="not contiguous"):
+        footer_subject_range(f)
+
+    # Subject 1 is split across row groups, but the second row group does not start with it.
+    rows = [(1, _t(1), "A", None), (1, _t(2), "A", None), (2, _t(1), "A", None), (1, _t(3), "A", None)]
+    h = _write_shard(tmp_path / "h.parquet", rows, row_group_size=2)
+    assert footer_subject_range(h) is None
+    with pytest.raises(MEDSValidationError, match="not contiguous"):
+        validate_shards_from_statistics([h])
+
+    # A single-subject row group out of time order is decoded and rejected.
+    rows = [(1, _t(2), "A", None), (1, _t(1), "A", None)]
+    g = _write_shard(tmp_path / "g.parquet", rows)
+    with pytest.raises(MEDSValidationError, match="not sorted"):
+        footer_subject_range(g)
+
+
+def test_validate_dataset_use_statistics(meds_root):
+    """
+    Test that a sorted, conformant dataset validates from footers alone.
+    """
+    out = validate_dataset(meds_root, use_statistics=True, workers=2)
+    assert len(out) == 2
+    assert all(v is None for v in out.values())
@@ -0,0 +1,126 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from conftest import CODES, SHARDS
+
+from meds import MEDSDataset, build_arrow_cache, build_subject_index, code_dtype, code_metadata_schema, data_schema
+from meds.validate import validate_shard
+from meds.vocab import (
+    code_vocab_filepath,
+    code_vocab_schema,
+    code_vocabulary,
+    compile_dataset,
+    compiled_data_schema,
+    decode,
+    encode,
+    encode_codes,
+    encoded_code_dtype,
+    load_code_vocabulary,
+    read_encoded_shard,
+    write_encoded_shard,
+)
+
+
+def test_code_vocabulary(meds_root):
+    """
+    Test that the vocabulary is the sorted set of codes in the code metadata.
+    """
+    vocab = code_vocabulary(meds_root)
+    assert vocab.type == code_dtype
+    assert vocab.to_pylist() == sorted(c["code"] for c in CODES)
+
+
+def test_encode_codes(meds_root):
+    """
+    Test that plain and dictionary-encoded code arrays encode into the shared vocabulary.
+    """
+    vocab = code_vocabulary(meds_root)
+    codes = pa.array(["MEDS_BIRTH", None, "ADMISSION", "MEDS_BIRTH"])
+
+    encoded = encode_codes(codes, vocab)
+    assert encoded.type == encoded_code_dtype
+    assert encoded.dictionary.equals(vocab)
+    assert encoded.to_pylist() == codes.to_pylist()
+
+    reencoded = encode_codes(codes.dictionary_encode(), vocab)
+    assert reencoded.indices.equals(encoded.indices)
+
+    with pytest.raises(KeyError, match="UNKNOWN"):
+        encode_codes(pa.array(["ADMISSION", "UNKNOWN"]), vocab)
+
+
+def test_read_write_encoded_shard(meds_root, tmp_path):
+    """
+    Test that encoded shards round trip and remain valid MEDS data shards on disk.
+    """
+    vocab = code_vocabulary(meds_root)
+    paths = [os.path.join(meds_root, "data", *name.split(os.sep)) for name in SHARDS]
+
+    tables = [read_encoded_shard(path, vocab) for path in paths]
+    for path, table in zip(paths, tables):
+        assert table.schema.field("code").type == encoded_code_dtype
+        assert all(chunk.dictionary.equals(vocab) for chunk in table.column("code").chunks)
+        assert table.column("code").to_pylist() == pq.read_table(path).column("code").to_pylist()
+
+    out = str(tmp_path / "encoded.parquet")
+    write_encoded_shard(tables[0], out, row_group_size=2)
+    assert pq.read_schema(out).equals(data_schema())
+    validate_shard(out)
+    assert read_encoded_shard(out, vocab).equals(tables[0].combine_chunks())
+
+
+def test_encode_decode(meds_root):
+    """
+    Test that code IDs round trip through the vocabulary.
+    """
+    vocab = code_vocabulary(meds_root)
+    codes = pa.chunked_array([["ADMISSION", None], ["MEDS_DEATH"]])
+    code_ids = encode(codes, vocab)
+    assert code_ids.type == pa.int32()
+    assert code_ids.to_pylist() == [vocab.to_pylist().index("ADMISSION"), None, vocab.to_pylist().index("MEDS_DEATH")]
+    assert decode(code_ids, vocab).to_pylist() == codes.to_pylist()
+
+
+def test_compile_dataset(meds_root, tmp_path):
+    """
+    Test that a compiled dataset carries code IDs matching its persisted vocabulary.
+    """
+    build_subject_index(meds_root)
+    out = str(tmp_path / "compiled")
+    vocab = compile_dataset(meds_root, out, workers=2)
+    assert load_code_vocabulary(out).equals(vocab)
+    assert pq.read_table(os.path.join(out, code_vocab_filepath)).schema.equals(code_vocab_schema)
+
+    for name in SHARDS:
+        table = pq.read_table(os.path.join(out, "data", name))
+        assert table.schema.equals(compiled_data_schema())
+        assert decode(table.column("code_id"), vocab).to_pylist() == table.column("code").to_pylist()
+        validate_shard(os.path.join(out, "data", name))
+
+    for subject_id in [1, 2, 3, 4]:
+        compiled = MEDSDataset(out).get_subject(subject_id)
+        assert compiled.drop(["code_id"]).equals(MEDSDataset(meds_root).get_subject(subject_id))
+
+    cache_paths = build_arrow_cache(meds_root)
+    compile_dataset(meds_root)
+    assert load_code_vocabulary(meds_root).equals(vocab)
+    assert "code_id" in pq.read_schema(os.path.join(meds_root, "data", list(SHARDS)[0])).names
+    # Arrow caches of the rewritten shards, which lack the code IDs, are removed.
+    assert not any(os.path.exists(path) for path in cache_paths)
+
+
+def test_compile_dataset_keeps_code_ids(meds_root):
+    """
+    Test that recompiling after adding codes keeps existing code IDs and appends new codes at the end.
+    """
+    vocab = compile_dataset(meds_root)
+    codes = [{"code": "AAA", "description": "Sorts first", "parent_codes": []}] + CODES
+    pq.write_table(
+        pa.Table.from_pylist(codes, schema=code_metadata_schema()), os.path.join(meds_root, "metadata", "codes.parquet")
+    )
+
+    recompiled = compile_dataset(meds_root)
+    assert recompiled.to_pylist() == vocab.to_pylist() + ["AAA"]
+    assert load_code_vocabulary(meds_root).equals(recompiled)